@@ -0,0 +1,107 @@
+"""
+Latency versus size for each stego output encoder setting.
+
+Run from the Backend directory:
+    python -m Benchmarks.OutputEncoders --sizes 1920x1080,3840x2160 --repeat 3
+"""
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from Core.Output import PNG_FILTERS, encode_output, resolve_output_options
+from Routes.HandleText import LSBSteg
+
+CANDIDATES = [
+    {"output_format": "png"},
+    {"output_format": "png", "png_compression": 0},
+    {"output_format": "png", "png_compression": 1},
+    {"output_format": "png", "png_compression": 1, "png_strategy": "huffman"},
+    {"output_format": "png", "png_compression": 3},
+    {"output_format": "png", "png_compression": 6},
+    {"output_format": "png", "png_compression": 9},
+    {"output_format": "png", "png_compression": 6, "png_strategy": "filtered"},
+    {"output_format": "png", "png_compression": 6, "png_strategy": "rle"},
+    {"output_format": "webp"},
+    {"output_format": "tiff"},
+    {"output_format": "bmp"},
+]
+
+if PNG_FILTERS:
+    CANDIDATES += [
+        {"output_format": "png", "png_compression": 1, "png_filter": "none"},
+        {"output_format": "png", "png_compression": 1, "png_filter": "sub"},
+        {"output_format": "png", "png_compression": 1, "png_filter": "paeth"},
+    ]
+
+
+def synthetic_carrier(width, height, fill=0.3, seed=0):
+    """
+    Photo-like carrier (gradients, shapes, mild noise) with a random
+    payload embedded in `fill` of its bit-0 capacity.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.empty((height, width, 3), dtype=np.float32)
+    img[..., 0] = 255 * x / width
+    img[..., 1] = 255 * y / height
+    img[..., 2] = 127 + 100 * np.sin(x / 97.0) * np.cos(y / 61.0)
+    for _ in range(12):
+        cx, cy, r = rng.integers(0, width), rng.integers(0, height), rng.integers(20, max(21, width // 6))
+        mask = (x - cx) ** 2 + (y - cy) ** 2 < r ** 2
+        img[mask] = rng.integers(0, 256, 3)
+    img += rng.normal(0, 3, img.shape)
+    carrier = np.clip(img, 0, 255).astype(np.uint8)
+
+    payload = rng.integers(0, 256, int(carrier.size * fill) // 8, dtype=np.uint8).tobytes()
+    return LSBSteg(carrier).encode_binary(payload)
+
+
+def run(sizes, repeat):
+    results = []
+    for width, height in sizes:
+        img = synthetic_carrier(width, height)
+        raw = img.nbytes
+        for candidate in CANDIDATES:
+            options = resolve_output_options(**candidate)
+            timings = []
+            encoded = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                encoded = encode_output(img, options)
+                timings.append(time.perf_counter() - start)
+            if encoded is None:
+                continue
+            results.append({
+                "size": f"{width}x{height}",
+                "options": candidate,
+                "latency_ms": round(statistics.median(timings) * 1000, 2),
+                "bytes": len(encoded),
+                "ratio": round(len(encoded) / raw, 3),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1920x1080,3840x2160", help="Comma separated WIDTHxHEIGHT list")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes.split(",")]
+    results = run(sizes, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'size':>10}  {'latency ms':>10}  {'MB':>7}  {'ratio':>5}  options")
+    for row in results:
+        print(f"{row['size']:>10}  {row['latency_ms']:>10}  {row['bytes'] / 1e6:>7.2f}  {row['ratio']:>5}  {row['options']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Stage timings and in-process load tests for both LSB engines and the
+/text and /image routes. Results are JSON so runs can be diffed.
+
+Run from the Backend directory:
+    python -m Benchmarks.Suite --megapixels 0.3,2,8 --out results.json
+    python -m Benchmarks.Suite --megapixels 0.3,2,8,24,50 --concurrency 1,4,16,64
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+# Every request should do the work; set STEG_CACHE_ENABLED=1 to measure hits
+os.environ.setdefault("STEG_CACHE_ENABLED", "0")
+
+import cv2
+import httpx
+import numpy as np
+
+from Benchmarks.OutputEncoders import synthetic_carrier
+from Core.Output import DEFAULT_OPTIONS, encode_output
+from Routes import HandleImage, HandleText
+
+KB = 1024
+MB = 1024 * KB
+
+DEFAULT_MEGAPIXELS = "0.3,2,8,24,50"
+DEFAULT_PAYLOADS = "1k,64k,1m,full"
+DEFAULT_CONCURRENCY = "1,4,16"
+
+ENGINES = {
+    # name: (engine class, capacity in bytes for a w x h x c carrier)
+    "text": (HandleText.LSBSteg, HandleText.LSBSteg.capacity),
+    "image": (HandleImage.LSBSteg, HandleImage.LSBSteg.capacity),
+}
+
+
+def dimensions(megapixels):
+    # 4:3 frame with roughly the requested pixel count
+    height = max(1, int(round((megapixels * 1e6 * 3 / 4) ** 0.5)))
+    return int(round(height * 4 / 3)), height
+
+
+def parse_size(value, capacity):
+    value = value.strip().lower()
+    if value == "full":
+        return capacity
+    units = {"k": KB, "m": MB}
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def timed(fn, repeat):
+    """
+    Median, min and max wall time of `repeat` calls, in ms, plus the
+    last result.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }, result
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cache_enabled": os.environ.get("STEG_CACHE_ENABLED") != "0",
+    }
+
+
+def bench_stages(megapixels, payloads, repeat):
+    """
+    imdecode, embed, extract and imencode for each engine, carrier size
+    and payload size, measured separately.
+    """
+    results = []
+    rng = np.random.default_rng(0)
+    for mp in megapixels:
+        width, height = dimensions(mp)
+        carrier = synthetic_carrier(width, height, fill=0.0)
+        carrier_png = cv2.imencode(".png", carrier)[1]
+
+        decode_stats, _ = timed(lambda: cv2.imdecode(carrier_png, cv2.IMREAD_COLOR), repeat)
+        encode_stats, _ = timed(lambda: encode_output(carrier, DEFAULT_OPTIONS), repeat)
+        results.append({
+            "megapixels": mp,
+            "size": f"{width}x{height}",
+            "stage": "imdecode",
+            "input_bytes": len(carrier_png),
+            **decode_stats,
+        })
+        results.append({
+            "megapixels": mp,
+            "size": f"{width}x{height}",
+            "stage": "imencode",
+            "format": DEFAULT_OPTIONS.format,
+            **encode_stats,
+        })
+
+        for engine, (steg_class, capacity_of) in ENGINES.items():
+            capacity = capacity_of(width, height, 3)
+            for spec in payloads:
+                size = min(parse_size(spec, capacity), capacity)
+                payload = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+
+                work = carrier.copy()
+                embed_stats, _ = timed(lambda: steg_class(work).encode_binary(payload), repeat)
+                extract_stats, extracted = timed(lambda: steg_class(work).decode_binary(), repeat)
+                if extracted != payload:
+                    raise AssertionError(f"{engine} engine round trip failed at {width}x{height}, {size} bytes")
+
+                row = {"megapixels": mp, "size": f"{width}x{height}", "engine": engine, "payload": spec, "payload_bytes": size}
+                results.append({**row, "stage": "embed", **embed_stats})
+                results.append({**row, "stage": "extract", **extract_stats})
+    return results
+
+
+def app_client():
+    from main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+def route_cases(width, height, payload_size):
+    """
+    One request per route, as (name, method path, files, direct job call).
+    """
+    rng = np.random.default_rng(1)
+    carrier_png = cv2.imencode(".png", synthetic_carrier(width, height, fill=0.0))[1].tobytes()
+    text_capacity = ENGINES["text"][1](width, height, 3)
+    payload = rng.integers(0, 256, min(payload_size, text_capacity), dtype=np.uint8).tobytes()
+    # Jobs hand back the encoder's buffer; the HTTP client wants bytes
+    stego_text = bytes(HandleText.encode_job(carrier_png, payload, DEFAULT_OPTIONS))
+
+    # Largest square noise secret whose PNG fits the image route
+    image_capacity = ENGINES["image"][1](width, height, 3)
+    side = max(1, int((min(payload_size, image_capacity) / 3) ** 0.5))
+    while True:
+        secret_png = cv2.imencode(".png", rng.integers(0, 256, (side, side, 3), dtype=np.uint8))[1].tobytes()
+        if len(secret_png) <= image_capacity or side == 1:
+            break
+        side = int(side * 0.9)
+    stego_image = bytes(HandleImage.encode_job(carrier_png, secret_png, DEFAULT_OPTIONS)[0])
+
+    return [
+        ("text/encode", "/text/encode",
+         {"carrier_image": ("c.png", carrier_png), "secret_file": ("s.bin", payload)},
+         lambda: HandleText.encode_job(carrier_png, payload, DEFAULT_OPTIONS)),
+        ("text/decode", "/text/decode",
+         {"steg_image": ("s.png", stego_text)},
+         lambda: HandleText.decode_job(stego_text)),
+        ("image/encode-image", "/image/encode-image",
+         {"carrier_image": ("c.png", carrier_png), "secret_image": ("s.png", secret_png)},
+         lambda: HandleImage.encode_job(carrier_png, secret_png, DEFAULT_OPTIONS)),
+        ("image/decode-image", "/image/decode-image",
+         {"steg_image": ("s.png", stego_image)},
+         lambda: HandleImage.decode_job(stego_image, "png")),
+    ]
+
+
+async def bench_http(client, megapixels, payload_size, repeat):
+    """
+    Route latency against calling the job directly; the difference is
+    multipart parsing, pool hand-off and response streaming.
+    """
+    results = []
+    for mp in megapixels:
+        width, height = dimensions(mp)
+        for name, path, files, job in route_cases(width, height, payload_size):
+            job_stats, _ = timed(job, repeat)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = await client.post(path, files=files)
+                timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise AssertionError(f"{path} returned {response.status_code}: {response.text[:200]}")
+            http_ms = statistics.median(timings)
+            results.append({
+                "megapixels": mp,
+                "size": f"{width}x{height}",
+                "route": name,
+                "http_median_ms": round(http_ms, 3),
+                "job_median_ms": job_stats["median_ms"],
+                "overhead_ms": round(http_ms - job_stats["median_ms"], 3),
+            })
+    return results
+
+
+async def load_test(client, path, files, concurrency, requests):
+    latencies = []
+    statuses = {}
+    pending = iter(range(requests))
+
+    async def worker():
+        for _ in pending:
+            start = time.perf_counter()
+            response = await client.post(path, files=files)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(max(latencies), 3),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+async def bench_load(client, megapixels, payload_size, concurrency, requests):
+    results = []
+    width, height = dimensions(megapixels)
+    for name, path, files, _ in route_cases(width, height, payload_size):
+        for level in concurrency:
+            result = await load_test(client, path, files, level, max(requests, level))
+            results.append({"route": name, "size": f"{width}x{height}", "megapixels": megapixels, **result})
+    return results
+
+
+async def run_async(args):
+    megapixels = [float(v) for v in args.megapixels.split(",")]
+    payloads = args.payloads.split(",")
+    concurrency = [int(v) for v in args.concurrency.split(",")]
+    payload_size = parse_size(args.http_payload, 1 << 62)
+
+    report = {"environment": environment()}
+    if "stages" in args.only:
+        report["stages"] = bench_stages(megapixels, payloads, args.repeat)
+    async with app_client() as client:
+        if "http" in args.only:
+            report["http"] = await bench_http(client, megapixels, payload_size, args.repeat)
+        if "load" in args.only:
+            report["load"] = await bench_load(client, args.load_megapixels, payload_size, concurrency, args.requests)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", default=DEFAULT_MEGAPIXELS, help="Comma separated carrier sizes in MP")
+    parser.add_argument("--payloads", default=DEFAULT_PAYLOADS, help="Comma separated payload sizes (1k, 2m, full)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--http-payload", default="64k", help="Payload size for the HTTP and load tests")
+    parser.add_argument("--load-megapixels", type=float, default=2.0, help="Carrier size for the load tests")
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per route and concurrency level")
+    parser.add_argument("--only", default="stages,http,load", help="Subset of stages,http,load to run")
+    parser.add_argument("--out", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_async(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
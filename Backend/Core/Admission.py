@@ -0,0 +1,294 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+
+from fastapi import HTTPException, Request
+from starlette.datastructures import UploadFile
+
+from Core.CarrierStore import carrier_store
+from Core.ImageHeader import read_header
+
+MP = 1_000_000
+
+# Bytes of each upload read to find its dimensions before the full decode
+HEADER_PEEK_BYTES = 64 * 1024
+
+# Cost of uploads whose header can't be read (other formats, non-image
+# secrets): roughly what embedding or decoding that many bytes touches
+PIXELS_PER_BYTE = 3
+
+RETRY_AFTER_MAX = 60
+
+
+def busy(status_code, detail, retry_after):
+    return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+async def upload_cost(upload):
+    """
+    Pixels an upload will cost: width x height from its header, or an
+    estimate from its size. UploadFile's async methods read spooled-to-disk
+    uploads in the threadpool, off the event loop.
+    """
+    await upload.seek(0)
+    head = await upload.read(HEADER_PEEK_BYTES)
+    await upload.seek(0)
+    info = read_header(head) if head else None
+    if info is not None:
+        return info.width * info.height
+    size = upload.size if upload.size is not None else len(head)
+    return size * PIXELS_PER_BYTE
+
+
+async def request_cost(form):
+    cost = 0
+    for name, value in form.multi_items():
+        if isinstance(value, UploadFile):
+            cost += await upload_cost(value)
+        elif name == "carrier_id" and value:
+            entry = carrier_store.get(value, touch=False)
+            if entry is not None:
+                cost += entry.image.shape[0] * entry.image.shape[1]
+    return cost
+
+
+class Ticket:
+    __slots__ = ("client", "cost", "tag", "future", "started")
+
+    def __init__(self, client, cost, tag, future):
+        self.client = client
+        self.cost = cost
+        self.tag = tag
+        self.future = future
+        self.started = None
+
+
+class Admission:
+    """
+    Pixel budget for /text and /image work. Each request costs the pixels
+    of the images it uploads, read from their headers before any decode.
+    Requests run while the pixels in flight fit `max_pixels`; the rest
+    wait, ordered by a fair-queuing tag (a client's previous tag plus the
+    request's cost), so small requests pass large ones and no client can
+    crowd out the others. A client may hold at most `client_share` of the
+    budget. A request bigger than the whole budget runs on its own.
+
+    Requests that would wait too long, or queues that are full, are
+    turned away with 503/429 and a Retry-After from the recent pixel rate.
+    """
+
+    def __init__(self, max_pixels, client_share=0.5, max_waiting=256, client_waiting=32, max_wait=30.0,
+                 client_header=None):
+        self.max_pixels = max_pixels
+        self.client_pixels_limit = max(1, int(max_pixels * client_share))
+        self.max_waiting = max_waiting
+        self.client_waiting = client_waiting
+        self.max_wait = max_wait
+        self.client_header = client_header.lower() if client_header else None
+
+        # Only touched from the event loop thread
+        self.in_flight_pixels = 0
+        self.in_flight = 0
+        self.client_pixels = {}
+        self.client_queued = {}
+        self.client_tags = {}
+        self.virtual_time = 0.0
+        self.waiting = []
+        self.waiting_pixels = 0
+        self.order = itertools.count()
+        # Pixels per second finished, smoothed; None until the first finish
+        self.rate = None
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_busy = 0
+        self.rejected_client = 0
+        self.timed_out = 0
+
+    @classmethod
+    def from_env(cls):
+        if os.environ.get("STEG_ADMISSION_ENABLED", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            max_pixels=int(float(os.environ.get("STEG_ADMISSION_MAX_MP", "200")) * MP),
+            client_share=float(os.environ.get("STEG_ADMISSION_CLIENT_SHARE", "0.5")),
+            max_waiting=int(os.environ.get("STEG_ADMISSION_MAX_WAITING", "256")),
+            client_waiting=int(os.environ.get("STEG_ADMISSION_CLIENT_WAITING", "32")),
+            max_wait=float(os.environ.get("STEG_ADMISSION_MAX_WAIT", "30")),
+            client_header=os.environ.get("STEG_ADMISSION_CLIENT_HEADER"),
+        )
+
+    def client_of(self, request):
+        if self.client_header:
+            value = request.headers.get(self.client_header)
+            if value:
+                return value
+        return request.client.host if request.client else "unknown"
+
+    def retry_after(self, extra=0):
+        if not self.rate:
+            return 1
+        backlog = self.in_flight_pixels + self.waiting_pixels + extra
+        return max(1, min(RETRY_AFTER_MAX, math.ceil(backlog / self.rate)))
+
+    def fits(self, ticket):
+        if self.in_flight == 0:
+            return True
+        if self.in_flight_pixels + ticket.cost > self.max_pixels:
+            return False
+        held = self.client_pixels.get(ticket.client, 0)
+        return held == 0 or held + ticket.cost <= self.client_pixels_limit
+
+    def start(self, ticket):
+        ticket.started = time.perf_counter()
+        self.in_flight += 1
+        self.in_flight_pixels += ticket.cost
+        self.client_pixels[ticket.client] = self.client_pixels.get(ticket.client, 0) + ticket.cost
+        self.virtual_time = max(self.virtual_time, ticket.tag - ticket.cost)
+        self.admitted += 1
+
+    def dispatch(self):
+        """
+        Start waiting requests in tag order while they fit. A request held
+        back only by its client's share lets others pass; one that doesn't
+        fit the global budget stops the scan, so big requests can't be
+        overtaken forever.
+        """
+        skipped = []
+        while self.waiting:
+            tag, order, ticket = self.waiting[0]
+            if ticket.future.done():
+                heapq.heappop(self.waiting)
+                continue
+            if self.in_flight and self.in_flight_pixels + ticket.cost > self.max_pixels:
+                break
+            heapq.heappop(self.waiting)
+            if not self.fits(ticket):
+                skipped.append((tag, order, ticket))
+                continue
+            self.unqueue(ticket)
+            self.start(ticket)
+            ticket.future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self.waiting, entry)
+
+    def unqueue(self, ticket):
+        self.waiting_pixels -= ticket.cost
+        self.client_queued[ticket.client] -= 1
+        if not self.client_queued[ticket.client]:
+            del self.client_queued[ticket.client]
+
+    async def acquire(self, client, cost):
+        cost = max(1, min(cost, self.max_pixels))
+        tag = max(self.virtual_time, self.client_tags.get(client, 0.0)) + cost
+        ticket = Ticket(client, cost, tag, None)
+
+        if not self.waiting and self.fits(ticket):
+            self.client_tags[client] = tag
+            self.start(ticket)
+            return ticket
+
+        if len(self.waiting) >= self.max_waiting:
+            self.rejected_busy += 1
+            raise busy(503, "Server busy, too many image requests queued. Retry shortly", self.retry_after(cost))
+        if self.client_queued.get(client, 0) >= self.client_waiting:
+            self.rejected_client += 1
+            raise busy(429, f"Too many queued requests from this client (limit {self.client_waiting})",
+                       self.retry_after(cost))
+        if self.rate and (self.in_flight_pixels + self.waiting_pixels) / self.rate > self.max_wait:
+            self.rejected_busy += 1
+            raise busy(503, "Server busy, queued image work exceeds the wait limit. Retry later",
+                       self.retry_after(cost))
+
+        self.client_tags[client] = tag
+        ticket.future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (tag, next(self.order), ticket))
+        self.waiting_pixels += cost
+        self.client_queued[client] = self.client_queued.get(client, 0) + 1
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.started is not None:
+                # Started just as we gave up: hand the slot straight back
+                self.release(ticket)
+            elif not ticket.future.done():
+                ticket.future.cancel()
+                self.unqueue(ticket)
+                self.dispatch()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            raise busy(503, f"Waited {self.max_wait:g}s for capacity. Retry later", self.retry_after())
+        return ticket
+
+    def release(self, ticket):
+        self.in_flight -= 1
+        self.in_flight_pixels -= ticket.cost
+        held = self.client_pixels[ticket.client] - ticket.cost
+        if held:
+            self.client_pixels[ticket.client] = held
+        else:
+            del self.client_pixels[ticket.client]
+
+        elapsed = time.perf_counter() - ticket.started
+        if elapsed > 0:
+            rate = ticket.cost / elapsed
+            # Several requests share the cores, so each one's rate
+            # understates the total; scale by how many ran alongside
+            rate *= self.in_flight + 1
+            self.rate = rate if self.rate is None else 0.8 * self.rate + 0.2 * rate
+        if not self.in_flight:
+            # Idle: old tags say nothing about fairness any more
+            self.client_tags.clear()
+            self.virtual_time = 0.0
+        self.dispatch()
+
+    def stats(self):
+        return {
+            "max_pixels": self.max_pixels,
+            "client_pixels_limit": self.client_pixels_limit,
+            "in_flight": self.in_flight,
+            "in_flight_pixels": self.in_flight_pixels,
+            "waiting": len(self.waiting),
+            "waiting_pixels": self.waiting_pixels,
+            "clients": len(self.client_pixels),
+            "pixels_per_second": round(self.rate) if self.rate else 0,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_busy": self.rejected_busy,
+            "rejected_client": self.rejected_client,
+            "timed_out": self.timed_out,
+        }
+
+
+admission = Admission.from_env()
+
+
+def admission_stats():
+    return admission.stats() if admission is not None else {"enabled": False}
+
+
+async def admitted(request: Request):
+    """
+    Router dependency. Runs once the multipart body is parsed, prices
+    the request from its uploads' headers and waits for room in the
+    pixel budget; the room is held for the rest of the request.
+    """
+    if admission is None or request.method != "POST":
+        yield
+        return
+
+    cost = await request_cost(await request.form())
+    if cost == 0:
+        yield
+        return
+
+    ticket = await admission.acquire(admission.client_of(request), cost)
+    try:
+        yield
+    finally:
+        admission.release(ticket)
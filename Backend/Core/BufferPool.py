@@ -0,0 +1,153 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+MB = 1024 * 1024
+
+
+def size_class(nbytes, min_bytes):
+    """
+    Smallest pooled size that holds `nbytes`: four classes per doubling,
+    so a buffer is at most 25% bigger than asked for.
+    """
+    if nbytes <= min_bytes:
+        return min_bytes
+    step = 1 << max(0, nbytes.bit_length() - 3)
+    return -(-nbytes // step) * step
+
+
+def owner_of(array):
+    # The array that owns the memory; views of views point straight at it
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+class BufferPool:
+    """
+    Scratch buffers for the embed path (decoded carriers, copied pixel
+    rows, unpacked bit chunks), reused across requests instead of
+    allocated and dropped by each one. Buffers come in size classes; a
+    released buffer waits in its class for the next request of that size.
+
+    The pool owns at most `max_bytes`, lent out or idle. A miss evicts
+    idle buffers of other classes to make room; past the cap, requests
+    get plain arrays that are freed as usual. Requests under `min_bytes`
+    always get plain arrays: malloc serves those well enough.
+    """
+
+    def __init__(self, max_bytes, min_bytes=64 * 1024):
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.lent = {}
+        self.idle_bytes = 0
+        self.lent_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.overflows = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls):
+        if os.environ.get("STEG_BUFFER_POOL_ENABLED", "1").lower() in ("0", "false", "no"):
+            return cls(0)
+        return cls(
+            max_bytes=int(float(os.environ.get("STEG_BUFFER_POOL_MB", "256")) * MB),
+            min_bytes=int(float(os.environ.get("STEG_BUFFER_POOL_MIN_KB", "64")) * 1024),
+        )
+
+    def evict(self, nbytes):
+        # Free idle buffers, biggest classes first, until nbytes more fit
+        for size in sorted(self.idle, reverse=True):
+            buffers = self.idle[size]
+            while buffers and self.idle_bytes + self.lent_bytes + nbytes > self.max_bytes:
+                buffers.pop()
+                self.idle_bytes -= size
+                self.evictions += 1
+            if not buffers:
+                del self.idle[size]
+
+    def acquire(self, shape, dtype=np.uint8):
+        """
+        An uninitialised array of `shape`, pooled when it is big enough.
+        Give it back with release() once nothing refers to it.
+        """
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        nbytes = count * dtype.itemsize
+        if nbytes < self.min_bytes:
+            return np.empty(shape, dtype=dtype)
+
+        size = size_class(nbytes, self.min_bytes)
+        with self.lock:
+            buffers = self.idle.get(size)
+            if buffers:
+                buffer = buffers.pop()
+                self.idle_bytes -= size
+                self.hits += 1
+            else:
+                if self.idle_bytes + self.lent_bytes + size > self.max_bytes:
+                    self.evict(size)
+                if self.idle_bytes + self.lent_bytes + size > self.max_bytes:
+                    self.overflows += 1
+                    return np.empty(shape, dtype=dtype)
+                buffer = None
+                self.misses += 1
+            self.lent_bytes += size
+        if buffer is None:
+            buffer = np.empty(size, dtype=np.uint8)
+        with self.lock:
+            self.lent[id(buffer)] = buffer
+        return buffer[:nbytes].view(dtype).reshape(shape)
+
+    def release(self, array):
+        # Arrays the pool didn't lend (small ones, overflows) are left alone
+        owner = owner_of(array)
+        with self.lock:
+            if self.lent.pop(id(owner), None) is None:
+                return
+            self.lent_bytes -= owner.nbytes
+            self.idle.setdefault(owner.nbytes, []).append(owner)
+            self.idle_bytes += owner.nbytes
+
+    @contextmanager
+    def borrow(self, shape, dtype=np.uint8):
+        array = self.acquire(shape, dtype)
+        try:
+            yield array
+        finally:
+            self.release(array)
+
+    @contextmanager
+    def copy(self, array):
+        """
+        A pooled, contiguous copy of `array` for the length of the block.
+        """
+        with self.borrow(array.shape, array.dtype) as out:
+            np.copyto(out, array)
+            yield out
+
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": self.max_bytes > 0,
+                "limit_bytes": self.max_bytes,
+                "min_bytes": self.min_bytes,
+                "idle_bytes": self.idle_bytes,
+                "lent_bytes": self.lent_bytes,
+                "idle_buffers": sum(len(buffers) for buffers in self.idle.values()),
+                "lent_buffers": len(self.lent),
+                "idle_classes": len(self.idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "overflows": self.overflows,
+                "evictions": self.evictions,
+            }
+
+
+buffer_pool = BufferPool.from_env()
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from fastapi import HTTPException
+
+from Core.BufferPool import buffer_pool
+from Core.Metrics import stage
+from Core.RowReader import bmp_pixels
+from Core.Steg import IMAGE_BACKEND, TEXT_BACKEND, get_backend
+from Core.Uploads import read_upload
+
+MB = 1024 * 1024
+
+# Either the uploaded bytes (data) or a cached decoded carrier (image)
+CarrierSource = namedtuple("CarrierSource", ["data", "image", "filename", "cache_part"])
+
+
+def carrier_id_for(carrier_bytes):
+    # Content addressed, so re-uploading the same file reuses the entry
+    return hashlib.blake2b(carrier_bytes, digest_size=16).hexdigest()
+
+
+class CarrierEntry:
+    def __init__(self, carrier_id, image, filename):
+        # Shared between requests, so nobody may write to it
+        image.flags.writeable = False
+        self.carrier_id = carrier_id
+        self.image = image
+        self.filename = filename
+        self.created = time.time()
+        self.last_used = self.created
+        self.uses = 0
+
+    def info(self):
+        height, width, channels = self.image.shape
+        return {
+            "carrier_id": self.carrier_id,
+            "filename": self.filename,
+            "dimensions": f"{width}x{height}",
+            "channels": channels,
+            "decoded_bytes": self.image.nbytes,
+            "image_capacity_bytes": get_backend(IMAGE_BACKEND).capacity(width, height, channels),
+            "text_capacity_bytes": get_backend(TEXT_BACKEND).capacity(width, height, channels),
+            "uses": self.uses,
+            "idle_seconds": round(time.time() - self.last_used, 1)
+        }
+
+
+class CarrierStore:
+    """
+    Decoded carriers kept in memory as read-only ndarrays. Entries are
+    evicted least recently used first once the decoded bytes exceed the
+    budget, and after `ttl` seconds without use.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_bytes=int(float(os.environ.get("STEG_CARRIER_CACHE_MB", "1024")) * MB),
+            ttl=float(os.environ.get("STEG_CARRIER_TTL", "3600")),
+        )
+
+    def _expire(self):
+        if self.ttl <= 0:
+            return
+        cutoff = time.time() - self.ttl
+        for carrier_id in [k for k, e in self.entries.items() if e.last_used < cutoff]:
+            self.used -= self.entries.pop(carrier_id).image.nbytes
+            self.expirations += 1
+
+    def add(self, carrier_id, image, filename):
+        if image.nbytes > self.max_bytes:
+            raise ValueError(
+                f"Decoded carrier is {image.nbytes} bytes, over the {self.max_bytes} byte carrier cache limit"
+            )
+        with self.lock:
+            self._expire()
+            if carrier_id in self.entries:
+                self.used -= self.entries.pop(carrier_id).image.nbytes
+            entry = CarrierEntry(carrier_id, image, filename)
+            self.entries[carrier_id] = entry
+            self.used += image.nbytes
+            while self.used > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.used -= old.image.nbytes
+                self.evictions += 1
+            return entry
+
+    def get(self, carrier_id, touch=True):
+        with self.lock:
+            self._expire()
+            entry = self.entries.get(carrier_id)
+            if entry is None:
+                self.misses += touch
+                return None
+            if touch:
+                self.entries.move_to_end(carrier_id)
+                entry.last_used = time.time()
+                entry.uses += 1
+                self.hits += 1
+            return entry
+
+    def remove(self, carrier_id):
+        with self.lock:
+            entry = self.entries.pop(carrier_id, None)
+            if entry is not None:
+                self.used -= entry.image.nbytes
+            return entry is not None
+
+    def list(self):
+        with self.lock:
+            self._expire()
+            return [entry.info() for entry in self.entries.values()]
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "decoded_bytes": self.used,
+            "limit_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+@contextmanager
+def copy_on_write_prefix(image, nbits):
+    """
+    Private copy of just the rows that hold the first `nbits` channel
+    values, in a pooled buffer for the length of the block. Yields
+    (prefix, rows); the remaining rows stay shared.
+    """
+    height, width, channels = image.shape
+    rows = min(height, -(-nbits // (width * channels)))
+    with buffer_pool.copy(image[:rows]) as prefix:
+        yield prefix, rows
+
+
+@contextmanager
+def decoded_carrier(carrier_bytes):
+    """
+    An uploaded carrier decoded as cv2.IMREAD_COLOR would, for the length
+    of the block; None when it isn't an image. Uncompressed BMP pixels
+    are copied into a pooled buffer. cv2.imdecode can't decode into a
+    given buffer, so other formats get OpenCV's own allocation.
+    """
+    pixels = bmp_pixels(carrier_bytes)
+    if pixels is None:
+        with stage("imdecode"):
+            image = cv2.imdecode(np.frombuffer(carrier_bytes, np.uint8), cv2.IMREAD_COLOR)
+        yield image
+        return
+
+    image = buffer_pool.acquire(pixels.shape)
+    try:
+        with stage("imdecode"):
+            np.copyto(image, pixels)
+        yield image
+    finally:
+        buffer_pool.release(image)
+
+
+carrier_store = CarrierStore.from_env()
+
+
+async def resolve_carrier(carrier_image, carrier_id):
+    """
+    Carrier for an encode request: the cached decoded image when
+    carrier_id is given, otherwise the uploaded file.
+    """
+    if carrier_id:
+        entry = carrier_store.get(carrier_id)
+        if entry is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Unknown or expired carrier_id. Upload the carrier to /carriers again"
+            )
+        return CarrierSource(None, entry.image, entry.filename, ("carrier", carrier_id))
+
+    if carrier_image is None:
+        raise HTTPException(status_code=400, detail="Provide either carrier_image or carrier_id")
+
+    data = await read_upload(carrier_image)
+    return CarrierSource(data, None, carrier_image.filename, data)
@@ -0,0 +1,193 @@
+import lzma
+import os
+import struct
+import time
+import zlib
+
+import cv2
+from fastapi import HTTPException
+
+from Core.Memory import track
+from Core.WorkerPool import JobError
+
+MB = 1024 * 1024
+
+# Packed payloads start with this header, right after the 64-bit length
+# prefix: magic, header version, codec id, unpacked length. Payloads
+# without it are raw bytes, as written before compression existed.
+MAGIC = b"SGZ\x00"
+VERSION = 1
+HEADER = struct.Struct(">4sBBQ")
+
+CODEC_NONE = 0
+CODECS = {
+    # name: (id, compress, decompressor factory)
+    "zlib": (1, lambda data: zlib.compress(data, 6), zlib.decompressobj),
+    "lzma": (2, lambda data: lzma.compress(data, preset=6), lzma.LZMADecompressor),
+}
+CODEC_NAMES = {codec_id: name for name, (codec_id, _, _) in CODECS.items()}
+CODEC_NAMES[CODEC_NONE] = "none"
+
+COMPRESSION_MODES = ("none", "auto", *CODECS)
+
+# "none" keeps results readable by decoders that predate the header,
+# such as the web client's in-browser one
+DEFAULT_COMPRESSION = os.environ.get("STEG_COMPRESSION", "none").lower()
+
+# Time auto mode may spend compressing, projected from a sample
+BUDGET_SECONDS = float(os.environ.get("STEG_COMPRESSION_BUDGET_MS", "500")) / 1000
+SAMPLE_CHUNKS = 4
+SAMPLE_CHUNK_BYTES = 16 * 1024
+# Below this the header costs more than compression could save
+MIN_COMPRESS_BYTES = 256
+# Auto mode only compresses when the sample shrinks at least this much
+MIN_SAVING = 0.05
+
+# Refuse headers claiming more than this, so a forged length can't make
+# the decoder allocate without bound
+MAX_UNPACKED_BYTES = int(float(os.environ.get("STEG_MAX_UNPACKED_MB", "1024")) * MB)
+
+# PNG settings tried for image secrets, cheapest first; None is OpenCV's
+# default (level 1, RLE)
+SECRET_PNG_LEVELS = (None, 6, 9)
+SECRET_PNG_SAMPLE_ROWS = 64
+
+
+def resolve_compression(compression=None):
+    mode = (compression or DEFAULT_COMPRESSION).lower()
+    if mode not in COMPRESSION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported compression. Use one of: {', '.join(COMPRESSION_MODES)}")
+    return mode
+
+
+def sample(data):
+    # A few chunks spread across the payload, so a compressible header
+    # on an otherwise random file doesn't fool the estimate
+    if len(data) <= SAMPLE_CHUNKS * SAMPLE_CHUNK_BYTES:
+        return bytes(data)
+    step = (len(data) - SAMPLE_CHUNK_BYTES) // (SAMPLE_CHUNKS - 1)
+    return b"".join(data[i * step:i * step + SAMPLE_CHUNK_BYTES] for i in range(SAMPLE_CHUNKS))
+
+
+def choose_codec(data):
+    """
+    The codec with the smallest projected output whose projected time
+    fits the budget, or None when nothing is worth it.
+    """
+    if len(data) < MIN_COMPRESS_BYTES:
+        return None
+    probe = sample(data)
+    scale = len(data) / len(probe)
+    best, best_ratio = None, 1 - MIN_SAVING
+    for name, (_, compress, _) in CODECS.items():
+        start = time.perf_counter()
+        ratio = len(compress(probe)) / len(probe)
+        if (time.perf_counter() - start) * scale > BUDGET_SECONDS:
+            continue
+        if ratio < best_ratio:
+            best, best_ratio = name, ratio
+    return best
+
+
+def pack(data, mode):
+    """
+    The bytes to embed for `data` under compression `mode`. Returns
+    (payload, codec name). With "none" the payload is `data` itself.
+    """
+    codec = choose_codec(data) if mode == "auto" else (None if mode == "none" else mode)
+    if codec is not None:
+        codec_id, compress, _ = CODECS[codec]
+        compressed = compress(data)
+        if HEADER.size + len(compressed) < len(data):
+            track(len(compressed))
+            return HEADER.pack(MAGIC, VERSION, codec_id, len(data)) + compressed, codec
+
+    if bytes(data[:len(MAGIC)]) == MAGIC:
+        # Raw data that happens to start like a header gets one, so
+        # unpack() can't misread it
+        return HEADER.pack(MAGIC, VERSION, CODEC_NONE, len(data)) + bytes(data), "none"
+    return data, "none"
+
+
+def unpack(payload):
+    """
+    Reverse pack(): raw payloads come back unchanged, packed ones are
+    checked and decompressed.
+    """
+    if len(payload) < HEADER.size or bytes(payload[:len(MAGIC)]) != MAGIC:
+        return payload
+
+    _, version, codec_id, size = HEADER.unpack_from(payload)
+    if version != VERSION or codec_id not in CODEC_NAMES:
+        raise JobError(400, f"Hidden data uses an unsupported header (version {version}, codec {codec_id})")
+    body = payload[HEADER.size:]
+    if codec_id == CODEC_NONE:
+        return bytes(body)
+    if size > MAX_UNPACKED_BYTES:
+        raise JobError(400, f"Hidden data claims {size} bytes unpacked, over the {MAX_UNPACKED_BYTES} byte limit")
+    if not size:
+        # pack() never compresses empty data, and a max_length of 0 would
+        # let the decompressor inflate without bound
+        raise JobError(400, "Hidden data is corrupted: compressed payload claims 0 bytes unpacked")
+
+    decompressor = CODECS[CODEC_NAMES[codec_id]][2]()
+    try:
+        # One byte past the header's size is enough to catch an overrun
+        data = decompressor.decompress(body, size + 1)
+    except (zlib.error, lzma.LZMAError) as e:
+        raise JobError(400, f"Hidden data is corrupted: {e}")
+    if len(data) != size or not decompressor.eof:
+        raise JobError(400, "Hidden data is corrupted: unpacked size doesn't match its header")
+    track(size)
+    return data
+
+
+def secret_png_params(level):
+    if level is None:
+        return []
+    # Default strategy; OpenCV's RLE only pays off at level 1
+    return [cv2.IMWRITE_PNG_COMPRESSION, level, cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_DEFAULT]
+
+
+def choose_secret_png_level(secret_img, mode):
+    """
+    PNG level for an image secret. Without compression it is OpenCV's
+    default; otherwise the strongest level whose time, projected from a
+    band of rows, fits the budget.
+    """
+    if mode == "none":
+        return None
+    band = secret_img[:SECRET_PNG_SAMPLE_ROWS]
+    scale = len(secret_img) / len(band)
+    best, best_size = None, None
+    for level in SECRET_PNG_LEVELS:
+        start = time.perf_counter()
+        size = len(cv2.imencode(".png", band, secret_png_params(level))[1])
+        if level is not None and (time.perf_counter() - start) * scale > BUDGET_SECONDS:
+            break
+        if best_size is None or size < best_size:
+            best, best_size = level, size
+    return best
+
+
+def peek(payload, count):
+    """
+    Up to `count` unpacked bytes from the start of a payload, for
+    sniffing. Returns (codec name, bytes); the codec is None for raw
+    payloads, and bytes is None when the header is unknown or the start
+    doesn't decompress.
+    """
+    if len(payload) < HEADER.size or bytes(payload[:len(MAGIC)]) != MAGIC:
+        return None, bytes(payload[:count])
+
+    _, version, codec_id, _ = HEADER.unpack_from(payload)
+    if version != VERSION or codec_id not in CODEC_NAMES:
+        return None, None
+    codec = CODEC_NAMES[codec_id]
+    body = payload[HEADER.size:]
+    if codec_id == CODEC_NONE:
+        return codec, bytes(body[:count])
+    try:
+        return codec, CODECS[codec][2]().decompress(body, count)
+    except (zlib.error, lzma.LZMAError, EOFError):
+        return codec, None
@@ -0,0 +1,154 @@
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from Core.Compression import CODEC_NAMES, HEADER as PACK_HEADER, pack, peek, unpack
+from Core.Sniff import SNIFF_BYTES, sniff
+from Core.WorkerPool import JobError
+
+# Container payloads start with this header, right after the 64-bit
+# length prefix: magic, version, entry count, index size in bytes. The
+# index follows, then the entries' data. Payloads without it are a single
+# legacy blob.
+MAGIC = b"SGC\x00"
+VERSION = 1
+HEADER = struct.Struct(">4sBHI")
+
+# Per entry: data offset (from the end of the index), stored length,
+# unpacked size, codec id, name length, content type length; then the
+# UTF-8 name and the ASCII content type
+ENTRY = struct.Struct(">QQQBHB")
+
+MAX_ENTRIES = 0xFFFF
+MAX_NAME_BYTES = 1024
+
+Entry = namedtuple("Entry", ["name", "content_type", "offset", "length", "size", "compression"])
+
+# What a legacy single-blob payload is listed as
+LEGACY_NAME = "hidden_data"
+
+
+def build(files, compression="none"):
+    """
+    Container bytes for `files`, a list of (name, content type, data).
+    Each entry is packed on its own with `compression`, so one can be
+    read back without the others.
+    """
+    if not files:
+        raise JobError(400, "Provide at least one file")
+    if len(files) > MAX_ENTRIES:
+        raise JobError(400, f"At most {MAX_ENTRIES} files per container")
+
+    index, blobs, offset, seen = [], [], 0, set()
+    for name, content_type, data in files:
+        encoded_name = name.encode("utf-8")
+        if not encoded_name or len(encoded_name) > MAX_NAME_BYTES:
+            raise JobError(400, f"File names must be 1 to {MAX_NAME_BYTES} bytes: {name!r}")
+        if name in seen:
+            raise JobError(400, f"Duplicate file name: {name}")
+        seen.add(name)
+        encoded_type = (content_type or "application/octet-stream").encode("ascii", "replace")[:255]
+
+        stored, codec = pack(data, compression)
+        codec_id = next(codec_id for codec_id, codec_name in CODEC_NAMES.items() if codec_name == codec)
+        index.append(ENTRY.pack(offset, len(stored), len(data), codec_id, len(encoded_name), len(encoded_type))
+                     + encoded_name + encoded_type)
+        blobs.append(stored)
+        offset += len(stored)
+
+    index = b"".join(index)
+    return b"".join([HEADER.pack(MAGIC, VERSION, len(files), len(index)), index, *blobs])
+
+
+class PayloadReader:
+    """
+    Random access to the payload bytes through a backend's bit reader,
+    so an entry costs only its own bit range.
+    """
+
+    def __init__(self, read_bits, nbits):
+        self.read_bits = read_bits
+        self.nbits = nbits
+        self.size = -(-nbits // 8)
+
+    def read(self, offset, count):
+        first = 8 * offset
+        last = min(8 * (offset + count), self.nbits)
+        if last <= first:
+            return b""
+        return np.packbits(self.read_bits(64 + first, last - first)).tobytes()
+
+
+def read_index(reader):
+    """
+    The entries of a container payload, or None for a legacy blob.
+    Raises JobError 400 when the index doesn't fit the payload.
+    """
+    head = reader.read(0, HEADER.size)
+    if len(head) < HEADER.size or head[:len(MAGIC)] != MAGIC:
+        return None
+
+    _, version, count, index_size = HEADER.unpack(head)
+    if version != VERSION:
+        raise JobError(400, f"Hidden container uses an unsupported version ({version})")
+    data_start = HEADER.size + index_size
+    if data_start > reader.size:
+        raise JobError(400, "Hidden container is corrupted: index runs past the payload")
+
+    index = reader.read(HEADER.size, index_size)
+    entries, pos = [], 0
+    for _ in range(count):
+        if pos + ENTRY.size > len(index):
+            raise JobError(400, "Hidden container is corrupted: truncated index")
+        offset, length, size, codec_id, name_len, type_len = ENTRY.unpack_from(index, pos)
+        pos += ENTRY.size
+        name = index[pos:pos + name_len].decode("utf-8", "replace")
+        content_type = index[pos + name_len:pos + name_len + type_len].decode("ascii", "replace")
+        pos += name_len + type_len
+        if data_start + offset + length > reader.size or codec_id not in CODEC_NAMES:
+            raise JobError(400, f"Hidden container is corrupted: bad index entry for {name}")
+        entries.append(Entry(name, content_type, data_start + offset, length, size, CODEC_NAMES[codec_id]))
+    return entries
+
+
+def legacy_entry(reader):
+    # One entry covering the whole blob, typed from its first bytes
+    head = reader.read(0, PACK_HEADER.size + SNIFF_BYTES)
+    codec, sample = peek(head, SNIFF_BYTES)
+    file_type = sniff(sample or b"")
+    size = reader.size
+    if codec is not None:
+        size = PACK_HEADER.unpack_from(head)[3]
+    return Entry(LEGACY_NAME + file_type.extensions[0], file_type.content_type, 0, reader.size, size,
+                 codec or "none")
+
+
+def list_entries(reader):
+    """
+    (is_container, entries) for any payload; a legacy blob is listed as
+    a single entry. An empty payload has no entries.
+    """
+    if reader.size == 0:
+        return False, []
+    entries = read_index(reader)
+    if entries is None:
+        return False, [legacy_entry(reader)]
+    return True, entries
+
+
+def read_entry(reader, entry):
+    # Entries carry the compression header when packed, like whole payloads
+    return unpack(reader.read(entry.offset, entry.length))
+
+
+def entry_info(index, entry):
+    return {
+        "index": index,
+        "name": entry.name,
+        "content_type": entry.content_type,
+        "size": entry.size,
+        "stored_size": entry.length,
+        "compression": entry.compression,
+        "offset": entry.offset,
+    }
@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+import numpy as np
+
+from Core.Compression import HEADER, peek
+from Core.ImageHeader import read_header
+from Core.RowReader import read_rows
+from Core.Sniff import SNIFF_BYTES, UNKNOWN, sniff
+from Core.Steg.Backend import bits_to_int
+
+Detection = namedtuple("Detection", ["length", "has_data", "file_type", "compression", "confidence"])
+
+# Slots a detection reads: the length prefix, then the payload head
+DETECT_SLOTS = 64 + 8 * (HEADER.size + SNIFF_BYTES)
+
+# Confidence for a plausible length alone; a recognised payload head
+# raises it towards 1
+LENGTH_CONFIDENCE = 0.5
+
+
+def read_length(flat):
+    # 64-bit big-endian length in bit 0 of the first 64 channel values
+    return bits_to_int(flat[:64] & 1)
+
+
+def detect(flat, capacity):
+    """
+    Look for an LSB payload in `flat` (channel values, at least the first
+    DETECT_SLOTS of them when the image has that many). `capacity` is the
+    largest length that can be valid. Only bit plane 0 is read.
+    """
+    length = read_length(flat)
+    if not 0 < length <= capacity:
+        return Detection(length, False, UNKNOWN, None, 0.0)
+
+    count = min(length, HEADER.size + SNIFF_BYTES, (len(flat) - 64) // 8)
+    head = np.packbits(flat[64:64 + count * 8] & 1).tobytes()
+    codec, head = peek(head, SNIFF_BYTES)
+
+    file_type = UNKNOWN if head is None else sniff(head)
+    confidence = LENGTH_CONFIDENCE + (1 - LENGTH_CONFIDENCE) * file_type.confidence
+    if codec is not None:
+        # A well-formed compression header is itself strong evidence
+        confidence = max(confidence, 0.95)
+    return Detection(length, True, file_type, codec, round(confidence, 3))
+
+
+def detect_bytes(img_bytes, capacity_of):
+    """
+    detect() straight from an encoded image, decoding only the first rows.
+    `capacity_of(width, height, channels)` gives the valid length bound.
+    Returns (ImageInfo, Detection), or None when the image needs a full
+    decode.
+    """
+    header = read_header(img_bytes)
+    if header is None:
+        return None
+
+    row_slots = header.width * header.channels
+    if header.height * row_slots <= 64:
+        return None
+
+    rows = read_rows(img_bytes, min(header.height, -(-DETECT_SLOTS // row_slots)))
+    if rows is None:
+        return None
+    return header, detect(rows.reshape(-1), capacity_of(header.width, header.height, header.channels))
@@ -0,0 +1,83 @@
+"""
+Embedding a packed payload with a given backend, for the routers that
+share the /text layout: a decoded carrier, a shared /carriers image
+(copied on write), or a carrier big enough for the strip path.
+"""
+from Core.CarrierStore import copy_on_write_prefix, decoded_carrier
+from Core.Memory import track, tracked, transient
+from Core.Metrics import record_pixels, stage
+from Core.Output import encode_output, encode_output_blocks
+from Core.Steg.Parallel import scratch_bytes
+from Core.Strips import embedded_strips, strip_layout, write_strips
+from Core.WorkerPool import JobError
+
+
+def check_fits(backend, width, height, channels, data):
+    max_bytes = backend.capacity(width, height, channels)
+    if len(data) > max_bytes:
+        raise JobError(
+            400,
+            f"File too large. Carrier can hold max {max_bytes} bytes, but file is {len(data)} bytes"
+        )
+
+
+def embed_encoded(backend, carrier_bytes, data, options):
+    # Read carrier image; the encoded result doesn't refer to it, so its
+    # buffer goes back to the pool on return
+    with decoded_carrier(carrier_bytes) as carrier_img:
+        if carrier_img is None:
+            raise JobError(400, "Invalid carrier image format")
+        with tracked(carrier_img.nbytes):
+            return embed_image(backend, carrier_img, data, options)
+
+
+def embed_image(backend, carrier_img, data, options):
+    """
+    The encoded output of `carrier_img` with `data` embedded by `backend`.
+    """
+    height, width, channels = carrier_img.shape
+    record_pixels(width, height)
+    check_fits(backend, width, height, channels, data)
+
+    if not carrier_img.flags.writeable:
+        # Shared carrier from /carriers: copy only the rows the payload touches
+        with copy_on_write_prefix(carrier_img, 64 + len(data) * 8) as (prefix, rows), tracked(prefix.nbytes):
+            with stage("embed"):
+                backend(prefix).encode_binary(data)
+            # The payload bits, unpacked a chunk at a time
+            transient(scratch_bytes(len(data)))
+
+            with stage("imencode"):
+                encoded = encode_output_blocks([prefix, carrier_img[rows:]], options)
+            if encoded is None:
+                raise JobError(500, "Failed to encode image")
+            track(len(encoded))
+        return encoded
+
+    with stage("embed"):
+        steg = backend(carrier_img)
+        result_img = steg.encode_binary(data)
+    transient(scratch_bytes(len(data)))
+
+    # Encode to a lossless format (required)
+    with stage("imencode"):
+        encoded_img = encode_output(result_img, options)
+    if encoded_img is None:
+        raise JobError(500, "Failed to encode image")
+    track(2 * len(encoded_img))
+
+    return encoded_img.reshape(-1)
+
+
+def embed_strips(backend, carrier_bytes, data, options):
+    """
+    embed_encoded for carriers over the strip threshold: the carrier is
+    read, embedded and written out a strip at a time. Returns the output
+    path. The strips follow the bit plane order of the /text layout.
+    """
+    width, height = strip_layout(carrier_bytes)
+    record_pixels(width, height)
+    check_fits(backend, width, height, 3, data)
+
+    with stage("strips"):
+        return write_strips(embedded_strips(carrier_bytes, data), width, height, options)
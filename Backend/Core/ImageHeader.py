@@ -0,0 +1,127 @@
+import struct
+from collections import namedtuple
+
+# Routes decode with cv2.IMREAD_COLOR, which always yields 3 channels
+DECODED_CHANNELS = 3
+
+ImageInfo = namedtuple("ImageInfo", ["format", "width", "height", "channels"])
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# JPEG start-of-frame markers (everything in C0..CF except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _png_header(data):
+    if len(data) < 33 or bytes(data[12:16]) != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", data[16:24])
+    return ImageInfo("png", width, height, DECODED_CHANNELS)
+
+
+def _bmp_header(data):
+    if len(data) < 26:
+        return None
+    header_size = struct.unpack("<I", data[14:18])[0]
+    if header_size == 12:
+        width, height = struct.unpack("<HH", data[18:22])
+    else:
+        width, height = struct.unpack("<ii", data[18:26])
+    return ImageInfo("bmp", width, abs(height), DECODED_CHANNELS)
+
+
+def _exif_orientation(segment):
+    # segment starts after the APP1 length field
+    if bytes(segment[:6]) != b"Exif\x00\x00":
+        return 1
+    tiff = segment[6:]
+    if len(tiff) < 8:
+        return 1
+    endian = "<" if bytes(tiff[:2]) == b"II" else ">"
+    ifd = struct.unpack(endian + "I", tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return 1
+    count = struct.unpack(endian + "H", tiff[ifd:ifd + 2])[0]
+    for i in range(count):
+        entry = ifd + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag = struct.unpack(endian + "H", tiff[entry:entry + 2])[0]
+        if tag == 0x0112:
+            return struct.unpack(endian + "H", tiff[entry + 8:entry + 10])[0]
+    return 1
+
+
+def _jpeg_header(data):
+    pos = 2
+    orientation = 1
+    size = len(data)
+    while pos + 4 <= size:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2
+            continue
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker == 0xE1:
+            orientation = _exif_orientation(data[pos + 4:pos + 2 + length])
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > size:
+                return None
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            # imdecode applies the EXIF rotation
+            if orientation in (5, 6, 7, 8):
+                width, height = height, width
+            return ImageInfo("jpeg", width, height, DECODED_CHANNELS)
+        if marker == 0xDA:
+            return None
+        pos += 2 + length
+    return None
+
+
+def _webp_header(data):
+    if len(data) < 30:
+        return None
+    chunk = bytes(data[12:16])
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", data[26:30])
+        return ImageInfo("webp", width & 0x3FFF, height & 0x3FFF, DECODED_CHANNELS)
+    if chunk == b"VP8L":
+        bits = struct.unpack("<I", data[21:25])[0]
+        return ImageInfo("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1, DECODED_CHANNELS)
+    if chunk == b"VP8X":
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return ImageInfo("webp", width, height, DECODED_CHANNELS)
+    return None
+
+
+def read_header(data):
+    """
+    Read image dimensions from the file header without decoding pixels.
+    Returns an ImageInfo, or None when the format isn't recognised and
+    the caller has to fall back to a full decode.
+    """
+    try:
+        head = bytes(data[:4])
+        if bytes(data[:8]) == PNG_SIGNATURE:
+            info = _png_header(data)
+        elif head[:2] == b"BM":
+            info = _bmp_header(data)
+        elif head[:3] == b"\xff\xd8\xff":
+            info = _jpeg_header(data)
+        elif head == b"RIFF" and bytes(data[8:12]) == b"WEBP":
+            info = _webp_header(data)
+        else:
+            info = None
+    except struct.error:
+        return None
+
+    if info is None or info.width <= 0 or info.height <= 0:
+        return None
+    return info
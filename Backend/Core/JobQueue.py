@@ -0,0 +1,357 @@
+import asyncio
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from Core.Memory import MemoryMeter, request_meter
+from Core.Metrics import StageTimer, request_timer
+from Core.Uploads import unmap
+from Core.WorkerPool import JobError
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+RESULT_FILE = "result.bin"
+META_FILE = "job.json"
+# Job folders without metadata this old were never submitted
+ORPHAN_SECONDS = 60
+
+
+class Job:
+    def __init__(self, job_id, kind, created=None):
+        self.job_id = job_id
+        self.kind = kind
+        self.status = "queued"
+        self.phase = "queued"
+        self.progress = 0.0
+        self.created = created or time.time()
+        self.started = None
+        self.finished = None
+        self.error = None  # (status_code, detail)
+        self.result_name = None
+        self.media_type = None
+        self.result_size = None
+        self.headers = {}
+        self.peak_memory = None
+        self.stages = {}
+        # Server process running the job; siblings sharing the jobs folder
+        # leave its unfinished jobs alone
+        self.pid = os.getpid()
+
+    @property
+    def finished_or_created(self):
+        return self.finished or self.created
+
+    def set_phase(self, phase, progress):
+        self.phase = phase
+        self.progress = progress
+
+    def info(self):
+        info = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "phase": self.phase,
+            "progress": round(self.progress, 3),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "elapsed_seconds": round((self.finished or time.time()) - (self.started or self.created), 3),
+        }
+        if self.error is not None:
+            info["error"] = {"status_code": self.error[0], "detail": self.error[1]}
+        if self.status == "done":
+            info["result"] = {
+                "filename": self.result_name,
+                "media_type": self.media_type,
+                "size": self.result_size,
+                "headers": self.headers,
+            }
+            info["peak_memory_bytes"] = self.peak_memory
+            info["stages_ms"] = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        return info
+
+    def to_meta(self):
+        return {**self.info(), "error": self.error, "pid": self.pid}
+
+    @classmethod
+    def from_meta(cls, meta):
+        job = cls(meta["job_id"], meta["kind"], meta["created"])
+        job.status = meta["status"]
+        job.phase = meta["phase"]
+        job.progress = meta["progress"]
+        job.started = meta["started"]
+        job.finished = meta["finished"]
+        job.error = tuple(meta["error"]) if meta.get("error") else None
+        result = meta.get("result") or {}
+        job.result_name = result.get("filename")
+        job.media_type = result.get("media_type")
+        job.result_size = result.get("size")
+        job.headers = result.get("headers") or {}
+        job.peak_memory = meta.get("peak_memory_bytes")
+        job.stages = {name: ms / 1000 for name, ms in (meta.get("stages_ms") or {}).items()}
+        job.pid = meta.get("pid")
+        return job
+
+
+def _map_file(path):
+    # (mapping, view); the mapping is None for an empty file
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None, memoryview(b"")
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapping, memoryview(mapping)
+
+
+def _remove_inputs(folder, names, mapped):
+    # Unmap before removing, or the files can't be deleted on Windows
+    for mapping, view in mapped:
+        unmap(mapping, view)
+    for name in names:
+        try:
+            os.remove(os.path.join(folder, name + ".in"))
+        except OSError:
+            pass
+
+
+def _pid_alive(pid):
+    if pid is None or os.name == "nt":
+        # Unknown owner; on Windows os.kill would terminate the process
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _store_result(path, data):
+    # A str is a finished file (the strip path's output): moved, not copied
+    if isinstance(data, str):
+        shutil.move(data, path)
+    else:
+        _write_file(path, data)
+    return os.path.getsize(path)
+
+
+class JobQueue:
+    """
+    Background jobs for requests too slow to hold a connection open.
+    Inputs and results live on local disk, one folder per job; at most
+    `concurrency` jobs run at once and finished jobs expire after `ttl`.
+    """
+
+    def __init__(self, directory, concurrency, max_pending, ttl):
+        self.directory = directory
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.jobs = {}
+        self.tasks = {}
+        self.limiter = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            directory=os.environ.get("STEG_JOBS_DIR") or os.path.join(tempfile.gettempdir(), "steg-jobs"),
+            concurrency=int(os.environ.get("STEG_JOBS_CONCURRENCY", "2")),
+            max_pending=int(os.environ.get("STEG_JOBS_MAX_PENDING", "64")),
+            ttl=float(os.environ.get("STEG_JOBS_TTL", "3600")),
+        )
+
+    def _folder(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def result_path(self, job):
+        return os.path.join(self._folder(job.job_id), RESULT_FILE)
+
+    def _load(self):
+        # Results survive a restart; work that was in flight does not.
+        # Unfinished jobs of other live processes sharing the folder are
+        # theirs: not marked, expired or adopted here
+        for job_id in os.listdir(self.directory):
+            try:
+                with open(os.path.join(self._folder(job_id), META_FILE)) as f:
+                    job = Job.from_meta(json.load(f))
+            except FileNotFoundError:
+                # A sibling's job between makedirs and its first save; older
+                # folders without metadata are leftovers
+                if time.time() - os.path.getmtime(self._folder(job_id)) > ORPHAN_SECONDS:
+                    shutil.rmtree(self._folder(job_id), ignore_errors=True)
+                continue
+            except (OSError, ValueError, KeyError):
+                shutil.rmtree(self._folder(job_id), ignore_errors=True)
+                continue
+            if job.status not in FINISHED_STATES:
+                if job.pid != os.getpid() and _pid_alive(job.pid):
+                    continue
+                job.status = "failed"
+                job.finished = time.time()
+                job.error = (500, "Interrupted by a server restart, submit the job again")
+                self._save(job)
+            self.jobs[job_id] = job
+
+    def _save(self, job):
+        path = os.path.join(self._folder(job.job_id), META_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job.to_meta(), f)
+        os.replace(tmp_path, path)
+
+    def _expire(self):
+        if self.ttl <= 0:
+            return
+        cutoff = time.time() - self.ttl
+        for job_id in [k for k, job in self.jobs.items() if job.status in FINISHED_STATES and job.finished_or_created < cutoff]:
+            self.jobs.pop(job_id)
+            shutil.rmtree(self._folder(job_id), ignore_errors=True)
+            self.expired += 1
+
+    @property
+    def pending(self):
+        return sum(1 for job in self.jobs.values() if job.status not in FINISHED_STATES)
+
+    async def submit(self, kind, inputs, work):
+        """
+        Save `inputs` (name -> buffer) and queue `work(job, inputs)`, which
+        runs with the inputs memory-mapped back from disk and returns
+        (data, filename, media_type, headers); data may also be the path
+        of a file holding the result, which the job takes over.
+        """
+        self._expire()
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many background jobs pending, retry shortly",
+                headers={"Retry-After": "5"}
+            )
+
+        job = Job(uuid.uuid4().hex, kind)
+        folder = self._folder(job.job_id)
+        await run_in_threadpool(os.makedirs, folder)
+        for name, data in inputs.items():
+            await run_in_threadpool(_write_file, os.path.join(folder, name + ".in"), data)
+        await run_in_threadpool(self._save, job)
+
+        self.jobs[job.job_id] = job
+        self.submitted += 1
+        self.tasks[job.job_id] = asyncio.create_task(self._run(job, list(inputs), work))
+        return job
+
+    async def _run(self, job, names, work):
+        if self.limiter is None:
+            self.limiter = asyncio.Semaphore(self.concurrency)
+
+        # The task inherited the submitting request's context; account to
+        # the job instead
+        meter = MemoryMeter()
+        timer = StageTimer()
+        request_meter.set(meter)
+        request_timer.set(timer)
+
+        folder = self._folder(job.job_id)
+        mapped = []
+        try:
+            async with self.limiter:
+                job.status = "running"
+                job.started = time.time()
+                job.set_phase("loading", 0.05)
+                await run_in_threadpool(self._save, job)
+
+                inputs = {}
+                for name in names:
+                    mapping, view = _map_file(os.path.join(folder, name + ".in"))
+                    mapped.append((mapping, view))
+                    inputs[name] = view
+                job.set_phase("processing", 0.1)
+                data, job.result_name, job.media_type, job.headers = await work(job, inputs)
+
+                job.set_phase("saving", 0.9)
+                job.result_size = await run_in_threadpool(_store_result, self.result_path(job), data)
+                job.status = "done"
+                job.set_phase("done", 1.0)
+                self.completed += 1
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            job.phase = "cancelled"
+            raise
+        except (JobError, HTTPException) as e:
+            job.status = "failed"
+            job.error = (e.status_code, e.detail)
+            self.failed += 1
+        except Exception as e:
+            job.status = "failed"
+            job.error = (500, f"Error: {str(e)}")
+            self.failed += 1
+        finally:
+            job.finished = time.time()
+            job.peak_memory = meter.peak
+            job.stages = timer.totals()
+            self.tasks.pop(job.job_id, None)
+            await run_in_threadpool(_remove_inputs, folder, names, mapped)
+            if job.job_id in self.jobs:
+                await run_in_threadpool(self._save, job)
+
+    def get(self, job_id):
+        self._expire()
+        return self.jobs.get(job_id)
+
+    def remove(self, job_id):
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+        task = self.tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+        shutil.rmtree(self._folder(job_id), ignore_errors=True)
+        return True
+
+    def list(self):
+        self._expire()
+        return [job.info() for job in sorted(self.jobs.values(), key=lambda job: job.created)]
+
+    def stats(self):
+        running = sum(1 for job in self.jobs.values() if job.status == "running")
+        return {
+            "concurrency": self.concurrency,
+            "max_pending": self.max_pending,
+            "ttl_seconds": self.ttl,
+            "jobs": len(self.jobs),
+            "queued": self.pending - running,
+            "running": running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "expired": self.expired
+        }
+
+    def shutdown(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+
+job_queue = JobQueue.from_env()
@@ -0,0 +1,275 @@
+"""
+Just enough of a baseline JPEG coder to reach the quantized DCT
+coefficients without decoding pixels: markers, Huffman tables, frame and
+scan headers, restart intervals, and a walk over the entropy-coded data
+that reports where each coefficient's bits sit.
+"""
+import re
+import struct
+from collections import namedtuple
+
+SOI = b"\xff\xd8"
+
+# Baseline and extended sequential Huffman frames; progressive (SOF2)
+# and arithmetic coded frames keep their coefficients elsewhere
+SEQUENTIAL_FRAMES = (0xC0, 0xC1)
+UNSUPPORTED_FRAMES = {0xC2: "progressive", 0xC3: "lossless", 0xC5: "hierarchical", 0xC6: "hierarchical",
+                      0xC7: "hierarchical", 0xC9: "arithmetic coded", 0xCA: "arithmetic coded",
+                      0xCB: "arithmetic coded", 0xCD: "arithmetic coded", 0xCE: "arithmetic coded",
+                      0xCF: "arithmetic coded"}
+
+# A marker ending the entropy-coded data: 0xFF not followed by a stuffed
+# zero or a restart marker
+SCAN_END = re.compile(rb"\xff[^\x00\xd0-\xd7]")
+RESTART = re.compile(rb"\xff[\xd0-\xd7]")
+
+Component = namedtuple("Component", ["id", "h", "v"])
+Frame = namedtuple("Frame", ["width", "height", "components"])
+# start/end: byte range of the scan's entropy-coded data in the file
+Scan = namedtuple("Scan", ["components", "start", "end", "restart_interval"])
+# Sampling factors and Huffman lookups of one component in a scan
+ScanComponent = namedtuple("ScanComponent", ["h", "v", "dc", "ac"])
+
+
+class JpegError(Exception):
+    pass
+
+
+def huffman_lookup(counts, symbols):
+    """
+    Table indexed by the next 16 bits of the stream, giving
+    (code length << 8) | symbol; 0 marks a code the table doesn't have.
+    """
+    table = [0] * 65536
+    code, k = 0, 0
+    for length in range(1, 17):
+        for _ in range(counts[length - 1]):
+            span = 1 << (16 - length)
+            start = code << (16 - length)
+            table[start:start + span] = [(length << 8) | symbols[k]] * span
+            code += 1
+            k += 1
+        code <<= 1
+    return table
+
+
+def parse(data):
+    """
+    The frame and scans of a sequential Huffman JPEG, with each scan's
+    tables resolved. Raises JpegError for other JPEGs.
+    """
+    if bytes(data[:2]) != SOI:
+        raise JpegError("Not a JPEG file")
+
+    frame, restart_interval = None, 0
+    dc_tables, ac_tables = {}, {}
+    scans = []
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise JpegError("Corrupt JPEG: expected a marker")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0xD9:
+            break
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        body = bytes(data[pos + 4:pos + 2 + length])
+        pos += 2 + length
+
+        if marker in UNSUPPORTED_FRAMES:
+            raise JpegError(f"{UNSUPPORTED_FRAMES[marker].capitalize()} JPEGs are not supported, "
+                            f"save the carrier as a baseline JPEG")
+        if marker in SEQUENTIAL_FRAMES:
+            precision, height, width, count = struct.unpack_from(">BHHB", body)
+            if precision != 8:
+                raise JpegError("Only 8-bit JPEGs are supported")
+            components = []
+            for i in range(count):
+                cid, sampling, _ = struct.unpack_from(">BBB", body, 6 + 3 * i)
+                components.append(Component(cid, sampling >> 4, sampling & 15))
+            frame = Frame(width, height, components)
+        elif marker == 0xC4:
+            k = 0
+            while k < len(body):
+                table_class, table_id = body[k] >> 4, body[k] & 15
+                counts = body[k + 1:k + 17]
+                symbols = body[k + 17:k + 17 + sum(counts)]
+                (ac_tables if table_class else dc_tables)[table_id] = huffman_lookup(counts, symbols)
+                k += 17 + sum(counts)
+        elif marker == 0xDD:
+            restart_interval = struct.unpack_from(">H", body)[0]
+        elif marker == 0xDA:
+            if frame is None:
+                raise JpegError("Corrupt JPEG: scan before frame header")
+            by_id = {c.id: c for c in frame.components}
+            count = body[0]
+            components = []
+            for i in range(count):
+                cid, tables = body[1 + 2 * i], body[2 + 2 * i]
+                if cid not in by_id or tables >> 4 not in dc_tables or tables & 15 not in ac_tables:
+                    raise JpegError("Corrupt JPEG: scan uses an unknown component or table")
+                c = by_id[cid]
+                components.append(ScanComponent(c.h, c.v, dc_tables[tables >> 4], ac_tables[tables & 15]))
+            match = SCAN_END.search(data, pos)
+            end = match.start() if match else len(data)
+            scans.append(Scan(components, pos, end, restart_interval))
+            pos = end
+
+    if frame is None or not scans:
+        raise JpegError("Corrupt JPEG: no frame or scan")
+    return frame, scans
+
+
+def ceil_div(a, b):
+    return -(-a // b)
+
+
+def mcu_layout(frame, scan):
+    """
+    (MCU count, blocks per MCU for each scan component). A scan of one
+    component codes its blocks one at a time, in that component's own
+    block grid.
+    """
+    hmax = max(c.h for c in frame.components)
+    vmax = max(c.v for c in frame.components)
+    if len(scan.components) == 1:
+        c = scan.components[0]
+        cols = ceil_div(ceil_div(frame.width * c.h, hmax), 8)
+        rows = ceil_div(ceil_div(frame.height * c.v, vmax), 8)
+        return cols * rows, [1]
+    cols = ceil_div(frame.width, 8 * hmax)
+    rows = ceil_div(frame.height, 8 * vmax)
+    return cols * rows, [c.h * c.v for c in scan.components]
+
+
+def block_count(frame, scans):
+    return sum(mcus * sum(blocks) for mcus, blocks in (mcu_layout(frame, scan) for scan in scans))
+
+
+def unstuff(data):
+    return bytes(data).replace(b"\xff\x00", b"\xff")
+
+
+def stuff(data):
+    return bytes(data).replace(b"\xff", b"\xff\x00")
+
+
+def scan_segments(data, scan):
+    """
+    The scan's entropy-coded data split at its restart markers, as
+    (start, end) byte ranges in the file.
+    """
+    ranges, start = [], scan.start
+    for match in RESTART.finditer(data, scan.start, scan.end):
+        ranges.append((start, match.start()))
+        start = match.end()
+    ranges.append((start, scan.end))
+    return ranges
+
+
+def walk(data, frame, scans, limit=None):
+    """
+    Find the AC coefficients whose magnitude is 2 or more, in stream
+    order, stopping after `limit` of them. Returns (places, lsbs, blocks):
+    each place is (scan, segment, bit offset in the unstuffed segment) of
+    the coefficient's last extra bit, lsbs holds the low bit of each
+    magnitude, and blocks counts the blocks read. Flipping that stream
+    bit flips the magnitude's low bit without changing its size category,
+    so the Huffman codes, and the length of the stream, stay the same.
+    """
+    places, lsbs, done = [], [], 0
+    for scan_index, scan in enumerate(scans):
+        mcus, blocks = mcu_layout(frame, scan)
+        tables = [(c.dc, c.ac) for c in scan.components]
+        ranges = scan_segments(data, scan)
+        per_segment = scan.restart_interval or mcus
+        mcu = 0
+        for segment_index, (start, end) in enumerate(ranges):
+            buf = unstuff(data[start:end])
+            size = len(buf)
+            i, acc, nbits = 0, 0, 0
+            last = min(mcus, mcu + per_segment)
+            while mcu < last:
+                for (dc, ac), count in zip(tables, blocks):
+                    for _ in range(count):
+                        done += 1
+                        # DC: Huffman symbol, then that many extra bits
+                        while nbits < 16:
+                            acc = (acc << 8) | (buf[i] if i < size else 0xFF)
+                            i += 1
+                            nbits += 8
+                        entry = dc[(acc >> (nbits - 16)) & 0xFFFF]
+                        if not entry:
+                            raise JpegError("Corrupt JPEG: bad Huffman code")
+                        nbits -= (entry >> 8) + (entry & 0xFF)
+                        while nbits < 0:
+                            acc = (acc << 8) | (buf[i] if i < size else 0xFF)
+                            i += 1
+                            nbits += 8
+                        acc &= (1 << nbits) - 1
+
+                        k = 1
+                        while k < 64:
+                            while nbits < 16:
+                                acc = (acc << 8) | (buf[i] if i < size else 0xFF)
+                                i += 1
+                                nbits += 8
+                            entry = ac[(acc >> (nbits - 16)) & 0xFFFF]
+                            if not entry:
+                                raise JpegError("Corrupt JPEG: bad Huffman code")
+                            nbits -= entry >> 8
+                            run, s = (entry >> 4) & 15, entry & 15
+                            if not s:
+                                if run != 15:
+                                    # End of block
+                                    acc &= (1 << nbits) - 1
+                                    break
+                                k += 16
+                                acc &= (1 << nbits) - 1
+                                continue
+                            k += run + 1
+                            while nbits < s:
+                                acc = (acc << 8) | (buf[i] if i < size else 0xFF)
+                                i += 1
+                                nbits += 8
+                            nbits -= s
+                            if s >= 2:
+                                extra = (acc >> nbits) & ((1 << s) - 1)
+                                # Positive values are sent as is, negative
+                                # ones as their one's complement
+                                low = extra & 1 if extra >> (s - 1) else 1 - (extra & 1)
+                                places.append((scan_index, segment_index, 8 * i - nbits - 1))
+                                lsbs.append(low)
+                                if limit is not None and len(lsbs) >= limit:
+                                    return places, lsbs, done
+                            acc &= (1 << nbits) - 1
+                        if k > 64:
+                            raise JpegError("Corrupt JPEG: coefficient run past the block")
+                mcu += 1
+            if 8 * i - nbits > 8 * size:
+                raise JpegError("Corrupt JPEG: scan data ends early")
+    return places, lsbs, done
+
+
+def flip(data, scans, places):
+    """
+    `data` with the given stream bits flipped, re-stuffed segment by
+    segment. Untouched segments are copied as they are.
+    """
+    by_segment = {}
+    for scan_index, segment_index, bit in places:
+        by_segment.setdefault((scan_index, segment_index), []).append(bit)
+
+    out, pos = [], 0
+    for (scan_index, segment_index), bits in sorted(by_segment.items()):
+        start, end = scan_segments(data, scans[scan_index])[segment_index]
+        buf = bytearray(unstuff(data[start:end]))
+        for bit in bits:
+            buf[bit >> 3] ^= 0x80 >> (bit & 7)
+        out.append(bytes(data[pos:start]))
+        out.append(stuff(buf))
+        pos = end
+    out.append(bytes(data[pos:]))
+    return b"".join(out)
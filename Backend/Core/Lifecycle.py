@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger("steg.lifecycle")
+
+# Synthetic carrier the warmup encodes into; big enough that every stage
+# (imdecode, embed, PNG encode, row reader) runs its real code paths
+WARMUP_SIZE = (256, 192)
+
+STARTING, READY, DRAINING = "starting", "ready", "draining"
+
+
+def configure_threads():
+    """
+    Apply STEG_CV_THREADS to OpenCV's own thread pool. The launcher sets
+    it per worker so OpenCV, BLAS and the worker pools of several server
+    processes don't all assume they have every core.
+    """
+    threads = os.environ.get("STEG_CV_THREADS")
+    if threads:
+        cv2.setNumThreads(int(threads))
+
+
+def warmup_carrier():
+    rng = np.random.default_rng(0)
+    width, height = WARMUP_SIZE
+    img = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+def warmup_secret_image():
+    img = np.zeros((32, 32, 3), dtype=np.uint8)
+    cv2.circle(img, (16, 16), 10, (255, 255, 255), -1)
+    return cv2.imencode(".png", img)[1].tobytes()
+
+
+class Lifecycle:
+    """
+    Startup and shutdown state for the health checks. The process is live
+    as soon as it answers; it is ready once warmed up, and stops being
+    ready when it starts to drain.
+    """
+
+    def __init__(self, warmup=True, drain_seconds=30.0):
+        self.warmup_enabled = warmup
+        self.drain_seconds = drain_seconds
+        self.state = STARTING
+        self.started = time.time()
+        self.warmup_ms = None
+        self.warmup_error = None
+        self.in_flight = 0
+        self.served = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            warmup=os.environ.get("STEG_WARMUP", "1") not in ("0", "false", "no"),
+            drain_seconds=float(os.environ.get("STEG_DRAIN_SECONDS", "30")),
+        )
+
+    async def warm(self, steps):
+        """
+        Run the warmup steps (coroutine functions), then mark the process
+        ready. A failing step is logged, not fatal: warmup only saves the
+        first real requests some latency.
+        """
+        start = time.perf_counter()
+        if self.warmup_enabled:
+            for step in steps:
+                try:
+                    await step()
+                except Exception as e:
+                    self.warmup_error = f"{getattr(step, '__name__', 'step')}: {e}"
+                    logger.warning("Warmup step failed: %s", self.warmup_error)
+        self.warmup_ms = round((time.perf_counter() - start) * 1000, 3)
+        self.state = READY
+
+    async def drain(self, tasks=()):
+        """
+        Stop reporting ready, then wait up to drain_seconds for requests
+        still in flight and for `tasks` (background jobs) to finish.
+        """
+        self.state = DRAINING
+        deadline = time.monotonic() + self.drain_seconds
+        while self.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        pending = [task for task in tasks if not task.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()))
+        left = self.in_flight + sum(not task.done() for task in pending)
+        if left:
+            logger.warning("Drain timed out with %d requests or jobs unfinished", left)
+
+    def liveness(self):
+        return JSONResponse({"status": "alive", "uptime_s": round(time.time() - self.started, 1)})
+
+    def readiness(self):
+        body = {"status": self.state, "in_flight": self.in_flight}
+        if self.warmup_error:
+            body["warmup_error"] = self.warmup_error
+        return JSONResponse(body, status_code=200 if self.state == READY else 503)
+
+    def stats(self):
+        return {
+            "ready": int(self.state == READY),
+            "draining": int(self.state == DRAINING),
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "warmup_ms": self.warmup_ms,
+            "uptime_s": round(time.time() - self.started, 1),
+        }
+
+
+class LifecycleMiddleware:
+    """
+    Counts HTTP requests in flight, so a drain knows when they are done.
+    """
+
+    def __init__(self, app, lifecycle):
+        self.app = app
+        self.lifecycle = lifecycle
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.lifecycle.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.lifecycle.in_flight -= 1
+            self.lifecycle.served += 1
+
+
+lifecycle = Lifecycle.from_env()
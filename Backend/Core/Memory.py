@@ -0,0 +1,76 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+
+
+class MemoryMeter:
+    """
+    Running total of the large buffers a request holds (uploads, decoded
+    pixels, bit arrays, output images) and the highest total seen. Code
+    that drops a buffer before the request ends releases it again, so the
+    peak is what was held at once, not everything ever allocated.
+    """
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+
+    def track(self, nbytes):
+        self.current += nbytes
+        self.peak = max(self.peak, self.current)
+
+    def release(self, nbytes):
+        self.current = max(0, self.current - nbytes)
+
+    def merge_peak(self, nbytes):
+        # Account for a worker's peak on top of what the request already holds
+        self.peak = max(self.peak, self.current + nbytes)
+
+
+# Set per request by UploadLimitMiddleware (event loop side)
+request_meter = contextvars.ContextVar("request_meter", default=None)
+
+# Set per job by the worker pool (worker thread/process side)
+_worker = threading.local()
+
+
+def start_job_meter():
+    _worker.meter = MemoryMeter()
+    return _worker.meter
+
+
+def current_meter():
+    return getattr(_worker, "meter", None) or request_meter.get()
+
+
+def track(nbytes):
+    meter = current_meter()
+    if meter is not None:
+        meter.track(nbytes)
+
+
+def release(nbytes):
+    meter = current_meter()
+    if meter is not None:
+        meter.release(nbytes)
+
+
+def transient(nbytes):
+    # A buffer that came and went within the last step: it counts towards
+    # the peak, on top of what is held, but not towards the running total
+    meter = current_meter()
+    if meter is not None:
+        meter.merge_peak(nbytes)
+
+
+@contextmanager
+def tracked(nbytes):
+    """
+    track() for a buffer that lives as long as the block: released when
+    the block ends, however it ends.
+    """
+    track(nbytes)
+    try:
+        yield
+    finally:
+        release(nbytes)
@@ -0,0 +1,225 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds for stage and request latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Carrier size buckets in megapixels, by upper bound
+SIZE_BUCKETS = ((1, "lt_1mp"), (4, "1_4mp"), (16, "4_16mp"), (64, "16_64mp"))
+
+PROFILE_HEADER = b"x-profile"
+PROFILING_ENABLED = os.environ.get("STEG_PROFILING", "1") != "0"
+
+
+def size_bucket(pixels):
+    if pixels is None:
+        return "none"
+    megapixels = pixels / 1e6
+    for limit, label in SIZE_BUCKETS:
+        if megapixels < limit:
+            return label
+    return "ge_64mp"
+
+
+class StageTimer:
+    """
+    Ordered (stage, seconds) records for one request or pooled job, and
+    the pixel count of the largest image it handled.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.pixels = None
+
+    def add(self, name, seconds):
+        self.stages.append((name, seconds))
+
+    def record_pixels(self, pixels):
+        self.pixels = max(self.pixels or 0, pixels)
+
+    def merge(self, other):
+        self.stages.extend(other.stages)
+        if other.pixels is not None:
+            self.record_pixels(other.pixels)
+
+    def totals(self):
+        # Repeated stages (batches, carrier + secret decodes) are summed
+        totals = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+
+# Set per request by MetricsMiddleware (event loop side)
+request_timer = contextvars.ContextVar("request_timer", default=None)
+
+# Set per job by the worker pool (worker thread/process side)
+_worker = threading.local()
+
+
+def start_job_timer():
+    _worker.timer = StageTimer()
+    return _worker.timer
+
+
+def current_timer():
+    return getattr(_worker, "timer", None) or request_timer.get()
+
+
+@contextmanager
+def stage(name):
+    timer = current_timer()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add(name, time.perf_counter() - start)
+
+
+def record_pixels(width, height):
+    timer = current_timer()
+    if timer is not None:
+        timer.record_pixels(width * height)
+
+
+async def body_parsed():
+    """
+    Router dependency. FastAPI resolves dependencies after reading the
+    multipart body, so the time since the request started is the parse.
+    """
+    timer = request_timer.get()
+    if timer is not None:
+        timer.add("parse", time.perf_counter() - timer.started)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted(self.series.items())
+        for labels, series in items:
+            base = ",".join(f'{key}="{value}"' for key, value in zip(self.label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "steg_stage_seconds", "Time spent in each request stage", ("endpoint", "stage", "size")
+)
+request_seconds = Histogram(
+    "steg_request_seconds", "End to end request time", ("endpoint", "method", "status", "size")
+)
+
+
+def render_stats(name, help_text, stats, label=None):
+    """
+    Numeric values of a stats() dict as one gauge family, keyed by a
+    `key` label. With `label`, stats maps each label value to a dict.
+    """
+    groups = stats.items() if label else [(None, stats)]
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for group, values in groups:
+        base = f'{label}="{group}",' if label else ""
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'{name}{{{base}key="{key}"}} {value}')
+    return lines
+
+
+def render_metrics(extra=()):
+    lines = stage_seconds.render() + request_seconds.render()
+    for family in extra:
+        lines += family
+    return "\n".join(lines) + "\n"
+
+
+def route_path(scope):
+    route = scope.get("route")
+    if route is None:
+        return None
+    # Newer FastAPI puts the router-relative route in the scope and keeps
+    # the prefixed path on the effective route context
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    return getattr(context, "path", None) or route.path
+
+
+def server_timing(timer, total):
+    entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in timer.totals().items()]
+    entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries).encode()
+
+
+class MetricsMiddleware:
+    """
+    Times every request and feeds its stage records into the histograms,
+    labelled by route and carrier size. Requests sent with `X-Profile: 1`
+    get the stage breakdown back in a Server-Timing header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = StageTimer()
+        token = request_timer.set(timer)
+        profile = PROFILING_ENABLED and dict(scope["headers"]).get(PROFILE_HEADER, b"0") not in (b"0", b"")
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile:
+                    total = time.perf_counter() - timer.started
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", server_timing(timer, total)),
+                        (b"timing-allow-origin", b"*"),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            request_timer.reset(token)
+            endpoint = route_path(scope)
+            # Unmatched paths would give every 404 its own series
+            if endpoint is not None:
+                size = size_bucket(timer.pixels)
+                for name, seconds in timer.stages:
+                    stage_seconds.observe((endpoint, name, size), seconds)
+                request_seconds.observe(
+                    (endpoint, scope["method"], str(status), size), time.perf_counter() - timer.started
+                )
@@ -0,0 +1,263 @@
+import os
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+from Core.BufferPool import buffer_pool
+from Core.Memory import tracked
+
+# Lossless containers the stego result can be written in
+OUTPUT_FORMATS = {
+    "png": (".png", "image/png"),
+    "webp": (".webp", "image/webp"),
+    "tiff": (".tiff", "image/tiff"),
+    "bmp": (".bmp", "image/bmp"),
+}
+
+# Where the payload goes: pixel LSBs, written out in one of the lossless
+# formats above, or the quantized DCT coefficients of a JPEG carrier,
+# which is sent back as a JPEG
+EMBEDDINGS = ("pixels", "dct")
+JPEG_FORMATS = ("jpg", "jpeg")
+JPEG_EXTENSION, JPEG_MEDIA_TYPE = ".jpg", "image/jpeg"
+
+PNG_STRATEGIES = {
+    "default": cv2.IMWRITE_PNG_STRATEGY_DEFAULT,
+    "filtered": cv2.IMWRITE_PNG_STRATEGY_FILTERED,
+    "huffman": cv2.IMWRITE_PNG_STRATEGY_HUFFMAN_ONLY,
+    "rle": cv2.IMWRITE_PNG_STRATEGY_RLE,
+    "fixed": cv2.IMWRITE_PNG_STRATEGY_FIXED,
+}
+
+# Row filter selection needs OpenCV >= 4.10
+PNG_FILTERS = {
+    name: getattr(cv2, flag)
+    for name, flag in [
+        ("none", "IMWRITE_PNG_FILTER_NONE"),
+        ("sub", "IMWRITE_PNG_FILTER_SUB"),
+        ("up", "IMWRITE_PNG_FILTER_UP"),
+        ("avg", "IMWRITE_PNG_FILTER_AVG"),
+        ("paeth", "IMWRITE_PNG_FILTER_PAETH"),
+        ("fast", "IMWRITE_PNG_FAST_FILTERS"),
+        ("all", "IMWRITE_PNG_ALL_FILTERS"),
+    ]
+    if hasattr(cv2, flag)
+}
+
+TIFF_COMPRESSION_NONE = getattr(cv2, "IMWRITE_TIFF_COMPRESSION_NONE", 1)
+WEBP_LOSSLESS_QUALITY = 101
+
+CHUNK_SIZE = 256 * 1024
+
+OutputOptions = namedtuple("OutputOptions", ["format", "png_compression", "png_strategy", "png_filter"])
+
+
+def _env_or_none(name):
+    return os.environ.get(name) or None
+
+
+# Server-level defaults; request fields override them. Unset PNG settings
+# keep OpenCV's own defaults (fastest level, RLE strategy).
+DEFAULT_OPTIONS = OutputOptions(
+    format=os.environ.get("STEG_OUTPUT_FORMAT", "png"),
+    png_compression=int(os.environ["STEG_PNG_COMPRESSION"]) if _env_or_none("STEG_PNG_COMPRESSION") else None,
+    png_strategy=_env_or_none("STEG_PNG_STRATEGY"),
+    png_filter=_env_or_none("STEG_PNG_FILTER"),
+)
+
+
+def resolve_output_options(output_format=None, png_compression=None, png_strategy=None, png_filter=None):
+    """
+    Merge request-level output settings with the server defaults.
+    Raises 400 for unknown values.
+    """
+    options = OutputOptions(
+        format=(output_format or DEFAULT_OPTIONS.format).lower(),
+        png_compression=DEFAULT_OPTIONS.png_compression if png_compression is None else png_compression,
+        png_strategy=(png_strategy or DEFAULT_OPTIONS.png_strategy or "").lower() or None,
+        png_filter=(png_filter or DEFAULT_OPTIONS.png_filter or "").lower() or None,
+    )
+
+    if options.format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported output format. Use one of: {', '.join(OUTPUT_FORMATS)}")
+    if options.png_compression is not None and not 0 <= options.png_compression <= 9:
+        raise HTTPException(status_code=400, detail="png_compression must be between 0 and 9")
+    if options.png_strategy is not None and options.png_strategy not in PNG_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported PNG strategy. Use one of: {', '.join(PNG_STRATEGIES)}")
+    if options.png_filter is not None and options.png_filter not in PNG_FILTERS:
+        raise HTTPException(status_code=400, detail=f"Unsupported PNG filter. Use one of: {', '.join(PNG_FILTERS)}")
+    return options
+
+
+def resolve_embedding(embedding=None, output_format=None):
+    """
+    The embedding mode of an encode request. Raises 400 for unknown modes
+    and for dct with a format other than JPEG.
+    """
+    mode = (embedding or EMBEDDINGS[0]).lower()
+    if mode not in EMBEDDINGS:
+        raise HTTPException(status_code=400, detail=f"Unsupported embedding. Use one of: {', '.join(EMBEDDINGS)}")
+    if mode == "dct" and output_format and output_format.lower() not in JPEG_FORMATS:
+        raise HTTPException(status_code=400, detail="embedding=dct returns the JPEG carrier, leave output_format "
+                                                    "unset or use jpg")
+    return mode
+
+
+def encode_params(options):
+    if options.format == "png":
+        params = []
+        if options.png_compression is not None:
+            params += [cv2.IMWRITE_PNG_COMPRESSION, options.png_compression]
+        # Strategy goes after the level, which would otherwise reset it
+        if options.png_strategy is not None:
+            params += [cv2.IMWRITE_PNG_STRATEGY, PNG_STRATEGIES[options.png_strategy]]
+        if options.png_filter is not None:
+            params += [cv2.IMWRITE_PNG_FILTER, PNG_FILTERS[options.png_filter]]
+        return params
+    if options.format == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, WEBP_LOSSLESS_QUALITY]
+    if options.format == "tiff":
+        return [cv2.IMWRITE_TIFF_COMPRESSION, TIFF_COMPRESSION_NONE]
+    return []
+
+
+def encode_output(img, options):
+    """
+    Encode the stego result losslessly. Returns the encoded buffer or None.
+    """
+    extension, _ = OUTPUT_FORMATS[options.format]
+    success, encoded = cv2.imencode(extension, img, encode_params(options))
+    return encoded if success else None
+
+
+def output_extension(options):
+    return OUTPUT_FORMATS[options.format][0]
+
+
+def output_media_type(options):
+    return OUTPUT_FORMATS[options.format][1]
+
+
+RANGE_NOT_SATISFIABLE = (-1, -1)
+
+
+def parse_range(value, size):
+    """
+    (start, end) for a single `bytes=` range, end exclusive. None means
+    serve the whole body (no header, several ranges, or a form we don't
+    handle); RANGE_NOT_SATISFIABLE means answer 416.
+    """
+    unit, _, spec = (value or "").partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(last)), size
+    except ValueError:
+        return None
+    if end <= start and first:
+        # Last byte before the first one: invalid, so ignored
+        return None if last else RANGE_NOT_SATISFIABLE
+    if start >= size or end <= start:
+        return RANGE_NOT_SATISFIABLE
+    return start, min(end, size)
+
+
+class BufferResponse(Response):
+    """
+    Serve a finished buffer (bytes, memoryview, or the ndarray OpenCV
+    returns) in CHUNK_SIZE slices without copying it, with Content-Length
+    set. A single `Range: bytes=...` request gets a 206; If-Range is only
+    honoured when an `etag` is given, otherwise the full body is sent.
+    """
+
+    def __init__(self, data, status_code=200, headers=None, media_type=None, background=None, etag=None):
+        self.view = memoryview(data).cast("B")
+        self.etag = etag
+        super().__init__(None, status_code, headers, media_type, background)
+
+    def render(self, content):
+        # No body of our own, so init_headers leaves Content-Length to us
+        return None
+
+    def span(self, request_headers):
+        size = len(self.view)
+        if self.status_code != 200 or "range" not in request_headers:
+            return None
+        if_range = request_headers.get("if-range")
+        if if_range is not None and (self.etag is None or if_range.strip() != f'"{self.etag}"'):
+            return None
+        return parse_range(request_headers["range"], size)
+
+    async def __call__(self, scope, receive, send):
+        size = len(self.view)
+        headers = list(self.raw_headers) + [(b"accept-ranges", b"bytes")]
+        if self.etag is not None:
+            headers.append((b"etag", f'"{self.etag}"'.encode("latin-1")))
+
+        status, start, end = self.status_code, 0, size
+        span = self.span(Headers(scope=scope))
+        if span == RANGE_NOT_SATISFIABLE:
+            status, end = 416, 0
+            headers.append((b"content-range", f"bytes */{size}".encode("latin-1")))
+        elif span is not None:
+            status, (start, end) = 206, span
+            headers.append((b"content-range", f"bytes {start}-{end - 1}/{size}".encode("latin-1")))
+        headers.append((b"content-length", str(end - start).encode("latin-1")))
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if scope.get("method") == "HEAD":
+            end = start
+        for offset in range(start, end, CHUNK_SIZE):
+            await send({
+                "type": "http.response.body",
+                "body": self.view[offset:min(offset + CHUNK_SIZE, end)],
+                "more_body": True
+            })
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        if self.background is not None:
+            await self.background()
+
+
+def png_writer_args(options):
+    """
+    Core.PngWriter settings doing what OpenCV does for `options`. The
+    writer has every filter and strategy resolve_output_options accepts;
+    unset values take OpenCV's defaults: level 1, RLE, and the sub filter,
+    or libpng's adaptive filtering once a level is given.
+    """
+    if options.png_filter is not None:
+        filter_name = options.png_filter
+    else:
+        filter_name = "sub" if options.png_compression is None else "all"
+    return {
+        "level": 1 if options.png_compression is None else options.png_compression,
+        "strategy": options.png_strategy or "rle",
+        "filter_name": filter_name,
+    }
+
+
+def encode_output_blocks(blocks, options):
+    """
+    Encode an image given as consecutive row blocks, e.g. a private copy of
+    the touched rows followed by the shared rest of a cached carrier. The
+    blocks are joined into a pooled buffer for OpenCV, so the bytes match
+    encode_output of the whole image. Returns the encoded buffer or None.
+    """
+    shape = (sum(len(block) for block in blocks),) + blocks[0].shape[1:]
+    with buffer_pool.borrow(shape) as joined, tracked(joined.nbytes):
+        np.concatenate(blocks, out=joined)
+        encoded = encode_output(joined, options)
+    return None if encoded is None else encoded.reshape(-1)
@@ -0,0 +1,123 @@
+import struct
+import zlib
+
+import numpy as np
+
+from Core.ImageHeader import PNG_SIGNATURE
+
+FILTER_TYPES = {"none": 0, "sub": 1, "up": 2, "avg": 3, "paeth": 4}
+# Filter sets picked from row by row, as libpng does for OpenCV's
+# IMWRITE_PNG_FAST_FILTERS and IMWRITE_PNG_ALL_FILTERS
+ADAPTIVE_FILTERS = {"fast": (0, 1, 2), "all": (0, 1, 2, 3, 4)}
+
+# zlib strategies matching Core.Output.PNG_STRATEGIES names
+ZLIB_STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+STRIP_ROWS = 64
+IDAT_SIZE = 1024 * 1024
+
+
+def _chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+
+
+def filter_rows(rows, prior, filter_type, bpp=3):
+    """
+    Apply one PNG filter to a block of raw rows (n, stride). `prior` is the
+    raw row above the block (zeros for the first row). Encoding only looks
+    at raw bytes, so every filter vectorizes across the whole block.
+    """
+    count, stride = rows.shape
+    out = np.empty((count, stride + 1), dtype=np.uint8)
+    out[:, 0] = filter_type
+    body = out[:, 1:]
+
+    if filter_type == 0:
+        body[:] = rows
+        return out
+
+    up = np.empty_like(rows)
+    up[0] = prior
+    up[1:] = rows[:-1]
+
+    left = np.zeros_like(rows)
+    left[:, bpp:] = rows[:, :-bpp]
+
+    if filter_type == 1:
+        np.subtract(rows, left, out=body)
+    elif filter_type == 2:
+        np.subtract(rows, up, out=body)
+    elif filter_type == 3:
+        avg = ((left.astype(np.uint16) + up) >> 1).astype(np.uint8)
+        np.subtract(rows, avg, out=body)
+    else:
+        up_left = np.zeros_like(rows)
+        up_left[:, bpp:] = up[:, :-bpp]
+        a, b, c = left.astype(np.int16), up.astype(np.int16), up_left.astype(np.int16)
+        p = a + b - c
+        pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+        pred = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c)).astype(np.uint8)
+        np.subtract(rows, pred, out=body)
+    return out
+
+
+def adaptive_filter_rows(rows, prior, filter_types, bpp=3):
+    """
+    filter_rows with the filter chosen per row from `filter_types`: the
+    one whose output bytes, read as signed, have the smallest sum of
+    absolute values (libpng's heuristic).
+    """
+    candidates = np.stack([filter_rows(rows, prior, filter_type, bpp) for filter_type in filter_types])
+    scores = np.abs(candidates[:, :, 1:].view(np.int8).astype(np.int32)).sum(axis=2)
+    return candidates[scores.argmin(axis=0), np.arange(len(rows))]
+
+
+def iter_png(blocks, width, height, level=1, strategy="default", filter_name="sub", strip_rows=STRIP_ROWS):
+    """
+    Stream a 8-bit RGB PNG from BGR row blocks of shape (n, width, 3) that
+    together cover `height` rows. Only one strip is filtered at a time, so
+    the blocks can be read-only views of a shared or memory-mapped image.
+    """
+    filter_types = ADAPTIVE_FILTERS.get(filter_name) or (FILTER_TYPES[filter_name],)
+    stride = width * 3
+
+    yield PNG_SIGNATURE
+    yield _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    deflater = zlib.compressobj(level, zlib.DEFLATED, 15, 8, ZLIB_STRATEGIES[strategy])
+    pending = []
+    pending_size = 0
+    prior = np.zeros(stride, dtype=np.uint8)
+    written = 0
+
+    for block in blocks:
+        for start in range(0, len(block), strip_rows):
+            # BGR to RGB for this strip only
+            rows = np.ascontiguousarray(block[start:start + strip_rows, :, ::-1]).reshape(-1, stride)
+            if len(filter_types) == 1:
+                filtered = filter_rows(rows, prior, filter_types[0])
+            else:
+                filtered = adaptive_filter_rows(rows, prior, filter_types)
+            prior = rows[-1].copy()
+            written += len(rows)
+
+            data = deflater.compress(filtered)
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+            if pending_size >= IDAT_SIZE:
+                yield _chunk(b"IDAT", b"".join(pending))
+                pending, pending_size = [], 0
+
+    if written != height:
+        raise ValueError(f"PNG blocks cover {written} rows, expected {height}")
+
+    pending.append(deflater.flush())
+    yield _chunk(b"IDAT", b"".join(pending))
+    yield _chunk(b"IEND", b"")
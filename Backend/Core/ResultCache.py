@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from starlette.concurrency import run_in_threadpool
+
+from Core.Metrics import stage
+
+MB = 1024 * 1024
+
+
+def write_atomic(path, data, mode="wb"):
+    """
+    Write `data` to a uniquely named temp file next to `path`, then rename
+    it over `path`: concurrent writers (threads, or workers sharing the
+    folder) never share a temp file, and readers never see a partial one.
+    """
+    with tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path), prefix=".", suffix=".tmp",
+                                     delete=False) as f:
+        tmp_path = f.name
+        try:
+            f.write(data)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
+
+
+class ResultCache:
+    """
+    Content-addressed cache of finished results (encoded images and
+    extracted payloads). A memory LRU sits in front of an on-disk store;
+    both evict least recently used entries once over their byte budget.
+
+    The disk tier is off unless STEG_CACHE_DIR names a folder for it:
+    results include extracted secrets, which shouldn't land under a
+    predictable path in a shared temp folder. The folder is created
+    private to the server's user.
+
+    Each process keeps its own index of the disk store. Entries another
+    worker wrote are picked up on a miss, but each process enforces the
+    disk budget over the entries it knows, so N workers sharing
+    STEG_CACHE_DIR may together use up to N times STEG_CACHE_DISK_MB.
+    """
+
+    def __init__(self, memory_bytes, disk_dir=None, disk_bytes=0):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes if disk_dir else 0
+
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # key -> (data, meta)
+        self.memory_used = 0
+        self.disk = OrderedDict()  # key -> size on disk
+        self.disk_used = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if self.disk_bytes:
+            os.makedirs(self.disk_dir, mode=0o700, exist_ok=True)
+            self._load_disk_index()
+
+    @classmethod
+    def from_env(cls):
+        if os.environ.get("STEG_CACHE_ENABLED", "1") == "0":
+            return cls(0)
+        return cls(
+            memory_bytes=int(float(os.environ.get("STEG_CACHE_MEMORY_MB", "256")) * MB),
+            disk_dir=os.environ.get("STEG_CACHE_DIR") or None,
+            disk_bytes=int(float(os.environ.get("STEG_CACHE_DISK_MB", "2048")) * MB),
+        )
+
+    @property
+    def enabled(self):
+        return self.memory_bytes > 0 or self.disk_bytes > 0
+
+    def make_key(self, endpoint, *parts):
+        """
+        Key a result by endpoint, the hash of every uploaded buffer and the
+        repr of every option that changes the output, the selected backend
+        included, so a restart with another backend doesn't serve the old
+        one's results from disk.
+        """
+        h = hashlib.blake2b(endpoint.encode(), digest_size=32)
+        for part in parts:
+            if isinstance(part, (bytes, bytearray, memoryview)):
+                h.update(b"b" + hashlib.blake2b(part, digest_size=32).digest())
+            else:
+                h.update(b"o" + repr(part).encode())
+        return h.hexdigest()
+
+    # Memory tier
+
+    def _memory_get(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+            return entry
+
+    def _memory_put(self, key, data, meta):
+        size = len(data)
+        if size > self.memory_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory_used -= len(self.memory.pop(key)[0])
+            self.memory[key] = (data, meta)
+            self.memory_used += size
+            while self.memory_used > self.memory_bytes:
+                _, (old, _) = self.memory.popitem(last=False)
+                self.memory_used -= len(old)
+                self.evictions += 1
+
+    # Disk tier
+
+    def _paths(self, key):
+        folder = os.path.join(self.disk_dir, key[:2])
+        return os.path.join(folder, key + ".bin"), os.path.join(folder, key + ".json")
+
+    def _load_disk_index(self):
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".bin"):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_used += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self.disk_used > self.disk_bytes and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_used -= size
+            self.disk_evictions += 1
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _disk_get(self, key):
+        data_path, meta_path = self._paths(key)
+        with self.lock:
+            known = key in self.disk
+            if known:
+                self.disk.move_to_end(key)
+        if not known:
+            # Another worker may have written it since this index was built
+            try:
+                size = os.stat(data_path).st_size
+            except OSError:
+                return None
+            with self.lock:
+                self.disk_used += size - self.disk.pop(key, 0)
+                self.disk[key] = size
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(data_path, "rb") as f:
+                data = f.read()
+        except (OSError, ValueError):
+            with self.lock:
+                self.disk_used -= self.disk.pop(key, 0)
+            return None
+        os.utime(data_path)
+        return data, meta
+
+    def _disk_put(self, key, data, meta):
+        size = len(data)
+        if size > self.disk_bytes:
+            return
+        data_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        # Meta first: once the data file exists, readers can rely on both
+        write_atomic(meta_path, json.dumps(meta), "w")
+        write_atomic(data_path, data)
+        with self.lock:
+            self.disk_used += size - self.disk.pop(key, 0)
+            self.disk[key] = size
+            self._evict_disk()
+
+    # Public API
+
+    def lookup(self, key):
+        entry = self._memory_get(key) if self.memory_bytes else None
+        from_disk = False
+        if entry is None and self.disk_bytes:
+            entry = self._disk_get(key)
+            from_disk = entry is not None
+
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += from_disk
+        if from_disk:
+            self._memory_put(key, *entry)
+        return entry
+
+    def store(self, key, data, meta):
+        # Results are never written to after they're made, so the memory
+        # tier keeps the encoder's own buffer rather than a copy
+        data = memoryview(data).cast("B").toreadonly()
+        if self.memory_bytes:
+            self._memory_put(key, data, meta)
+        if self.disk_bytes:
+            self._disk_put(key, data, meta)
+
+    async def key(self, endpoint, *parts):
+        if not self.enabled:
+            return None
+        # Hashing multi-MB uploads releases the GIL, keep it off the loop
+        return await run_in_threadpool(self.make_key, endpoint, *parts)
+
+    async def get(self, key):
+        """
+        Return (data, meta) for a cached result, or None.
+        """
+        if key is None:
+            return None
+        with stage("cache_lookup"):
+            return await run_in_threadpool(self.lookup, key)
+
+    async def put(self, key, data, meta=None):
+        if key is not None:
+            await run_in_threadpool(self.store, key, data, meta or {})
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory_used,
+            "memory_limit_bytes": self.memory_bytes,
+            "disk_entries": len(self.disk),
+            "disk_bytes": self.disk_used,
+            "disk_limit_bytes": self.disk_bytes,
+        }
+
+
+result_cache = ResultCache.from_env()
@@ -0,0 +1,260 @@
+import struct
+import zlib
+
+import cv2
+import numpy as np
+
+from Core.ImageHeader import PNG_SIGNATURE, read_header
+
+# PNG colour types we can expand to BGR the same way cv2.IMREAD_COLOR does
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def _png_chunks(data):
+    pos = 8
+    size = len(data)
+    while pos + 8 <= size:
+        length = struct.unpack(">I", data[pos:pos + 4])[0]
+        kind = bytes(data[pos + 4:pos + 8])
+        yield kind, data[pos + 8:pos + 8 + length]
+        if kind == b"IEND":
+            return
+        pos += 12 + length
+
+
+def _chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+
+
+def _png_rows(data, count):
+    width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", data[16:29])
+    # Interlaced, sub-byte and 16-bit images go through the full decoder
+    if depth != 8 or interlace != 0 or color_type not in PNG_CHANNELS:
+        return None
+
+    count = min(count, height)
+    stride = width * PNG_CHANNELS[color_type]
+    needed = count * (stride + 1)
+
+    # Ancillary chunks (palette, transparency, ...) are copied as they are
+    ancillary = []
+    raw = bytearray()
+    inflater = zlib.decompressobj()
+    for kind, body in _png_chunks(data):
+        if kind == b"eXIf":
+            # libpng would rotate the full image, so rows would not line up
+            return None
+        if kind == b"IDAT":
+            raw += inflater.decompress(body, needed - len(raw))
+            # Drain whatever the inflater held back for lack of output room
+            while len(raw) < needed and inflater.unconsumed_tail:
+                raw += inflater.decompress(inflater.unconsumed_tail, needed - len(raw))
+            if len(raw) >= needed:
+                break
+        elif kind == b"IEND":
+            break
+        elif kind != b"IHDR" and not raw:
+            ancillary.append(_chunk(kind, bytes(body)))
+
+    if len(raw) < needed:
+        return None
+
+    # Rewrap the inflated rows as a `count` row PNG (stored, not deflated)
+    # and let libpng unfilter and expand them to BGR as the full decode would
+    ihdr = bytearray(data[16:29])
+    ihdr[4:8] = struct.pack(">I", count)
+    stub = b"".join([
+        PNG_SIGNATURE,
+        _chunk(b"IHDR", bytes(ihdr)),
+        *ancillary,
+        _chunk(b"IDAT", zlib.compress(raw, 0)),
+        _chunk(b"IEND", b"")
+    ])
+    del raw
+    return cv2.imdecode(np.frombuffer(stub, np.uint8), cv2.IMREAD_COLOR)
+
+
+def _bmp_pixels(data):
+    """
+    Zero-copy (height, width, 3) top-down BGR view of an uncompressed
+    24/32-bit BMP, or None for other layouts.
+    """
+    offset = struct.unpack("<I", data[10:14])[0]
+    header_size = struct.unpack("<I", data[14:18])[0]
+    if header_size < 40:
+        return None
+    width, height, _, bpp, compression = struct.unpack("<iiHHI", data[18:34])
+    if compression != 0 or bpp not in (24, 32) or width <= 0 or height == 0:
+        return None
+
+    top_down = height < 0
+    height = abs(height)
+    pixel_bytes = bpp // 8
+    stride = (width * pixel_bytes + 3) & ~3
+    if offset + stride * height > len(data):
+        return None
+
+    stored = np.frombuffer(data, dtype=np.uint8, count=stride * height, offset=offset).reshape(height, stride)
+    pixels = stored[:, :width * pixel_bytes].reshape(height, width, pixel_bytes)[:, :, :3]
+    return pixels if top_down else pixels[::-1]
+
+
+def _bmp_rows(data, count):
+    pixels = _bmp_pixels(data)
+    return None if pixels is None else pixels[:count].copy()
+
+
+def bmp_pixels(data):
+    """
+    Zero-copy BGR view of a whole uncompressed BMP, the pixels
+    cv2.IMREAD_COLOR would produce, or None for other formats.
+    """
+    try:
+        if bytes(data[:2]) == b"BM":
+            return _bmp_pixels(data)
+    except (struct.error, ValueError):
+        return None
+    return None
+
+
+def read_rows(data, count):
+    """
+    Decode only the first `count` rows of an image, as the BGR pixels
+    cv2.IMREAD_COLOR would produce. Returns None for formats or layouts
+    that need the full decoder.
+    """
+    try:
+        if bytes(data[:8]) == PNG_SIGNATURE:
+            return _png_rows(data, count)
+        if bytes(data[:2]) == b"BM":
+            return _bmp_rows(data, count)
+    except (struct.error, zlib.error, ValueError):
+        return None
+    return None
+
+
+# Colour types the strip reader handles; IMREAD_UNCHANGED gives back the
+# raw row for these, which seeds the next strip's filters
+STRIP_COLOR_TYPES = (0, 2, 6)
+
+
+def _png_strips(data, strip_rows):
+    width, height, depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", data[16:29])
+    if depth != 8 or interlace != 0 or color_type not in STRIP_COLOR_TYPES:
+        return None
+    chunks = list(_png_chunks(data))
+    if any(kind == b"eXIf" for kind, _ in chunks):
+        return None
+
+    stride = width * PNG_CHANNELS[color_type]
+    ihdr = bytearray(data[16:29])
+    idat = (body for kind, body in chunks if kind == b"IDAT")
+
+    def strips():
+        inflater = zlib.decompressobj()
+        pending = bytearray()
+        prior = None
+
+        for y in range(0, height, strip_rows):
+            count = min(strip_rows, height - y)
+            needed = count * (stride + 1)
+            while len(pending) < needed:
+                if inflater.unconsumed_tail:
+                    pending += inflater.decompress(inflater.unconsumed_tail, needed - len(pending))
+                    continue
+                body = next(idat, None)
+                if body is None:
+                    raise ValueError("PNG image data ends early")
+                pending += inflater.decompress(body, needed - len(pending))
+
+            # The previous strip's last row goes in unfiltered, so Up, Avg
+            # and Paeth rows see the right row above them
+            raw = pending[:needed]
+            del pending[:needed]
+            if prior is not None:
+                raw[0:0] = b"\x00" + prior
+            ihdr[4:8] = struct.pack(">I", count + (prior is not None))
+            stub = b"".join([
+                PNG_SIGNATURE,
+                _chunk(b"IHDR", bytes(ihdr)),
+                _chunk(b"IDAT", zlib.compress(raw, 0)),
+                _chunk(b"IEND", b"")
+            ])
+            del raw
+            rows = cv2.imdecode(np.frombuffer(stub, np.uint8), cv2.IMREAD_UNCHANGED)
+            if rows is None:
+                raise ValueError("Invalid PNG image data")
+            rows = rows.reshape(count + (prior is not None), width, -1)
+            if prior is not None:
+                rows = rows[1:]
+
+            # Back to PNG channel order for the next strip, and on to BGR
+            # the way cv2.IMREAD_COLOR expands it
+            if color_type == 0:
+                prior = rows[-1].tobytes()
+                yield y, np.repeat(rows, 3, axis=2)
+            elif color_type == 2:
+                prior = rows[-1, :, ::-1].tobytes()
+                yield y, rows
+            else:
+                prior = rows[-1][:, [2, 1, 0, 3]].tobytes()
+                yield y, np.ascontiguousarray(rows[..., :3])
+
+    return width, height, strips()
+
+
+def _bmp_strips(data, strip_rows):
+    pixels = _bmp_pixels(data)
+    if pixels is None:
+        return None
+    height, width = pixels.shape[:2]
+    return width, height, ((y, pixels[y:y + strip_rows]) for y in range(0, height, strip_rows))
+
+
+def iter_strips(data, strip_rows):
+    """
+    Walk an image top to bottom in strips of `strip_rows` BGR rows without
+    decoding all of it at once. Returns (width, height, strips), where
+    strips yields (first row, rows); BMP strips are read-only views of
+    `data`. Returns None for formats or layouts that need the full decoder.
+    """
+    try:
+        if bytes(data[:8]) == PNG_SIGNATURE:
+            return _png_strips(data, strip_rows)
+        if bytes(data[:2]) == b"BM":
+            return _bmp_strips(data, strip_rows)
+    except (struct.error, ValueError):
+        return None
+    return None
+
+
+def read_payload_rows(data):
+    """
+    Decode only the rows that hold an LSB payload: the 64-bit big-endian
+    length in bit 0 of the first 64 channel values, then length * 8 bits.
+    Returns None when the image needs the full decoder, including when the
+    length is garbage or the payload spills past bit plane 0.
+    """
+    header = read_header(data)
+    if header is None:
+        return None
+
+    row_slots = header.width * header.channels
+    slots = header.height * row_slots
+    if slots <= 64:
+        return None
+
+    head = read_rows(data, -(-64 // row_slots))
+    if head is None:
+        return None
+
+    length = int.from_bytes(np.packbits(head.reshape(-1)[:64] & 1).tobytes(), "big")
+    if 64 + length * 8 > slots:
+        return None
+
+    count = -(-(64 + length * 8) // row_slots)
+    if count >= header.height:
+        return None
+    if count <= len(head):
+        return head
+    return read_rows(data, count)
@@ -0,0 +1,224 @@
+"""
+Sweep many images for LSB payloads, reading only the rows that hold the
+length prefix and the head of the payload.
+
+Run from the Backend directory:
+    python -m Core.Scan /srv/images --workers 8 > results.ndjson
+    python -m Core.Scan uploads.zip --full-decode
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from Core.Detect import detect, detect_bytes
+from Core.Steg import TEXT_BACKEND, get_backend
+
+# Directories /scan may read; empty disables directory scans over HTTP
+SCAN_ROOTS = [os.path.realpath(root) for root in os.environ.get("STEG_SCAN_ROOTS", "").split(os.pathsep) if root]
+SCAN_MAX_FILES = int(os.environ.get("STEG_SCAN_MAX_FILES", "100000"))
+
+# Files per pooled job, so tens of thousands of files don't mean tens of
+# thousands of pool hand-offs
+SCAN_CHUNK = int(os.environ.get("STEG_SCAN_CHUNK", "32"))
+
+IMAGE_EXTENSIONS = (".png", ".bmp", ".dib", ".tif", ".tiff", ".webp", ".jpg", ".jpeg", ".jpe")
+
+
+def text_capacity(width, height, channels):
+    # The largest valid length: the /text backend's capacity
+    return get_backend(TEXT_BACKEND).capacity(width, height, channels)
+
+
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def under_root(path, roots):
+    real = os.path.realpath(path)
+    return any(real == root or real.startswith(root + os.sep) for root in roots)
+
+
+def list_files(directory, recursive=True, all_files=False, roots=None, limit=SCAN_MAX_FILES):
+    """
+    Paths relative to `directory`, sorted per folder. Symlinks leading out
+    of `roots` are skipped. Raises ValueError past `limit` files.
+    """
+    found = []
+    for folder, subfolders, files in os.walk(directory):
+        subfolders.sort()
+        if not recursive:
+            subfolders.clear()
+        for name in sorted(files):
+            path = os.path.join(folder, name)
+            if not (all_files or is_image_name(name)):
+                continue
+            if roots is not None and not under_root(path, roots):
+                continue
+            found.append(os.path.relpath(path, directory))
+            if len(found) > limit:
+                raise ValueError(f"More than {limit} files to scan, narrow the directory")
+    return found
+
+
+def full_detect(data):
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    height, width, channels = img.shape
+    if img.size < 64:
+        return None
+    return (width, height, channels), detect(img.reshape(-1), text_capacity(width, height, channels))
+
+
+def scan_bytes(name, data, full_decode=False):
+    """
+    One NDJSON record for an image. Formats without a row reader are
+    skipped unless `full_decode`.
+    """
+    record = {"path": name, "bytes": len(data)}
+    try:
+        found = detect_bytes(data, text_capacity)
+        method = "rows"
+        if found is not None:
+            header, detection = found
+            size = (header.width, header.height, header.channels)
+        elif full_decode:
+            method = "full"
+            found = full_detect(data)
+            if found is None:
+                return {**record, "has_data": None, "error": "Not a readable image"}
+            size, detection = found
+        else:
+            return {**record, "has_data": None, "skipped": "Format needs a full decode (pass full_decode)"}
+    except Exception as e:
+        return {**record, "has_data": None, "error": f"Error: {str(e)}"}
+
+    record.update({
+        "has_data": detection.has_data,
+        "size": detection.length if detection.has_data else 0,
+        "file_type": detection.file_type.name if detection.has_data else None,
+        "content_type": detection.file_type.content_type if detection.has_data else None,
+        "compression": detection.compression if detection.has_data else None,
+        "confidence": detection.confidence,
+        "dimensions": f"{size[0]}x{size[1]}",
+        "method": method,
+    })
+    return record
+
+
+def _map_file(path):
+    # Only the pages the row reader touches get read from disk
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def scan_paths(directory, names, full_decode=False):
+    records = []
+    for name in names:
+        try:
+            data = _map_file(os.path.join(directory, name))
+        except OSError as e:
+            records.append({"path": name, "has_data": None, "error": f"Error: {e.strerror or str(e)}"})
+            continue
+        try:
+            records.append(scan_bytes(name, memoryview(data), full_decode))
+        finally:
+            if isinstance(data, mmap.mmap):
+                try:
+                    data.close()
+                except BufferError:
+                    # A view is still alive somewhere; the GC will unmap it
+                    pass
+    return records
+
+
+def scan_members(members, full_decode=False):
+    # (name, bytes) pairs already read out of an archive
+    return [scan_bytes(name, data, full_decode) for name, data in members]
+
+
+def chunks(items, size=SCAN_CHUNK):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class ScanSummary:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.scanned = 0
+        self.with_data = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def add(self, record):
+        self.scanned += 1
+        if record.get("has_data"):
+            self.with_data += 1
+        elif "skipped" in record:
+            self.skipped += 1
+        elif "error" in record:
+            self.errors += 1
+
+    def record(self):
+        elapsed = time.perf_counter() - self.started
+        return {"summary": {
+            "scanned": self.scanned,
+            "with_data": self.with_data,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 3),
+            "files_per_s": round(self.scanned / elapsed, 1) if elapsed > 0 else None,
+        }}
+
+
+def ndjson(record):
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def scan_archive_members(path, names, full_decode=False):
+    with zipfile.ZipFile(path) as archive:
+        return [scan_bytes(name, archive.read(name), full_decode) for name in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Directory or zip archive to scan")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--full-decode", action="store_true", help="Fully decode formats without a row reader")
+    parser.add_argument("--all-files", action="store_true", help="Scan every file, not just image extensions")
+    parser.add_argument("--no-recursive", action="store_true")
+    parser.add_argument("--with-data-only", action="store_true", help="Only print files that hold a payload")
+    args = parser.parse_args()
+
+    if zipfile.is_zipfile(args.path) and not os.path.isdir(args.path):
+        with zipfile.ZipFile(args.path) as archive:
+            names = [info.filename for info in archive.infolist()
+                     if not info.is_dir() and (args.all_files or is_image_name(info.filename))]
+        job = scan_archive_members
+    else:
+        names = list_files(args.path, not args.no_recursive, args.all_files, limit=sys.maxsize)
+        job = scan_paths
+
+    summary = ScanSummary()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(job, args.path, chunk, args.full_decode) for chunk in chunks(names)]
+        for future in as_completed(futures):
+            for record in future.result():
+                summary.add(record)
+                if record.get("has_data") or not args.with_data_only:
+                    sys.stdout.write(ndjson(record))
+            sys.stdout.flush()
+    sys.stdout.write(ndjson(summary.record()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from collections import namedtuple
+
+import numpy as np
+
+FileType = namedtuple("FileType", ["name", "content_type", "extensions", "confidence"])
+
+UNKNOWN = FileType("unknown", "application/octet-stream", (".bin",), 0.0)
+
+# Enough for every signature below (tar's sits at 257)
+SNIFF_BYTES = 512
+
+# name, content type, extensions (first is the default), and the
+# (offset, bytes) pairs that must all match
+MAGIC_TABLE = [
+    ("png", "image/png", (".png",), ((0, b"\x89PNG\r\n\x1a\n"),)),
+    ("jpeg", "image/jpeg", (".jpg", ".jpeg"), ((0, b"\xff\xd8\xff"),)),
+    ("gif", "image/gif", (".gif",), ((0, b"GIF87a"),)),
+    ("gif", "image/gif", (".gif",), ((0, b"GIF89a"),)),
+    ("webp", "image/webp", (".webp",), ((0, b"RIFF"), (8, b"WEBP"))),
+    ("bmp", "image/bmp", (".bmp",), ((0, b"BM"), (6, b"\x00\x00\x00\x00"))),
+    ("tiff", "image/tiff", (".tiff", ".tif"), ((0, b"II*\x00"),)),
+    ("tiff", "image/tiff", (".tiff", ".tif"), ((0, b"MM\x00*"),)),
+    ("ico", "image/x-icon", (".ico",), ((0, b"\x00\x00\x01\x00"),)),
+    ("psd", "image/vnd.adobe.photoshop", (".psd",), ((0, b"8BPS"),)),
+    ("jpeg2000", "image/jp2", (".jp2",), ((0, b"\x00\x00\x00\x0cjP  \r\n\x87\n"),)),
+    ("jpegxl", "image/jxl", (".jxl",), ((0, b"\x00\x00\x00\x0cJXL \r\n\x87\n"),)),
+    ("jpegxl", "image/jxl", (".jxl",), ((0, b"\xff\x0a"),)),
+    ("avif", "image/avif", (".avif",), ((4, b"ftypavif"),)),
+    ("heic", "image/heic", (".heic",), ((4, b"ftypheic"),)),
+    ("exr", "image/x-exr", (".exr",), ((0, b"\x76\x2f\x31\x01"),)),
+    ("dicom", "application/dicom", (".dcm",), ((128, b"DICM"),)),
+    ("svg", "image/svg+xml", (".svg",), ((0, b"<svg"),)),
+    ("pdf", "application/pdf", (".pdf",), ((0, b"%PDF-"),)),
+    ("postscript", "application/postscript", (".ps", ".eps"), ((0, b"%!PS"),)),
+    ("rtf", "application/rtf", (".rtf",), ((0, b"{\\rtf1"),)),
+    ("xml", "application/xml", (".xml",), ((0, b"<?xml"),)),
+    ("html", "text/html", (".html", ".htm"), ((0, b"<!DOCTYPE html"),)),
+    ("html", "text/html", (".html", ".htm"), ((0, b"<html"),)),
+    ("zip", "application/zip", (".zip", ".docx", ".xlsx", ".pptx", ".jar", ".apk", ".odt"), ((0, b"PK\x03\x04"),)),
+    ("zip", "application/zip", (".zip",), ((0, b"PK\x05\x06"),)),
+    ("gzip", "application/gzip", (".gz", ".tgz"), ((0, b"\x1f\x8b\x08"),)),
+    ("bzip2", "application/x-bzip2", (".bz2",), ((0, b"BZh"),)),
+    ("xz", "application/x-xz", (".xz",), ((0, b"\xfd7zXZ\x00"),)),
+    ("zstd", "application/zstd", (".zst",), ((0, b"\x28\xb5\x2f\xfd"),)),
+    ("lz4", "application/x-lz4", (".lz4",), ((0, b"\x04\x22\x4d\x18"),)),
+    ("7z", "application/x-7z-compressed", (".7z",), ((0, b"7z\xbc\xaf\x27\x1c"),)),
+    ("rar", "application/vnd.rar", (".rar",), ((0, b"Rar!\x1a\x07"),)),
+    ("tar", "application/x-tar", (".tar",), ((257, b"ustar"),)),
+    ("mp3", "audio/mpeg", (".mp3",), ((0, b"ID3"),)),
+    ("wav", "audio/wav", (".wav",), ((0, b"RIFF"), (8, b"WAVE"))),
+    ("avi", "video/x-msvideo", (".avi",), ((0, b"RIFF"), (8, b"AVI "))),
+    ("ogg", "audio/ogg", (".ogg", ".oga", ".opus"), ((0, b"OggS"),)),
+    ("flac", "audio/flac", (".flac",), ((0, b"fLaC"),)),
+    ("midi", "audio/midi", (".mid", ".midi"), ((0, b"MThd"),)),
+    ("mov", "video/quicktime", (".mov",), ((4, b"ftypqt  "),)),
+    ("mp4", "video/mp4", (".mp4", ".m4a", ".m4v"), ((4, b"ftyp"),)),
+    ("matroska", "video/x-matroska", (".mkv", ".webm"), ((0, b"\x1a\x45\xdf\xa3"),)),
+    ("woff", "font/woff", (".woff",), ((0, b"wOFF"),)),
+    ("woff2", "font/woff2", (".woff2",), ((0, b"wOF2"),)),
+    ("otf", "font/otf", (".otf",), ((0, b"OTTO"),)),
+    ("ttf", "font/ttf", (".ttf",), ((0, b"\x00\x01\x00\x00\x00"),)),
+    ("sqlite", "application/vnd.sqlite3", (".sqlite", ".db"), ((0, b"SQLite format 3\x00"),)),
+    ("elf", "application/x-elf", (".elf", ".so"), ((0, b"\x7fELF"),)),
+    ("pe", "application/vnd.microsoft.portable-executable", (".exe", ".dll"), ((0, b"MZ"),)),
+    ("macho", "application/x-mach-binary", (".macho",), ((0, b"\xcf\xfa\xed\xfe"),)),
+    ("java-class", "application/java-vm", (".class",), ((0, b"\xca\xfe\xba\xbe"),)),
+    ("wasm", "application/wasm", (".wasm",), ((0, b"\x00asm"),)),
+    ("pcap", "application/vnd.tcpdump.pcap", (".pcap",), ((0, b"\xd4\xc3\xb2\xa1"),)),
+    ("pgp", "application/pgp-encrypted", (".gpg", ".asc"), ((0, b"-----BEGIN PGP"),)),
+    ("pem", "application/x-pem-file", (".pem",), ((0, b"-----BEGIN "),)),
+    # Multi-file payloads from /container/encode
+    ("steg-container", "application/x-steg-container", (".sgc",), ((0, b"SGC\x00"),)),
+]
+
+# Most specific first, so RIFF/WAVE wins over a bare RIFF and a known
+# ftyp brand over the generic one
+MAGIC_TABLE.sort(key=lambda entry: -sum(len(magic) for _, magic in entry[3]))
+
+# Byte values allowed in text: printable ASCII, tab, LF, FF, CR, and
+# anything with the high bit set (UTF-8 sequences are checked separately)
+TEXT_BYTES = np.zeros(256, dtype=bool)
+TEXT_BYTES[32:127] = True
+TEXT_BYTES[[9, 10, 12, 13]] = True
+TEXT_BYTES[128:] = True
+
+
+def magic_confidence(matched):
+    # A 2-byte match (MZ, BM) is weak evidence, an 8-byte one (PNG) strong
+    return round(min(0.99, 0.5 + 0.06 * matched), 3)
+
+
+def sniff_text(head):
+    if not head:
+        return UNKNOWN
+    if not TEXT_BYTES[np.frombuffer(head, dtype=np.uint8)].all():
+        return UNKNOWN
+    try:
+        text = head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # The sample may stop part way into a multi-byte character
+        if e.reason != "unexpected end of data":
+            return UNKNOWN
+        text = head[:e.start].decode("utf-8")
+
+    # Short samples say less about what the rest of the file is
+    confidence = round(0.5 + 0.4 * min(1.0, len(head) / 64), 3)
+    stripped = text.lstrip()
+    if stripped[:1] in ("{", "["):
+        return FileType("json", "application/json", (".json",), confidence)
+    return FileType("text", "text/plain", (".txt",), confidence)
+
+
+def sniff(head):
+    """
+    Identify a file from its first bytes (SNIFF_BYTES is enough). Returns
+    a FileType; UNKNOWN with confidence 0 when nothing matches.
+    """
+    head = bytes(head[:SNIFF_BYTES])
+    for name, content_type, extensions, checks in MAGIC_TABLE:
+        if all(head[offset:offset + len(magic)] == magic for offset, magic in checks):
+            matched = sum(len(magic) for _, magic in checks)
+            return FileType(name, content_type, extensions, magic_confidence(matched))
+    return sniff_text(head)
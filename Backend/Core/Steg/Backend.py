@@ -0,0 +1,149 @@
+import inspect
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from Core.Steg.Parallel import read_payload, write_payload
+
+
+class SteganographyException(Exception):
+    pass
+
+
+def bits_to_int(bits):
+    # MSB first; images under 64 slots give a shorter, zero-padded prefix
+    pad = -len(bits) % 8
+    if pad:
+        bits = np.concatenate((np.zeros(pad, dtype=np.uint8), bits))
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class LSBBackend(ABC):
+    """
+    Base for the embedding backends. Every layout starts with a 64-bit
+    big-endian payload length in bit 0 of the first 64 channel values,
+    followed by the payload bits; backends differ in where bits may go
+    once bit 0 is full, and in how they bound the length.
+
+    Backends work in place on the image they are given. capacity,
+    write_bits, read_bits and payload_bits are abstract: a backend
+    missing one can't be registered or instantiated.
+    """
+
+    name = None
+    description = ""
+    # Bit planes the payload may occupy, low bit first
+    planes = 1
+    # Pure numpy unless a subclass says otherwise
+    native = False
+
+    def __init__(self, im):
+        self.image = im
+        self.height, self.width, self.nbchannels = im.shape
+        self.size = self.width * self.height
+
+        # Flatten image for faster access; every channel value is a slot
+        self.flat_image = im.reshape(-1)
+        self.slots = len(self.flat_image)
+
+    @classmethod
+    @abstractmethod
+    def capacity(cls, width, height, channels):
+        """
+        Largest payload in bytes this backend embeds in such an image.
+        """
+
+    @classmethod
+    def available(cls):
+        # Backends with optional dependencies report False when missing
+        return True
+
+    @classmethod
+    def capabilities(cls):
+        return {
+            "name": cls.name,
+            "description": cls.description,
+            "planes": cls.planes,
+            "native": cls.native,
+            "available": cls.available(),
+        }
+
+    @abstractmethod
+    def write_bits(self, start, bits):
+        pass
+
+    @abstractmethod
+    def read_bits(self, start, count):
+        pass
+
+    @classmethod
+    @abstractmethod
+    def payload_bits(cls, read_bits, slots):
+        """
+        How many payload bits follow the length prefix, given a reader for
+        stream bits [start, start + count) of an image with `slots`
+        channel values; 0 when the prefix isn't a valid length. Carries
+        the backend's length rules for every reader: whole images, the
+        strip reader and the container index.
+        """
+
+    @classmethod
+    def extract(cls, read_bits, slots, parallel=False):
+        """
+        The payload. `parallel` lets large payloads be read by several
+        threads; the reader must then be safe to call concurrently.
+        """
+        count = cls.payload_bits(read_bits, slots)
+        if not count:
+            return b""
+        return cls.read_payload(read_bits, 64, count, parallel)
+
+    @staticmethod
+    def read_payload(read_bits, start, count, parallel):
+        if parallel:
+            return read_payload(read_bits, start, count)
+        return np.packbits(read_bits(start, count)).tobytes()
+
+    def encode_binary(self, data):
+        data_len = len(data)
+        if data_len > self.capacity(self.width, self.height, self.nbchannels):
+            raise SteganographyException("Carrier image not big enough to hold all the data")
+
+        len_bits = np.unpackbits(np.frombuffer(data_len.to_bytes(8, "big"), dtype=np.uint8))
+        self.write_bits(0, len_bits)
+        # Chunks of one plane touch disjoint slots; planes go one at a time
+        write_payload(self.write_bits, 64, data, self.slots if self.planes > 1 else None)
+        return self.image
+
+    def decode_binary(self):
+        return self.extract(self.read_bits, self.slots, parallel=True)
+
+
+BACKENDS = {}
+
+
+def register_backend(cls):
+    """
+    Class decorator adding a backend to the registry under `cls.name`.
+    Raises TypeError for a class that leaves abstract methods open.
+    """
+    if inspect.isabstract(cls):
+        missing = ", ".join(sorted(cls.__abstractmethods__))
+        raise TypeError(f"Backend {cls.__name__} does not implement {missing}")
+    if not cls.name:
+        raise TypeError(f"Backend {cls.__name__} has no name")
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def get_backend(name):
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown steganography backend {name!r}, use one of: {', '.join(BACKENDS)}")
+    if not backend.available():
+        raise ValueError(f"Steganography backend {name!r} is not available in this build")
+    return backend
+
+
+def backend_info():
+    return {name: backend.capabilities() for name, backend in BACKENDS.items()}
@@ -0,0 +1,192 @@
+import numpy as np
+
+from Core import Jpeg
+from Core.Memory import track, transient
+from Core.Metrics import record_pixels, stage
+from Core.Steg.Backend import SteganographyException, bits_to_int
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+# Embeddable bits walked to estimate a carrier's capacity from the share
+# of usable coefficients in its first blocks
+ESTIMATE_BITS = 4096
+
+
+def is_jpeg(data):
+    return bytes(data[:3]) == JPEG_MAGIC
+
+
+class DctSteg:
+    """
+    Embedding in the quantized DCT coefficients of a baseline JPEG, for
+    JPEG in, JPEG out traffic. Same layout as the pixel backends (a
+    64-bit length, then the payload bits), one bit per AC coefficient of
+    magnitude 2 or more, in the low bit of its magnitude. Zeros and ±1
+    are skipped, so no coefficient changes size category: the entropy
+    coded stream keeps its length and the result is the carrier's own
+    file with some bits flipped. No pixels are decoded or re-encoded.
+
+    Work is proportional to the payload, except capacity(), which walks
+    the whole scan; estimated_capacity() extrapolates from the first
+    blocks instead.
+    """
+
+    name = "dct"
+
+    def __init__(self, jpeg):
+        self.jpeg = bytes(jpeg)
+        try:
+            self.frame, self.scans = Jpeg.parse(self.jpeg)
+        except Jpeg.JpegError as e:
+            raise SteganographyException(str(e))
+        self.width, self.height = self.frame.width, self.frame.height
+        self.nbchannels = len(self.frame.components)
+        self._capacity = None
+        # Longest walk so far, (places, lsbs, blocks); shorter ones reuse it
+        self._walked = None
+
+    def walk(self, limit=None):
+        """
+        (places, lsbs) of the first `limit` embeddable coefficients, all of
+        them by default; fewer when the scan runs out, which also settles
+        the capacity.
+        """
+        walked = self._walked
+        if walked is None or (self._capacity is None and (limit is None or len(walked[1]) < limit)):
+            try:
+                walked = self._walked = Jpeg.walk(self.jpeg, self.frame, self.scans, limit)
+            except Jpeg.JpegError as e:
+                raise SteganographyException(str(e))
+            if limit is None or len(walked[1]) < limit:
+                self._capacity = max(0, (len(walked[1]) - 64) // 8)
+        places, lsbs, _ = walked
+        if limit is None:
+            return places, lsbs
+        return places[:limit], lsbs[:limit]
+
+    def bits(self, count=None):
+        """
+        The first `count` embeddable bits as they stand (all of them by
+        default); fewer when the scan runs out.
+        """
+        _, lsbs = self.walk(count)
+        return np.array(lsbs, dtype=np.uint8)
+
+    def capacity(self):
+        """
+        Largest payload in bytes this carrier holds.
+        """
+        if self._capacity is None:
+            self.walk()
+        return self._capacity
+
+    def capacity_known(self):
+        # True once a walk has reached the end of the scan
+        return self._capacity is not None
+
+    def estimated_capacity(self):
+        """
+        capacity() from the first ESTIMATE_BITS embeddable coefficients,
+        scaled by the block count in the frame header. Exact when the walk
+        reaches the end of the scan.
+        """
+        self.walk(ESTIMATE_BITS)
+        if self._capacity is not None:
+            return self._capacity
+        _, lsbs, blocks = self._walked
+        usable = len(lsbs) * Jpeg.block_count(self.frame, self.scans) // blocks
+        return max(0, (usable - 64) // 8)
+
+    def fits(self, nbytes):
+        # Walks only as far as a payload of nbytes reaches
+        _, lsbs = self.walk(64 + 8 * nbytes)
+        return len(lsbs) >= 64 + 8 * nbytes
+
+    def coefficient_bound(self):
+        # AC coefficients in the file, an upper bound on the usable ones
+        # known without walking the scan
+        return 63 * Jpeg.block_count(self.frame, self.scans)
+
+    def encode_binary(self, data):
+        """
+        The carrier's JPEG bytes with `data` embedded.
+        """
+        bits = np.unpackbits(np.frombuffer(len(data).to_bytes(8, "big") + bytes(data), dtype=np.uint8))
+        places, lsbs = self.walk(len(bits))
+        if len(lsbs) < len(bits):
+            raise SteganographyException(
+                f"Carrier image not big enough to hold all the data. It can hold max {self.capacity()} bytes "
+                f"in its DCT coefficients, but the data is {len(data)} bytes"
+            )
+
+        flips = np.flatnonzero(np.array(lsbs, dtype=np.uint8) != bits)
+        return Jpeg.flip(self.jpeg, self.scans, [places[i] for i in flips])
+
+    def payload_length(self):
+        """
+        The length in the prefix, or None when it isn't one this file can
+        hold (nothing hidden). Reads only the prefix.
+        """
+        prefix = self.bits(64)
+        if len(prefix) < 64:
+            return None
+        length = bits_to_int(prefix)
+        if not length or 64 + 8 * length > self.coefficient_bound():
+            return None
+        return length
+
+    def extract(self):
+        """
+        The payload, or None when the prefix doesn't validate: no length
+        this file can hold, or more bits than the scan has.
+        """
+        length = self.payload_length()
+        if length is None:
+            return None
+        bits = self.bits(64 + 8 * length)
+        if len(bits) < 64 + 8 * length:
+            return None
+        return np.packbits(bits[64:]).tobytes()
+
+    def decode_binary(self):
+        """
+        The payload, or b"" when nothing is hidden.
+        """
+        hidden_data = self.extract()
+        return b"" if hidden_data is None else hidden_data
+
+
+def jpeg_carrier(carrier):
+    """
+    The uploaded JPEG an embedding=dct request works on. Raises
+    SteganographyException for other formats and for carrier_id, whose
+    store keeps only pixels.
+    """
+    if carrier.data is None:
+        raise SteganographyException("embedding=dct needs the JPEG file itself, upload it as carrier_image "
+                                     "instead of using carrier_id")
+    if not is_jpeg(carrier.data):
+        raise SteganographyException("embedding=dct needs a JPEG carrier")
+    return carrier.data
+
+
+def dct_extract(img_bytes):
+    """
+    The embedding=dct payload of an encoded image, or None when it isn't a
+    JPEG this mode reads or its DCT prefix doesn't validate, for callers
+    to fall back to the pixel path.
+    """
+    if not is_jpeg(img_bytes):
+        return None
+    try:
+        steg = DctSteg(img_bytes)
+        with stage("extract"):
+            hidden_data = steg.extract()
+    except SteganographyException:
+        return None
+    if hidden_data is not None:
+        record_pixels(steg.width, steg.height)
+        track(len(hidden_data))
+        # The bits, read in one array before packing
+        transient(len(hidden_data) * 8)
+    return hidden_data
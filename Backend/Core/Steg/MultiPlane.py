@@ -0,0 +1,64 @@
+import numpy as np
+
+from Core.BufferPool import buffer_pool
+from Core.Steg.Backend import LSBBackend, SteganographyException, bits_to_int, register_backend
+
+
+@register_backend
+class MultiPlaneBackend(LSBBackend):
+    """
+    Bits fill bit 0 of every slot first, then spill into bits 1..7.
+    What /text has always written, so older images keep decoding.
+    """
+
+    name = "multiplane"
+    description = "Bit 0 first, then bit planes 1-7 once it is full (legacy /text layout)"
+    planes = 8
+
+    @classmethod
+    def capacity(cls, width, height, channels):
+        # Legacy bound: one byte per channel value, less 64 for the length
+        return (width * height * channels) - 64
+
+    def plane_ranges(self, start, count):
+        # Split the bitstream range [start, start + count) into per-plane runs
+        end = start + count
+        if end >= 8 * self.slots:
+            raise SteganographyException("No available slot remaining (image filled)")
+
+        ranges = []
+        pos = start
+        while pos < end:
+            plane, offset = divmod(pos, self.slots)
+            n = min(self.slots - offset, end - pos)
+            ranges.append((plane, offset, pos - start, n))
+            pos += n
+        return ranges
+
+    def write_bits(self, start, bits):
+        for plane, offset, i, n in self.plane_ranges(start, len(bits)):
+            pixels = self.flat_image[offset:offset + n]
+            # Clear the plane bit, then OR in the new bits (in place)
+            pixels &= 0xFF ^ (1 << plane)
+            if not plane:
+                pixels |= bits[i:i + n]
+                continue
+            with buffer_pool.borrow(n) as shifted:
+                np.left_shift(bits[i:i + n], plane, out=shifted)
+                pixels |= shifted
+
+    def read_bits(self, start, count):
+        ranges = self.plane_ranges(start, count)
+        bits = np.empty(count, dtype=np.uint8)
+        for plane, offset, i, n in ranges:
+            out = bits[i:i + n]
+            np.right_shift(self.flat_image[offset:offset + n], plane, out=out)
+            out &= 1
+        return bits
+
+    @classmethod
+    def payload_bits(cls, read_bits, slots):
+        data_len = bits_to_int(read_bits(0, 64))
+        if data_len and 64 + data_len * 8 >= 8 * slots:
+            raise SteganographyException("No available slot remaining (image filled)")
+        return data_len * 8
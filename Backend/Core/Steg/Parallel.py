@@ -0,0 +1,159 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from Core.BufferPool import buffer_pool
+
+MB = 1024 * 1024
+
+# Payloads from this size up are embedded and extracted by several
+# threads. numpy drops the GIL inside the bit kernels, so the threads work
+# on the image buffer itself; nothing is copied or pickled.
+PARALLEL_MIN_BYTES = int(float(os.environ.get("STEG_PARALLEL_MIN_MB", "4")) * MB)
+PARALLEL_WORKERS = int(os.environ.get("STEG_PARALLEL_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+
+# Smallest share of the payload worth a hand-off to another thread
+MIN_CHUNK_BYTES = 256 * 1024
+
+# Payload bytes unpacked per step: the bits are written while they are
+# still in cache, from one pooled scratch buffer per thread, instead of
+# unpacking the whole payload into one array 8x its size
+CHUNK_BYTES = 64 * 1024
+
+# Row i is the bits of byte i, MSB first, as one uint64, so a gather
+# unpacks eight bits per element straight into the scratch buffer
+UNPACK_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).view(np.uint64).reshape(-1)
+
+_executor = None
+_executor_lock = threading.Lock()
+_counters = {"serial": 0, "parallel": 0, "chunks": 0}
+_counters_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PARALLEL_WORKERS, thread_name_prefix="steg-parallel")
+        return _executor
+
+
+def bump(key, n=1):
+    # Called from pool threads, unlike the WorkerPool counters
+    with _counters_lock:
+        _counters[key] += n
+
+
+def parallel_stats():
+    with _counters_lock:
+        return {
+            "workers": PARALLEL_WORKERS,
+            "min_bytes": PARALLEL_MIN_BYTES,
+            **_counters,
+        }
+
+
+def use_parallel(nbytes):
+    return PARALLEL_WORKERS > 1 and nbytes >= PARALLEL_MIN_BYTES
+
+
+def byte_chunks(nbytes):
+    # (first, last) byte ranges, one or a few per worker
+    size = max(MIN_CHUNK_BYTES, -(-nbytes // PARALLEL_WORKERS))
+    return [(i, min(i + size, nbytes)) for i in range(0, nbytes, size)]
+
+
+def scratch_bytes(nbytes):
+    # Unpacked bits held at once while a payload of nbytes is written or
+    # read: one chunk per thread
+    threads = len(byte_chunks(nbytes)) if use_parallel(nbytes) else 1
+    return 8 * min(nbytes, CHUNK_BYTES) * min(threads, PARALLEL_WORKERS)
+
+
+def run_all(fn, ranges):
+    bump("parallel")
+    bump("chunks", len(ranges))
+    # list() re-raises the first worker exception here
+    list(get_executor().map(lambda r: fn(*r), ranges))
+
+
+def unpack_bits(data, out):
+    # np.unpackbits(data) into out[:8 * len(data)], without allocating
+    np.take(UNPACK_TABLE, data, out=out[:8 * len(data)].view(np.uint64), mode="wrap")
+
+
+def write_bit_range(write_bits, start, data, first, last):
+    """
+    write_bits for stream bits [first, last) of `data` (relative to
+    start), unpacked CHUNK_BYTES at a time into a pooled buffer. The
+    ends need not fall on byte boundaries.
+    """
+    with buffer_pool.borrow(8 * min(CHUNK_BYTES, -(-last // 8) - first // 8)) as scratch:
+        pos = first
+        while pos < last:
+            lo = pos // 8
+            hi = min(-(-last // 8), lo + CHUNK_BYTES)
+            unpack_bits(data[lo:hi], scratch)
+            end = min(last, 8 * hi)
+            write_bits(start + pos, scratch[pos - 8 * lo:end - 8 * lo])
+            pos = end
+
+
+def read_bit_range(read_bits, start, out, first, last):
+    # out[first // 8:...] = packed stream bits [first, last), a chunk at a time
+    step = 8 * CHUNK_BYTES
+    for pos in range(first, last, step):
+        end = min(pos + step, last)
+        out[pos // 8:-(-end // 8)] = np.packbits(read_bits(start + pos, end - pos))
+
+
+def write_payload(write_bits, start, data, plane_bits=None):
+    """
+    write_bits(start + 8 * i, bits of data[i]) for the whole payload.
+    Large payloads are split into byte-aligned chunks written by several
+    threads. Chunks never straddle a multiple of `plane_bits`, and chunks
+    of different planes never run together: they may share pixels.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if not len(data):
+        return
+    if not use_parallel(len(data)):
+        bump("serial")
+        write_bit_range(write_bits, start, data, 0, 8 * len(data))
+        return
+
+    def write(first, last):
+        # Stream bits [first, last) relative to start, which need not
+        # fall on byte boundaries when a plane ends mid-byte
+        write_bit_range(write_bits, start, data, first, last)
+
+    total = len(data) * 8
+    cuts = [0, total]
+    if plane_bits:
+        # Stream positions where a new bit plane starts
+        cuts[1:1] = range(plane_bits - start, total, plane_bits)
+    for first, last in zip(cuts, cuts[1:]):
+        if last <= first:
+            continue
+        ranges = [(first + 8 * lo, first + min(8 * hi, last - first))
+                  for lo, hi in byte_chunks(-(-(last - first) // 8))]
+        run_all(write, ranges)
+
+
+def read_payload(read_bits, start, count):
+    """
+    np.packbits(read_bits(start, count)).tobytes(), split across threads
+    for large payloads. Reads never conflict, so chunks only need to be
+    byte-aligned.
+    """
+    nbytes = -(-count // 8)
+    with buffer_pool.borrow(nbytes) as out:
+        if not use_parallel(nbytes):
+            bump("serial")
+            read_bit_range(read_bits, start, out, 0, count)
+        else:
+            run_all(lambda lo, hi: read_bit_range(read_bits, start, out, 8 * lo, min(8 * hi, count)),
+                    byte_chunks(nbytes))
+        return out.tobytes()
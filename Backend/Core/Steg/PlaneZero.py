@@ -0,0 +1,35 @@
+from Core.Steg.Backend import LSBBackend, bits_to_int, register_backend
+
+
+@register_backend
+class PlaneZeroBackend(LSBBackend):
+    """
+    One bit per channel value, bit 0 only. What /image has always
+    written; the vectorized default.
+    """
+
+    name = "lsb"
+    description = "Bit 0 of every channel value, vectorized numpy"
+    planes = 1
+
+    @classmethod
+    def capacity(cls, width, height, channels):
+        # 64 bits (8 bytes) reserved for storing data length
+        return (width * height * channels // 8) - 8
+
+    def write_bits(self, start, bits):
+        # Clear LSBs and set new bits in place
+        pixels = self.flat_image[start:start + len(bits)]
+        pixels &= 0xFE
+        pixels |= bits
+
+    def read_bits(self, start, count):
+        return self.flat_image[start:start + count] & 1
+
+    @classmethod
+    def payload_bits(cls, read_bits, slots):
+        data_len = bits_to_int(read_bits(0, 64))
+        if data_len <= 0 or data_len > slots // 8:
+            return 0
+        # As many data bits as the image holds
+        return max(0, min(data_len * 8, slots - 64))
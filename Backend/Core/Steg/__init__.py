@@ -0,0 +1,33 @@
+"""
+LSB embedding backends shared by the /text and /image routers.
+
+Backends register themselves by name; the routers pick theirs with
+STEG_TEXT_BACKEND and STEG_IMAGE_BACKEND, and GET /backends lists what
+is registered and available. Containers use STEG_CONTAINER_BACKEND,
+the text backend unless set, so /text decoders read them as one blob.
+A native backend (numba, C) subclasses LSBBackend, decorates itself with
+register_backend and reports available() False when its dependency is
+missing.
+
+Payloads over STEG_PARALLEL_MIN_MB are embedded and extracted by
+STEG_PARALLEL_WORKERS threads sharing the image buffer.
+
+DctSteg is the embedding=dct mode: the same layout in the quantized DCT
+coefficients of a baseline JPEG, which stays a JPEG.
+"""
+import os
+
+from Core.Steg.Backend import (BACKENDS, LSBBackend, SteganographyException, backend_info, get_backend,
+                               register_backend)
+from Core.Steg.Dct import DctSteg, dct_extract, is_jpeg, jpeg_carrier
+from Core.Steg.MultiPlane import MultiPlaneBackend
+from Core.Steg.Parallel import parallel_stats, scratch_bytes
+from Core.Steg.PlaneZero import PlaneZeroBackend
+
+TEXT_BACKEND = os.environ.get("STEG_TEXT_BACKEND", MultiPlaneBackend.name)
+IMAGE_BACKEND = os.environ.get("STEG_IMAGE_BACKEND", PlaneZeroBackend.name)
+CONTAINER_BACKEND = os.environ.get("STEG_CONTAINER_BACKEND", TEXT_BACKEND)
+
+
+def selected_backends():
+    return {"text": TEXT_BACKEND, "image": IMAGE_BACKEND, "container": CONTAINER_BACKEND}
@@ -0,0 +1,194 @@
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from Core.BufferPool import buffer_pool
+from Core.ImageHeader import read_header
+from Core.Memory import tracked
+from Core.Output import OUTPUT_FORMATS, png_writer_args
+from Core.PngWriter import iter_png
+from Core.RowReader import iter_strips
+from Core.Steg.Parallel import unpack_bits
+
+MB = 1024 * 1024
+
+# Carriers whose decoded pixels exceed this go through the strip path
+STRIP_THRESHOLD_BYTES = int(float(os.environ.get("STEG_STRIP_THRESHOLD_MB", "256")) * MB)
+STRIP_ROWS = int(os.environ.get("STEG_STRIP_ROWS", "256"))
+STRIP_DIR = os.environ.get("STEG_STRIP_DIR") or None
+
+# Outputs that can be written strip by strip
+STRIP_OUTPUT_FORMATS = ("png", "bmp")
+
+
+class BitStream:
+    """
+    The embedded bitstream (64-bit big-endian length, then the payload)
+    unpacked a window at a time instead of all at once.
+    """
+
+    def __init__(self, data):
+        self.head = len(data).to_bytes(8, "big")
+        self.data = data
+        self.nbits = 64 + len(data) * 8
+
+    def embed(self, pixels, start, plane):
+        """
+        Write stream bits [start, start + len(pixels)) into bit `plane`
+        of `pixels`, in place, through a pooled scratch buffer.
+        """
+        count = len(pixels)
+        first, last = start // 8, -(-(start + count) // 8)
+        parts = []
+        if first < 8:
+            parts.append(self.head[first:min(last, 8)])
+        if last > 8:
+            parts.append(self.data[max(first - 8, 0):last - 8])
+        window = np.frombuffer(b"".join(parts), dtype=np.uint8)
+
+        with buffer_pool.borrow(8 * len(window)) as scratch:
+            unpack_bits(window, scratch)
+            skip = start - first * 8
+            bits = scratch[skip:skip + count]
+            if plane:
+                bits <<= plane
+            pixels &= 0xFF ^ (1 << plane)
+            pixels |= bits
+
+
+def strip_ranges(slots, first_slot, last_slot, nbits):
+    """
+    (plane, offset in strip, stream position, count) for the stream bits
+    that land on slots [first_slot, last_slot). Bit plane p holds stream
+    positions p * slots onwards, as in the /text engine; a stream that
+    fits in plane 0 is the /image layout.
+    """
+    ranges = []
+    plane = 0
+    while plane < 8 and plane * slots < nbits:
+        start = plane * slots + first_slot
+        end = min(plane * slots + last_slot, nbits)
+        if start < end:
+            ranges.append((plane, start - plane * slots - first_slot, start, end - start))
+        plane += 1
+    return ranges
+
+
+def strip_layout(data):
+    """
+    (width, height) when `data` is big enough to need the strip path and
+    its format can be read in strips, otherwise None.
+    """
+    header = read_header(data)
+    if header is None or header.width * header.height * header.channels < STRIP_THRESHOLD_BYTES:
+        return None
+    source = iter_strips(data, STRIP_ROWS)
+    return None if source is None else source[:2]
+
+
+def use_strips(data, options):
+    return options.format in STRIP_OUTPUT_FORMATS and strip_layout(data) is not None
+
+
+def embedded_strips(carrier_bytes, data):
+    """
+    Yield the carrier's strips with `data` embedded. Strips the stream
+    doesn't reach pass through untouched; the others are copied first, so
+    the working set is one strip.
+    """
+    width, height, strips = iter_strips(carrier_bytes, STRIP_ROWS)
+    stream = BitStream(data)
+    slots = width * height * 3
+    row_slots = width * 3
+
+    # A strip and its copy, held until the writer is done
+    with tracked(STRIP_ROWS * row_slots * 2):
+        for y, rows in strips:
+            first_slot = y * row_slots
+            ranges = strip_ranges(slots, first_slot, first_slot + rows.size, stream.nbits)
+            if not ranges:
+                yield rows
+            elif rows.flags.writeable and rows.flags.c_contiguous:
+                embed_ranges(stream, rows, ranges)
+                yield rows
+            else:
+                # Read-only (a BMP view of the upload): a pooled copy, back to
+                # the pool once the writer asks for the next strip
+                with buffer_pool.copy(rows) as rows:
+                    embed_ranges(stream, rows, ranges)
+                    yield rows
+
+
+def embed_ranges(stream, rows, ranges):
+    flat = rows.reshape(-1)
+    for plane, offset, start, count in ranges:
+        stream.embed(flat[offset:offset + count], start, plane)
+
+
+def read_stream(img_bytes, start, count):
+    """
+    Stream bits [start, start + count) gathered strip by strip. Stops
+    reading once the last needed strip is done.
+    """
+    width, height, strips = iter_strips(img_bytes, STRIP_ROWS)
+    slots = width * height * 3
+    row_slots = width * 3
+    bits = np.empty(count, dtype=np.uint8)
+    end = start + count
+    last_plane = (end - 1) // slots if count else 0
+
+    for y, rows in strips:
+        first_slot = y * row_slots
+        last_slot = first_slot + rows.size
+        if last_plane == 0 and first_slot >= end:
+            break
+        flat = rows.reshape(-1)
+        for plane, offset, position, n in strip_ranges(slots, first_slot, last_slot, end):
+            if position + n <= start:
+                continue
+            skip = max(0, start - position)
+            out = bits[position + skip - start:position + n - start]
+            np.right_shift(flat[offset + skip:offset + n], plane, out=out)
+            out &= 1
+    return bits
+
+
+def write_bmp(f, blocks, width, height):
+    # Bottom-up 24-bit BMP; strips arrive top first, so seek per strip
+    stride = (width * 3 + 3) & ~3
+    offset = 54
+    f.write(b"BM" + struct.pack("<IHHI", offset + stride * height, 0, 0, offset))
+    f.write(struct.pack("<IiiHHIIiiII", 40, width, height, 1, 24, 0, stride * height, 2835, 2835, 0, 0))
+    padding = stride - width * 3
+    y = 0
+    for block in blocks:
+        rows = block[::-1]
+        if padding:
+            rows = np.concatenate([rows.reshape(len(rows), -1), np.zeros((len(rows), padding), np.uint8)], axis=1)
+        f.seek(offset + (height - y - len(block)) * stride)
+        f.write(np.ascontiguousarray(rows).tobytes())
+        y += len(block)
+    if y != height:
+        raise ValueError(f"BMP blocks cover {y} rows, expected {height}")
+
+
+def write_strips(blocks, width, height, options):
+    """
+    Encode row blocks straight into a temp file and return its path.
+    The caller deletes it once it has been sent.
+    """
+    extension, _ = OUTPUT_FORMATS[options.format]
+    fd, path = tempfile.mkstemp(prefix="steg-", suffix=extension, dir=STRIP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if options.format == "png":
+                for piece in iter_png(blocks, width, height, **png_writer_args(options)):
+                    f.write(piece)
+            else:
+                write_bmp(f, blocks, width, height)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
@@ -0,0 +1,183 @@
+import io
+import mmap
+import os
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from Core.Memory import MemoryMeter, request_meter, track
+from Core.Metrics import stage
+
+MB = 1024 * 1024
+
+# Whole request body and single uploaded file limits
+MAX_BODY_BYTES = int(float(os.environ.get("STEG_MAX_BODY_MB", "256")) * MB)
+MAX_UPLOAD_BYTES = int(float(os.environ.get("STEG_MAX_UPLOAD_MB", "200")) * MB)
+
+# Upload files the current request mapped, closed when it is done
+request_mappings = ContextVar("request_mappings", default=None)
+
+upload_stats = {
+    "requests": 0,
+    "rejected_413": 0,
+    "last_peak_bytes": 0,
+    "max_peak_bytes": 0,
+}
+
+
+def too_large(limit):
+    return HTTPException(
+        status_code=413,
+        detail=f"Upload too large. Limit is {limit} bytes ({round(limit / MB, 2)} MB)"
+    )
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects request bodies over MAX_BODY_BYTES with 413 before they are
+    parsed, and reports each request's tracked peak memory in the
+    X-Peak-Memory response header.
+    """
+
+    def __init__(self, app, max_body=None):
+        self.app = app
+        self.max_body = max_body or MAX_BODY_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_body:
+            upload_stats["rejected_413"] += 1
+            await self.send_413(send)
+            return
+
+        meter = MemoryMeter()
+        token = request_meter.set(meter)
+        mappings = []
+        mappings_token = request_mappings.set(mappings)
+        upload_stats["requests"] += 1
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    # Stop feeding the parser; the app's error gets replaced below
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def metered_send(message):
+            if exceeded:
+                if message["type"] == "http.response.start":
+                    upload_stats["rejected_413"] += 1
+                    await self.send_413(send)
+                return
+
+            if message["type"] == "http.response.start":
+                upload_stats["last_peak_bytes"] = meter.peak
+                upload_stats["max_peak_bytes"] = max(upload_stats["max_peak_bytes"], meter.peak)
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-peak-memory", str(meter.peak).encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, metered_send)
+        except Exception:
+            if not exceeded:
+                raise
+            # The parser gave up on the truncated body
+            upload_stats["rejected_413"] += 1
+            await self.send_413(send)
+        finally:
+            request_meter.reset(token)
+            request_mappings.reset(mappings_token)
+            for mapping, view in mappings:
+                unmap(mapping, view)
+
+    async def send_413(self, send):
+        body = b'{"detail":"Request body too large"}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def unmap(mapping, view):
+    try:
+        view.release()
+        if mapping is not None:
+            mapping.close()
+    except BufferError:
+        # Something still points into the file; the mapping is closed
+        # when that goes
+        pass
+
+
+def _in_memory(file):
+    # A SpooledTemporaryFile holds its data in an io.BytesIO (its _file)
+    # until it rolls over to a temp file; nothing public tells which
+    return isinstance(getattr(file, "_file", file), io.BytesIO)
+
+
+def _map_upload(upload):
+    """
+    (mapping, view) of the upload; the mapping is None for a part the
+    parser kept in memory.
+    """
+    spooled = upload.file
+    if not _in_memory(spooled):
+        # Already spooled to a temp file by the multipart parser: map it
+        # instead of reading it back into the heap
+        spooled.flush()
+        mapping = mmap.mmap(spooled.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapping, memoryview(mapping)
+
+    # Small in-memory part, copy once into a buffer we own
+    spooled.seek(0)
+    buffer = bytearray(upload.size)
+    spooled.readinto(buffer)
+    return None, memoryview(buffer)
+
+
+async def read_upload(upload, max_bytes=None):
+    """
+    Return the upload as a memoryview without extra copies.
+    Raises 413 when the file exceeds max_bytes.
+    """
+    limit = max_bytes or MAX_UPLOAD_BYTES
+    size = upload.size
+    if size is None:
+        upload.file.seek(0, os.SEEK_END)
+        size = upload.file.tell()
+        upload.size = size
+
+    if size > limit:
+        raise too_large(limit)
+    if size == 0:
+        return memoryview(b"")
+
+    with stage("read_upload"):
+        mapping, data = await run_in_threadpool(_map_upload, upload)
+    mappings = request_mappings.get()
+    if mapping is not None and mappings is not None:
+        mappings.append((mapping, data))
+    track(len(data))
+    return data
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from fastapi import HTTPException
+
+from Core.Memory import request_meter, start_job_meter
+from Core.Metrics import request_timer, start_job_timer
+
+
+BUSY_RETRY_SECONDS = 0.05
+
+
+class JobError(Exception):
+    """
+    Error raised inside a pooled job. Unlike HTTPException it survives
+    pickling, so it can cross a process pool boundary.
+    """
+
+    def __init__(self, status_code, detail):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _timed_call(fn, args):
+    # Runs in the worker; returns when the job actually started, the
+    # peak of the buffers it tracked and its stage timings
+    started = time.time()
+    meter = start_job_meter()
+    timer = start_job_timer()
+    result = fn(*args)
+    return started, meter.peak, timer, result
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+class WorkerPool:
+    def __init__(self, name, kind="thread", workers=None, max_queue=None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind: {kind}")
+
+        self.name = name
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue if max_queue is not None else self.workers * 4
+        self.executor = None
+
+        # Counters are only touched from the event loop thread
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, name):
+        # STEG_POOL_<NAME>_* overrides the global STEG_POOL_* defaults
+        prefix = f"STEG_POOL_{name.upper()}_"
+        kind = os.environ.get(prefix + "KIND") or os.environ.get("STEG_POOL_KIND", "thread")
+        workers = _env_int(prefix + "WORKERS", _env_int("STEG_POOL_WORKERS", 0)) or None
+        max_queue = _env_int(prefix + "QUEUE", _env_int("STEG_POOL_QUEUE", -1))
+        return cls(name, kind, workers, max_queue if max_queue >= 0 else None)
+
+    def get_executor(self):
+        if self.executor is None:
+            if self.kind == "process":
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                   thread_name_prefix=f"steg-{self.name}")
+        return self.executor
+
+    @property
+    def queued(self):
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, fn, *args):
+        """
+        Run fn(*args) on the pool. Raises 503 when the queue is full.
+        """
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server busy ({self.name} pool saturated), retry shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        if self.kind == "process":
+            # Upload memoryviews can't be pickled
+            args = tuple(bytes(a) if isinstance(a, memoryview) else a for a in args)
+
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        self.submitted += 1
+        enqueued = time.time()
+        try:
+            started, job_peak, job_timer, result = await loop.run_in_executor(self.get_executor(), _timed_call, fn, args)
+        except JobError as e:
+            self.failed += 1
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+        meter = request_meter.get()
+        if meter is not None:
+            meter.merge_peak(job_peak)
+
+        wait = max(0.0, started - enqueued)
+        timer = request_timer.get()
+        if timer is not None:
+            timer.add("queue_wait", wait)
+            timer.merge(job_timer)
+
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.completed += 1
+        return result
+
+    async def run_when_free(self, fn, *args):
+        """
+        Like run(), but waits for room instead of raising 503. For batch and
+        background work that has no client waiting on a quick answer.
+        """
+        while True:
+            try:
+                return await self.run(fn, *args)
+            except HTTPException as e:
+                if e.status_code != 503:
+                    raise
+                await asyncio.sleep(BUSY_RETRY_SECONDS)
+
+    def stats(self):
+        finished = self.completed
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_avg_ms": round(self.wait_total / finished * 1000, 3) if finished else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3)
+        }
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+
+# Encode jobs (decode carrier, embed, PNG encode) and read-only decode jobs
+# get separate pools so heavy encodes can't starve extraction/check calls.
+pools = {
+    "encode": WorkerPool.from_env("encode"),
+    "decode": WorkerPool.from_env("decode"),
+}
+
+
+def get_pool(name):
+    return pools[name]
+
+
+def pool_stats():
+    return {name: pool.stats() for name, pool in pools.items()}
+
+
+def shutdown_pools(wait=True):
+    for pool in pools.values():
+        pool.shutdown(wait)
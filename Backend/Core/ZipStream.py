@@ -0,0 +1,58 @@
+import json
+import zipfile
+
+
+class _StreamBuffer:
+    """
+    Write-only, non-seekable sink for zipfile. Data is collected until the
+    response generator drains it.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ZipStream:
+    """
+    Build a zip archive incrementally; after each entry drain() returns the
+    bytes ready to send. Entries use data descriptors, so nothing needs to
+    be seeked back and rewritten.
+    """
+
+    def __init__(self):
+        self.buffer = _StreamBuffer()
+        self.archive = zipfile.ZipFile(self.buffer, "w", allowZip64=True)
+
+    def add(self, name, data, compress=False):
+        info = zipfile.ZipInfo(name)
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.external_attr = 0o644 << 16
+        with self.archive.open(info, "w", force_zip64=len(data) > 0x7FFFFFFF) as entry:
+            entry.write(data)
+
+    def add_json(self, name, value):
+        self.add(name, json.dumps(value, indent=2).encode(), compress=True)
+
+    def drain(self):
+        return self.buffer.drain()
+
+    def close(self):
+        self.archive.close()
+        return self.buffer.drain()
@@ -0,0 +1,283 @@
+import asyncio
+import posixpath
+import zipfile
+from typing import List, Optional
+
+from fastapi import Depends, UploadFile, File, HTTPException, Form
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRouter
+from starlette.concurrency import run_in_threadpool
+
+from Core.Metrics import body_parsed
+from Core.Compression import resolve_compression
+from Core.Output import output_extension, resolve_output_options
+from Core.Steg import SteganographyException
+from Core.Uploads import MAX_UPLOAD_BYTES, read_upload
+from Core.WorkerPool import JobError, get_pool
+from Core.ZipStream import ZipStream
+from Routes import HandleImage, HandleText
+
+BatchRouter = APIRouter(dependencies=[Depends(body_parsed)])
+
+MODES = ("text", "image")
+
+
+class BatchItem:
+    def __init__(self, name):
+        self.name = name
+        self.loaders = []
+        self.error = None
+
+
+def _stem(filename):
+    return posixpath.splitext(posixpath.basename(filename or "item"))[0] or "item"
+
+
+def _unique(name, seen):
+    candidate, n = name, 1
+    while candidate in seen:
+        n += 1
+        candidate = f"{name}_{n}"
+    seen.add(candidate)
+    return candidate
+
+
+def _upload_loader(upload):
+    async def load():
+        return await read_upload(upload)
+    return load
+
+
+def _zip_loader(archive, info):
+    async def load():
+        if info.file_size > MAX_UPLOAD_BYTES:
+            raise JobError(413, f"{info.filename} is larger than the {MAX_UPLOAD_BYTES} byte upload limit")
+        return await run_in_threadpool(archive.read, info)
+    return load
+
+
+def _open_archive(upload):
+    try:
+        return zipfile.ZipFile(upload.file)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="archive is not a valid zip file")
+
+
+def _archive_files(archive):
+    return [info for info in archive.infolist() if not info.is_dir() and not info.filename.startswith("__MACOSX/")]
+
+
+def encode_items(archive, carriers, payloads):
+    """
+    Pair carriers with payloads, either by stem inside the archive
+    (carriers/<name>.* with payloads/<name>.*) or by position in the
+    multipart lists.
+    """
+    items = []
+    if archive is not None:
+        by_name = {}
+        for info in _archive_files(archive):
+            folder = info.filename.split("/", 1)[0]
+            if folder not in ("carriers", "payloads"):
+                continue
+            item = by_name.setdefault(_stem(info.filename), {})
+            item[folder] = info
+        for name in sorted(by_name):
+            item = BatchItem(name)
+            pair = by_name[name]
+            if "carriers" not in pair or "payloads" not in pair:
+                item.error = (400, "Needs both carriers/<name>.* and payloads/<name>.* in the archive")
+            else:
+                item.loaders = [_zip_loader(archive, pair["carriers"]), _zip_loader(archive, pair["payloads"])]
+            items.append(item)
+        return items
+
+    if len(carriers) != len(payloads):
+        raise HTTPException(status_code=400, detail="carriers and payloads must have the same number of files")
+
+    seen = set()
+    for carrier, payload in zip(carriers, payloads):
+        item = BatchItem(_unique(_stem(carrier.filename), seen))
+        item.loaders = [_upload_loader(carrier), _upload_loader(payload)]
+        items.append(item)
+    return items
+
+
+def decode_items(archive, images):
+    items = []
+    seen = set()
+    if archive is not None:
+        for info in _archive_files(archive):
+            item = BatchItem(_unique(_stem(info.filename), seen))
+            item.loaders = [_zip_loader(archive, info)]
+            items.append(item)
+        return items
+
+    for image in images:
+        item = BatchItem(_unique(_stem(image.filename), seen))
+        item.loaders = [_upload_loader(image)]
+        items.append(item)
+    return items
+
+
+async def process_item(item, work, limiter):
+    """
+    Returns (item, files, error) where files is a list of (name, bytes).
+    """
+    if item.error is not None:
+        return item, [], item.error
+    async with limiter:
+        try:
+            inputs = [await load() for load in item.loaders]
+            return item, await work(item, *inputs), None
+        except JobError as e:
+            return item, [], (e.status_code, e.detail)
+        except HTTPException as e:
+            return item, [], (e.status_code, e.detail)
+        except SteganographyException as e:
+            return item, [], (400, str(e))
+        except Exception as e:
+            return item, [], (500, f"Error: {str(e)}")
+
+
+async def stream_zip(items, work, pool, archive=None):
+    """
+    Run every item on the pool and stream a zip back, adding each result
+    as soon as it finishes. A manifest.json with per-item status closes it.
+    """
+    limiter = asyncio.Semaphore(pool.workers + pool.max_queue)
+    tasks = [asyncio.create_task(process_item(item, work, limiter)) for item in items]
+    zip_stream = ZipStream()
+    manifest = []
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            item, files, error = await next_done
+            if error is not None:
+                status_code, detail = error
+                manifest.append({"name": item.name, "status": "error", "status_code": status_code, "detail": detail})
+                zip_stream.add_json(f"errors/{item.name}.json", manifest[-1])
+            else:
+                for filename, data in files:
+                    zip_stream.add(filename, data)
+                manifest.append({
+                    "name": item.name,
+                    "status": "ok",
+                    "files": [filename for filename, _ in files],
+                    "bytes": sum(len(data) for _, data in files)
+                })
+            yield zip_stream.drain()
+
+        zip_stream.add_json("manifest.json", {
+            "total": len(manifest),
+            "succeeded": sum(1 for entry in manifest if entry["status"] == "ok"),
+            "failed": sum(1 for entry in manifest if entry["status"] == "error"),
+            "items": manifest
+        })
+        yield zip_stream.close()
+    finally:
+        # Client went away or we finished: nothing left should keep running
+        for task in tasks:
+            task.cancel()
+        if archive is not None:
+            archive.close()
+
+
+def zip_response(body, filename, count):
+    return StreamingResponse(
+        body,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Batch-Items": str(count)
+        }
+    )
+
+
+@BatchRouter.get("/")
+async def root():
+    return {
+        "message": "Batch Steganography API",
+        "endpoints": {
+            "/encode": "POST - Hide many payloads in many carriers, results stream back as a zip",
+            "/decode": "POST - Extract hidden data from many images, results stream back as a zip"
+        }
+    }
+
+
+@BatchRouter.post("/encode")
+async def batch_encode(
+        mode: str = Form("text", description="text (any file, /text/encode) or image (secret image, /image/encode-image)"),
+        archive: Optional[UploadFile] = File(None, description="Zip with carriers/<name>.* and payloads/<name>.*"),
+        carriers: List[UploadFile] = File(None, description="Carrier images, paired with payloads by position"),
+        payloads: List[UploadFile] = File(None, description="Payload files, paired with carriers by position"),
+        output_format: Optional[str] = Form(None, description="Result format (png, webp, tiff, bmp), all lossless"),
+        png_compression: Optional[int] = Form(None, description="PNG compression level 0-9"),
+        png_strategy: Optional[str] = Form(None, description="PNG zlib strategy (default, filtered, huffman, rle, fixed)"),
+        png_filter: Optional[str] = Form(None, description="PNG row filter (none, sub, up, avg, paeth, fast, all)"),
+        compression: Optional[str] = Form(None, description="Payload compression (none, auto, zlib, lzma)")
+):
+    """
+    Encode many (carrier, payload) pairs in one request.
+    Failing items are reported in errors/<name>.json and manifest.json.
+    """
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(MODES)}")
+    if archive is None and not carriers:
+        raise HTTPException(status_code=400, detail="Provide an archive or carriers and payloads")
+
+    options = resolve_output_options(output_format, png_compression, png_strategy, png_filter)
+    compression = resolve_compression(compression)
+    opened = _open_archive(archive) if archive is not None else None
+    items = encode_items(opened, carriers or [], payloads or [])
+    pool = get_pool("encode")
+    extension = output_extension(options)
+
+    async def work(item, carrier_bytes, payload_bytes):
+        if mode == "image":
+            encoded, _, _ = await pool.run_when_free(HandleImage.encode_job, carrier_bytes, payload_bytes, options, compression)
+        else:
+            encoded = await pool.run_when_free(HandleText.encode_job, carrier_bytes, payload_bytes, options, compression)
+        return [(f"{item.name}{extension}", encoded)]
+
+    return zip_response(stream_zip(items, work, pool, opened), "encoded_batch.zip", len(items))
+
+
+@BatchRouter.post("/decode")
+async def batch_decode(
+        mode: str = Form("text", description="text (/text/decode) or image (/image/decode-image)"),
+        archive: Optional[UploadFile] = File(None, description="Zip of stego images"),
+        images: List[UploadFile] = File(None, description="Stego images"),
+        output_format: Optional[str] = Form("png", description="Output format for mode=image (png, jpg, bmp)")
+):
+    """
+    Extract hidden data from many images in one request.
+    Failing items are reported in errors/<name>.json and manifest.json.
+    """
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(MODES)}")
+    if archive is None and not images:
+        raise HTTPException(status_code=400, detail="Provide an archive or images")
+
+    output_format = (output_format or "png").lower()
+    if output_format not in HandleImage.EXT_MAP:
+        output_format = "png"
+
+    opened = _open_archive(archive) if archive is not None else None
+    items = decode_items(opened, images or [])
+    pool = get_pool("decode")
+
+    async def work(item, img_bytes):
+        if mode == "image":
+            output, _ = await pool.run_when_free(HandleImage.decode_job, img_bytes, output_format)
+            return [(f"{item.name}{HandleImage.EXT_MAP[output_format]}", output)]
+
+        hidden_data = await pool.run_when_free(HandleText.decode_job, img_bytes)
+        if len(hidden_data) == 0:
+            raise JobError(404, "No hidden data found in image")
+        _, filename = HandleText.name_extracted_file(hidden_data, item.name)
+        if filename == item.name:
+            filename += ".bin"
+        return [(filename, hidden_data)]
+
+    return zip_response(stream_zip(items, work, pool, opened), "decoded_batch.zip", len(items))
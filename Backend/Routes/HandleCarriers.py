@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+from fastapi import Depends, UploadFile, File, HTTPException
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRouter
+
+from Core.CarrierStore import carrier_id_for, carrier_store
+from Core.Memory import track
+from Core.Metrics import body_parsed, record_pixels, stage
+from Core.Uploads import read_upload
+from Core.WorkerPool import JobError, get_pool
+
+CarrierRouter = APIRouter(dependencies=[Depends(body_parsed)])
+
+
+def decode_carrier_job(carrier_bytes):
+    carrier_array = np.frombuffer(carrier_bytes, np.uint8)
+    with stage("imdecode"):
+        carrier_img = cv2.imdecode(carrier_array, cv2.IMREAD_COLOR)
+
+    if carrier_img is None:
+        raise JobError(400, "Invalid carrier image format")
+    track(carrier_img.nbytes)
+    record_pixels(carrier_img.shape[1], carrier_img.shape[0])
+
+    return carrier_img
+
+
+@CarrierRouter.get("/")
+async def root():
+    return {
+        "message": "Carrier API",
+        "endpoints": {
+            "": "POST - Upload a carrier once and get a carrier_id for /text/encode and /image/encode-image",
+            "/{carrier_id}": "GET - Carrier info, DELETE - Drop it from the cache"
+        },
+        "carriers": carrier_store.list(),
+        "stats": carrier_store.stats()
+    }
+
+
+@CarrierRouter.post("")
+async def upload_carrier(
+        carrier_image: UploadFile = File(..., description="The carrier image to keep decoded on the server")
+):
+    """
+    Decode a carrier once and keep it for later encode calls.
+    Returns the carrier_id to pass instead of re-uploading the image.
+    """
+    try:
+        carrier_bytes = await read_upload(carrier_image)
+        carrier_id = carrier_id_for(carrier_bytes)
+
+        entry = carrier_store.get(carrier_id)
+        if entry is None:
+            carrier_img = await get_pool("decode").run(decode_carrier_job, carrier_bytes)
+            try:
+                entry = carrier_store.add(carrier_id, carrier_img, carrier_image.filename)
+            except ValueError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+
+        return JSONResponse(entry.info())
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@CarrierRouter.get("/{carrier_id}")
+async def carrier_info(carrier_id: str):
+    entry = carrier_store.get(carrier_id, touch=False)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired carrier_id")
+    return JSONResponse(entry.info())
+
+
+@CarrierRouter.delete("/{carrier_id}")
+async def delete_carrier(carrier_id: str):
+    if not carrier_store.remove(carrier_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired carrier_id")
+    return {"deleted": carrier_id}
@@ -0,0 +1,278 @@
+import os
+import posixpath
+from typing import List, Optional
+
+import cv2
+import numpy as np
+from fastapi import Depends, UploadFile, File, HTTPException, Form
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.routing import APIRouter
+from starlette.background import BackgroundTask
+
+from Core.Admission import admitted
+from Core.CarrierStore import resolve_carrier
+from Core.Compression import resolve_compression
+from Core.Container import PayloadReader, build, entry_info, list_entries, read_entry
+from Core.Embed import embed_encoded, embed_image, embed_strips
+from Core.ImageHeader import read_header
+from Core.Memory import track
+from Core.Metrics import body_parsed, record_pixels, stage
+from Core.Output import BufferResponse, output_extension, output_media_type, resolve_output_options
+from Core.ResultCache import result_cache
+from Core.RowReader import read_payload_rows
+from Core.Steg import CONTAINER_BACKEND, SteganographyException, get_backend
+from Core.Strips import read_stream, strip_layout, use_strips
+from Core.Uploads import read_upload
+from Core.WorkerPool import JobError, get_pool
+
+ContainerRouter = APIRouter(dependencies=[Depends(body_parsed), Depends(admitted)])
+
+
+LSBSteg = get_backend(CONTAINER_BACKEND)
+
+# Stream bits read up front from strip-readable images
+HEAD_BITS = 64 + 8 * 64 * 1024
+
+
+@ContainerRouter.get("/")
+async def root():
+    return {
+        "message": "Container API",
+        "endpoints": {
+            "/encode": "POST - Hide several files in one image, with an index",
+            "/list": "POST - List the files hidden in an image",
+            "/extract": "POST - Extract one hidden file by name or index"
+        }
+    }
+
+
+def attachment_name(name):
+    # Header values are latin-1; names in the index may be any UTF-8
+    return posixpath.basename(name).encode("latin-1", "replace").decode("latin-1")
+
+
+def container_encode_job(carrier, files, options, compression="none", strips=False):
+    # Entries are packed one by one, so the container itself is embedded as is
+    with stage("compress"):
+        container = build(files, compression)
+    track(len(container))
+    if strips:
+        return embed_strips(LSBSteg, carrier, container, options)
+    if isinstance(carrier, np.ndarray):
+        return embed_image(LSBSteg, carrier, container, options)
+    return embed_encoded(LSBSteg, carrier, container, options)
+
+
+def open_payload(img_bytes):
+    """
+    A PayloadReader over the /text layout of an image. Images over the
+    strip threshold are read a strip at a time, stopping after the last
+    strip a read needs; others are decoded once, only down to the rows
+    holding the payload when the format allows it.
+    """
+    layout = strip_layout(img_bytes)
+    if layout is not None:
+        width, height = layout
+        record_pixels(width, height)
+
+        slots = width * height * 3
+        # Every read re-inflates from the top, so the length, the index
+        # and small entries near the start come from one read
+        head = read_stream(img_bytes, 0, min(HEAD_BITS, 8 * slots - 1))
+
+        def read_bits(start, count):
+            if start + count <= len(head):
+                return head[start:start + count]
+            return read_stream(img_bytes, start, count)
+
+    else:
+        with stage("read_rows"):
+            img = read_payload_rows(img_bytes)
+        if img is not None:
+            header = read_header(img_bytes)
+            record_pixels(header.width, header.height)
+        else:
+            with stage("imdecode"):
+                img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                raise JobError(400, "Invalid image format")
+            record_pixels(img.shape[1], img.shape[0])
+        track(img.nbytes)
+        steg = LSBSteg(img)
+        read_bits, slots = steg.read_bits, steg.slots
+
+    try:
+        nbits = LSBSteg.payload_bits(read_bits, slots)
+    except SteganographyException:
+        # The prefix can't be a length in this image: nothing is hidden
+        nbits = 0
+    return PayloadReader(read_bits, nbits)
+
+
+def list_job(img_bytes):
+    with stage("index"):
+        reader = open_payload(img_bytes)
+        is_container, entries = list_entries(reader)
+    return {
+        "container": is_container,
+        "payload_bytes": reader.size,
+        "entries": [entry_info(i, entry) for i, entry in enumerate(entries)]
+    }
+
+
+def extract_entry_job(img_bytes, name=None, index=None):
+    with stage("index"):
+        reader = open_payload(img_bytes)
+        _, entries = list_entries(reader)
+    if not entries:
+        raise JobError(404, "No hidden data found in image")
+
+    if name is not None:
+        matches = [entry for entry in entries if entry.name == name]
+        if not matches:
+            raise JobError(404, f"No hidden file named {name}")
+        entry = matches[0]
+    else:
+        index = index or 0
+        if not 0 <= index < len(entries):
+            raise JobError(404, f"No hidden file at index {index}, the image holds {len(entries)}")
+        entry = entries[index]
+
+    with stage("extract"):
+        data = read_entry(reader, entry)
+    track(len(data))
+    return entry, data
+
+
+@ContainerRouter.post("/encode")
+async def encode(
+        files: List[UploadFile] = File(..., description="The files to hide, listed in this order"),
+        carrier_image: Optional[UploadFile] = File(None, description="The carrier image to hide the files in"),
+        output_format: Optional[str] = Form(None, description="Result format (png, webp, tiff, bmp), all lossless"),
+        png_compression: Optional[int] = Form(None, description="PNG compression level 0-9"),
+        png_strategy: Optional[str] = Form(None, description="PNG zlib strategy (default, filtered, huffman, rle, fixed)"),
+        png_filter: Optional[str] = Form(None, description="PNG row filter (none, sub, up, avg, paeth, fast, all)"),
+        carrier_id: Optional[str] = Form(None, description="ID of a carrier uploaded once to /carriers"),
+        compression: Optional[str] = Form(None, description="Per-file compression (none, auto, zlib, lzma)")
+):
+    """
+    Hide several files in one carrier, behind an index of names, types
+    and offsets, so each can be listed and extracted on its own.
+    Decoders that predate containers see one blob.
+    """
+    try:
+        options = resolve_output_options(output_format, png_compression, png_strategy, png_filter)
+        compression = resolve_compression(compression)
+
+        carrier = await resolve_carrier(carrier_image, carrier_id)
+        entries = []
+        for upload in files:
+            name = posixpath.basename((upload.filename or "").replace("\\", "/")) or f"file_{len(entries)}"
+            entries.append((name, upload.content_type, bytes(await read_upload(upload))))
+        total = sum(len(data) for _, _, data in entries)
+
+        if carrier.image is None and use_strips(carrier.data, options):
+            path = await get_pool("encode").run(container_encode_job, carrier.data, entries, options, compression, True)
+            return FileResponse(
+                path,
+                media_type=output_media_type(options),
+                headers={
+                    "Content-Disposition": f"attachment; filename=encoded_{carrier.filename.rsplit('.', 1)[0]}{output_extension(options)}",
+                    "X-Hidden-Files": str(len(entries)),
+                    "X-Hidden-Size": str(total),
+                    "X-Cache": "MISS"
+                },
+                background=BackgroundTask(os.remove, path)
+            )
+
+        cache_key = await result_cache.key("container/encode", LSBSteg.name, carrier.cache_part,
+                                           *[part for entry in entries for part in entry], tuple(options), compression)
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            encoded = cached[0]
+        else:
+            carrier_arg = carrier.image if carrier.image is not None else carrier.data
+            encoded = await get_pool("encode").run(container_encode_job, carrier_arg, entries, options, compression)
+            await result_cache.put(cache_key, encoded)
+
+        return BufferResponse(
+            encoded,
+            media_type=output_media_type(options),
+            headers={
+                "Content-Disposition": f"attachment; filename=encoded_{carrier.filename.rsplit('.', 1)[0]}{output_extension(options)}",
+                "X-Hidden-Files": str(len(entries)),
+                "X-Hidden-Size": str(total),
+                "X-Cache": "HIT" if cached is not None else "MISS"
+            },
+            etag=cache_key
+        )
+
+    except SteganographyException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@ContainerRouter.post("/list")
+async def list_files(
+        steg_image: UploadFile = File(..., description="The image with hidden files")
+):
+    """
+    List the hidden files: name, content type, size, compression. Only
+    the header and the index are read. An image from /text/encode is
+    listed as one entry.
+    """
+    try:
+        img_bytes = await read_upload(steg_image)
+        return JSONResponse(await get_pool("decode").run(list_job, img_bytes))
+
+    except SteganographyException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@ContainerRouter.post("/extract")
+async def extract(
+        steg_image: UploadFile = File(..., description="The image with hidden files"),
+        name: Optional[str] = Form(None, description="Name of the file to extract"),
+        index: Optional[int] = Form(None, description="Position of the file to extract, from /list")
+):
+    """
+    Extract one hidden file by name or index (the first one by default),
+    reading only the index and that file's bits.
+    """
+    try:
+        img_bytes = await read_upload(steg_image)
+
+        cache_key = await result_cache.key("container/extract", LSBSteg.name, img_bytes, name, index)
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            data, meta = cached
+            entry_name, content_type = meta["name"], meta["content_type"]
+        else:
+            entry, data = await get_pool("decode").run(extract_entry_job, img_bytes, name, index)
+            entry_name, content_type = entry.name, entry.content_type
+            await result_cache.put(cache_key, data, {"name": entry_name, "content_type": content_type})
+
+        return BufferResponse(
+            data,
+            media_type=content_type,
+            headers={
+                "Content-Disposition": f"attachment; filename={attachment_name(entry_name)}",
+                "X-Extracted-Size": str(len(data)),
+                "X-Cache": "HIT" if cached is not None else "MISS"
+            },
+            etag=cache_key
+        )
+
+    except SteganographyException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
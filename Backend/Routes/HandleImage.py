@@ -1,223 +1,499 @@
-import io
+import hashlib
+import os
+from collections import OrderedDict
 from typing import Optional
 
 import cv2
 import numpy as np
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import Depends, FastAPI, UploadFile, File, HTTPException, Form
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.routing import APIRouter
+from starlette.background import BackgroundTask
 
-ImageRouter = APIRouter()
+from Core.Admission import admitted
+from Core.Compression import choose_secret_png_level, pack, resolve_compression, secret_png_params, unpack
+from Core.CarrierStore import copy_on_write_prefix, decoded_carrier, resolve_carrier
+from Core.ImageHeader import read_header
+from Core.Memory import release, track, tracked, transient
+from Core.Metrics import body_parsed, record_pixels, stage
+from Core.Output import (JPEG_EXTENSION, JPEG_MEDIA_TYPE, BufferResponse, encode_output, encode_output_blocks,
+                         output_extension, output_media_type, resolve_embedding, resolve_output_options)
+from Core.ResultCache import result_cache
+from Core.RowReader import read_payload_rows
+from Core.Steg import (IMAGE_BACKEND, DctSteg, SteganographyException, dct_extract, get_backend, is_jpeg,
+                       jpeg_carrier, scratch_bytes)
+from Core.Strips import embedded_strips, read_stream, strip_layout, use_strips, write_strips
+from Core.Uploads import read_upload
+from Core.WorkerPool import JobError, get_pool
 
+ImageRouter = APIRouter(dependencies=[Depends(body_parsed), Depends(admitted)])
 
-class SteganographyException(Exception):
-    pass
 
+LSBSteg = get_backend(IMAGE_BACKEND)
 
-class LSBSteg:
-    def __init__(self, im):
-        self.image = im
-        self.height, self.width, self.nbchannels = im.shape
-        self.size = self.width * self.height
 
-        # Flatten image for faster access
-        self.flat_image = im.reshape(-1)
-        self.max_bytes = len(self.flat_image) // 8
+@ImageRouter.get("/")
+async def root():
+    return {
+        "message": "Image Steganography API",
+        "endpoints": {
+            "/encode-image": "POST - Hide an image inside another image",
+            "/decode-image": "POST - Extract hidden image from a carrier image",
+            "/check-capacity": "POST - Check if carrier can hold secret image"
+        }
+    }
+
+
+# PNG-encoded size of recently seen secret images, keyed by content hash.
+# Lets /check-capacity skip the secret decode/re-encode on repeat checks.
+SECRET_INFO_CACHE_SIZE = 1024
+secret_info_cache = OrderedDict()
+
 
-    def encode_binary(self, data):
-        data_len = len(data)
+def secret_key(secret_bytes):
+    return hashlib.blake2b(secret_bytes, digest_size=16).digest()
 
-        # Check capacity
-        if data_len > self.max_bytes - 8:
-            raise SteganographyException("Carrier image not big enough to hold all the data")
 
-        # Convert length to 64-bit binary
-        len_bits = np.array([int(b) for b in format(data_len, '064b')], dtype=np.uint8)
+def cached_secret_info(key):
+    info = secret_info_cache.get(key)
+    if info is not None:
+        secret_info_cache.move_to_end(key)
+    return info
 
-        # Convert data bytes to bits
-        data_bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
 
-        # Combine length and data bits
-        all_bits = np.concatenate([len_bits, data_bits])
+def remember_secret_info(key, info):
+    secret_info_cache[key] = info
+    secret_info_cache.move_to_end(key)
+    while len(secret_info_cache) > SECRET_INFO_CACHE_SIZE:
+        secret_info_cache.popitem(last=False)
 
-        # Get the pixel values we need to modify
-        num_bits = len(all_bits)
-        pixels = self.flat_image[:num_bits].copy()
 
-        # Clear LSBs and set new bits
-        # Much faster than loop: clear bit 0, then OR with new bit
-        pixels = (pixels & 0xFE) | all_bits
+def secret_info_job(secret_bytes):
+    # Read secret image
+    secret_array = np.frombuffer(secret_bytes, np.uint8)
+    with stage("secret_imdecode"):
+        secret_img = cv2.imdecode(secret_array, cv2.IMREAD_COLOR)
 
-        # Update the flattened image
-        self.flat_image[:num_bits] = pixels
+    if secret_img is None:
+        raise JobError(400, "Invalid secret image format")
+    track(secret_img.nbytes)
 
-        # Reshape back to original shape
-        return self.flat_image.reshape(self.height, self.width, self.nbchannels)
+    # Encode secret image to PNG to get actual byte size
+    with stage("secret_png"):
+        success, encoded_secret = cv2.imencode('.png', secret_img)
+    if not success:
+        raise JobError(500, "Failed to encode secret image")
 
-    def decode_binary(self):
-        # Read length (first 64 bits)
-        len_pixels = self.flat_image[:64]
-        len_bits = len_pixels & 1
-        data_len = int(''.join(map(str, len_bits)), 2)
+    secret_h, secret_w, secret_c = secret_img.shape
+    return secret_w, secret_h, secret_c, len(encoded_secret)
 
-        if data_len <= 0 or data_len > self.max_bytes:
-            return b""
 
-        # Read data bits
-        total_bits = data_len * 8
-        data_pixels = self.flat_image[64:64 + total_bits]
-        data_bits = data_pixels & 1
+def carrier_info_job(carrier_bytes):
+    # Full decode, only used when the header can't be parsed
+    carrier_array = np.frombuffer(carrier_bytes, np.uint8)
+    with stage("imdecode"):
+        carrier_img = cv2.imdecode(carrier_array, cv2.IMREAD_COLOR)
 
-        # Pack bits back to bytes
-        output = np.packbits(data_bits).tobytes()
+    if carrier_img is None:
+        raise JobError(400, "Invalid carrier image format")
+    track(carrier_img.nbytes)
 
-        return output
+    carrier_h, carrier_w, carrier_c = carrier_img.shape
+    return carrier_w, carrier_h, carrier_c
 
 
-@ImageRouter.get("/")
-async def root():
+def dct_carrier_info_job(carrier_bytes, secret_size):
+    """
+    embedding=dct capacity depends on the coefficients. Whether the secret
+    fits is exact, from a walk as far as the secret reaches; the capacity
+    itself is estimated unless that walk hit the end of the scan.
+    """
+    steg = DctSteg(carrier_bytes)
+    with stage("capacity"):
+        fits = steg.fits(secret_size)
+        capacity = steg.estimated_capacity()
+    return (steg.width, steg.height, steg.nbchannels), capacity, fits, not steg.capacity_known()
+
+
+def capacity_report(carrier_w, carrier_h, carrier_c, secret_w, secret_h, secret_c, secret_size,
+                    carrier_capacity=None, embedding="pixels", can_encode=None):
+    # Calculate carrier capacity (in bytes)
+    if carrier_capacity is None:
+        carrier_capacity = LSBSteg.capacity(carrier_w, carrier_h, carrier_c)
+
+    # Check if encoding is possible
+    if can_encode is None:
+        can_encode = secret_size <= carrier_capacity
+    usage_percent = (secret_size / carrier_capacity * 100) if carrier_capacity > 0 else 0
+
     return {
-        "message": "Image Steganography API",
-        "endpoints": {
-            "/encode-image": "POST - Hide an image inside another image",
-            "/decode-image": "POST - Extract hidden image from a carrier image",
-            "/check-capacity": "POST - Check if carrier can hold secret image"
+        "can_encode": can_encode,
+        "carrier_info": {
+            "dimensions": f"{carrier_w}x{carrier_h}",
+            "channels": carrier_c,
+            "capacity_bytes": carrier_capacity,
+            "capacity_mb": round(carrier_capacity / (1024 * 1024), 2),
+            "embedding": embedding
+        },
+        "secret_info": {
+            "dimensions": f"{secret_w}x{secret_h}",
+            "channels": secret_c,
+            "size_bytes": secret_size,
+            "size_kb": round(secret_size / 1024, 2)
+        },
+        "analysis": {
+            "bytes_available": max(0, carrier_capacity - secret_size) if can_encode else 0,
+            "usage_percent": round(usage_percent, 2),
+            "recommendation": "Encoding possible" if can_encode else
+            f"Carrier too small. Need {max(1, secret_size - carrier_capacity)} more bytes of capacity"
         }
     }
 
 
-@ImageRouter.post("/check-capacity")
-async def check_capacity(
-        carrier_image: UploadFile = File(..., description="The carrier image"),
-        secret_image: UploadFile = File(..., description="The image to hide")
-):
-    try:
-        # Read carrier image
-        carrier_bytes = await carrier_image.read()
-        carrier_array = np.frombuffer(carrier_bytes, np.uint8)
-        carrier_img = cv2.imdecode(carrier_array, cv2.IMREAD_COLOR)
-
+def encode_job(carrier_bytes, secret_bytes, options, compression="none"):
+    # Read carrier image; the encoded result doesn't refer to it, so its
+    # buffer goes back to the pool on return
+    with decoded_carrier(carrier_bytes) as carrier_img:
         if carrier_img is None:
-            raise HTTPException(status_code=400, detail="Invalid carrier image format")
-
-        # Read secret image
-        secret_bytes = await secret_image.read()
-        secret_array = np.frombuffer(secret_bytes, np.uint8)
+            raise JobError(400, "Invalid carrier image format")
+        with tracked(carrier_img.nbytes):
+            return embed_job(carrier_img, secret_bytes, options, compression)
+
+
+def prepare_secret(secret_bytes, compression="none"):
+    """
+    Decode the secret image and re-encode it as PNG, then compress it per
+    `compression`; the result is what gets embedded. Returns
+    (secret_img.shape, secret_data).
+    """
+    # Read secret image
+    secret_array = np.frombuffer(secret_bytes, np.uint8)
+    with stage("secret_imdecode"):
         secret_img = cv2.imdecode(secret_array, cv2.IMREAD_COLOR)
 
-        if secret_img is None:
-            raise HTTPException(status_code=400, detail="Invalid secret image format")
+    if secret_img is None:
+        raise JobError(400, "Invalid secret image format")
+    track(secret_img.nbytes)
+
+    # Encode secret image to PNG (lossless) to get bytes
+    with stage("secret_png"):
+        level = choose_secret_png_level(secret_img, compression)
+        success, encoded_secret = cv2.imencode('.png', secret_img, secret_png_params(level))
+    if not success:
+        raise JobError(500, "Failed to encode secret image")
+
+    secret_data = encoded_secret.tobytes()
+    track(len(secret_data))
+    # cv2's buffer, copied into secret_data
+    transient(len(secret_data))
+    release(secret_img.nbytes)
+    with stage("compress"):
+        secret_data, _ = pack(secret_data, compression)
+    return secret_img.shape, secret_data
+
+
+def check_capacity_fits(width, height, channels, secret_data):
+    # Calculate capacity
+    max_bytes = LSBSteg.capacity(width, height, channels)
+
+    if len(secret_data) > max_bytes:
+        raise JobError(
+            400,
+            f"Secret image too large. Carrier can hold max {max_bytes} bytes ({round(max_bytes / 1024, 2)} KB), "
+            f"but secret image is {len(secret_data)} bytes ({round(len(secret_data) / 1024, 2)} KB). "
+            f"Try using a larger carrier image or compress the secret image."
+        )
 
-        # Calculate dimensions
-        carrier_h, carrier_w, carrier_c = carrier_img.shape
-        secret_h, secret_w, secret_c = secret_img.shape
 
-        # Encode secret image to PNG to get actual byte size
-        success, encoded_secret = cv2.imencode('.png', secret_img)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to encode secret image")
+def embed_job(carrier_img, secret_bytes, options, compression="none"):
+    secret_shape, secret_data = prepare_secret(secret_bytes, compression)
+    height, width, channels = carrier_img.shape
+    record_pixels(width, height)
+    check_capacity_fits(width, height, channels, secret_data)
+
+    if not carrier_img.flags.writeable:
+        # Shared carrier from /carriers: copy only the rows the payload touches
+        with copy_on_write_prefix(carrier_img, (len(secret_data) + 8) * 8) as (prefix, rows), tracked(prefix.nbytes):
+            with stage("embed"):
+                LSBSteg(prefix).encode_binary(secret_data)
+            # The payload bits, unpacked a chunk at a time
+            transient(scratch_bytes(len(secret_data)))
+
+            with stage("imencode"):
+                encoded = encode_output_blocks([prefix, carrier_img[rows:]], options)
+            if encoded is None:
+                raise JobError(500, "Failed to encode result image")
+            track(len(encoded))
+        return encoded, secret_shape, len(secret_data)
+
+    with stage("embed"):
+        steg = LSBSteg(carrier_img)
+        result_img = steg.encode_binary(secret_data)
+    transient(scratch_bytes(len(secret_data)))
+
+    # Encode to a lossless format (required for steganography)
+    with stage("imencode"):
+        encoded_img = encode_output(result_img, options)
+    if encoded_img is None:
+        raise JobError(500, "Failed to encode result image")
+    track(2 * len(encoded_img))
+
+    return encoded_img.reshape(-1), secret_shape, len(secret_data)
+
+
+def strip_encode_job(carrier_bytes, secret_bytes, options, compression="none"):
+    """
+    encode_job for carriers over the strip threshold: the carrier is read,
+    embedded and written out a strip at a time. Returns the output path.
+    """
+    secret_shape, secret_data = prepare_secret(secret_bytes, compression)
+    width, height = strip_layout(carrier_bytes)
+    record_pixels(width, height)
+    check_capacity_fits(width, height, 3, secret_data)
+
+    with stage("strips"):
+        path = write_strips(embedded_strips(carrier_bytes, secret_data), width, height, options)
+    return path, secret_shape, len(secret_data)
+
+
+def dct_encode_job(carrier_bytes, secret_bytes, compression="none"):
+    """
+    encode_job for embedding=dct: the secret goes into the carrier's DCT
+    coefficients and the result is the carrier's JPEG.
+    """
+    secret_shape, secret_data = prepare_secret(secret_bytes, compression)
+    steg = DctSteg(carrier_bytes)
+    record_pixels(steg.width, steg.height)
+
+    with stage("embed"):
+        encoded = steg.encode_binary(secret_data)
+    track(len(encoded))
+    # The payload bits, alongside the result while it was built
+    transient((len(secret_data) + 8) * 8)
+    return encoded, secret_shape, len(secret_data)
+
+
+def strip_extract(img_bytes, width, height):
+    # Same results as LSBSteg.decode_binary, a strip at a time
+    hidden_data = LSBSteg.extract(lambda start, count: read_stream(img_bytes, start, count), width * height * 3)
+    track(len(hidden_data))
+    # The bits, gathered in one array before packing
+    transient(len(hidden_data) * 8)
+    return hidden_data
+
+
+def decode_job(img_bytes, output_format):
+    # JPEGs whose DCT prefix validates hold an embedding=dct payload; any
+    # other image goes the pixel way
+    hidden_data = dct_extract(img_bytes)
+    if hidden_data is not None:
+        return decode_hidden_image(hidden_data, output_format)
+
+    layout = strip_layout(img_bytes)
+    if layout is not None:
+        record_pixels(*layout)
+        with stage("strips"):
+            hidden_data = strip_extract(img_bytes, *layout)
+        return decode_hidden_image(hidden_data, output_format)
+
+    # Only the rows holding the payload when the format allows it
+    with stage("read_rows"):
+        img = read_payload_rows(img_bytes)
+    if img is not None:
+        header = read_header(img_bytes)
+        record_pixels(header.width, header.height)
+    else:
+        # Read steganography image
+        img_array = np.frombuffer(img_bytes, np.uint8)
+        with stage("imdecode"):
+            img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
 
-        secret_size = len(encoded_secret.tobytes())
+        if img is None:
+            raise JobError(400, "Invalid image format")
+        record_pixels(img.shape[1], img.shape[0])
+    track(img.nbytes)
 
-        # Calculate carrier capacity (in bytes)
-        # 64 bits (8 bytes) reserved for storing data length
-        carrier_capacity = (carrier_w * carrier_h * carrier_c // 8) - 8
+    # Decode hidden data
+    with stage("extract"):
+        steg = LSBSteg(img)
+        hidden_data = steg.decode_binary()
+    track(len(hidden_data))
+    # The chunk buffers and the pooled packed copy, next to the image
+    transient(scratch_bytes(len(hidden_data)) + len(hidden_data))
+    release(img.nbytes)
+    return decode_hidden_image(hidden_data, output_format)
 
-        # Check if encoding is possible
-        can_encode = secret_size <= carrier_capacity
-        usage_percent = (secret_size / carrier_capacity * 100) if carrier_capacity > 0 else 0
-
-        return JSONResponse({
-            "can_encode": can_encode,
-            "carrier_info": {
-                "dimensions": f"{carrier_w}x{carrier_h}",
-                "channels": carrier_c,
-                "capacity_bytes": carrier_capacity,
-                "capacity_mb": round(carrier_capacity / (1024 * 1024), 2)
-            },
-            "secret_info": {
-                "dimensions": f"{secret_w}x{secret_h}",
-                "channels": secret_c,
-                "size_bytes": secret_size,
-                "size_kb": round(secret_size / 1024, 2)
-            },
-            "analysis": {
-                "bytes_available": carrier_capacity - secret_size if can_encode else 0,
-                "usage_percent": round(usage_percent, 2),
-                "recommendation": "Encoding possible" if can_encode else
-                f"Carrier too small. Need {secret_size - carrier_capacity} more bytes of capacity"
-            }
-        })
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+def decode_hidden_image(hidden_data, output_format):
+    if len(hidden_data) == 0:
+        raise JobError(404, "No hidden data found in image")
 
-@ImageRouter.post("/encode-image")
-async def encode_image(
-        carrier_image: UploadFile = File(..., description="The carrier image to hide data in"),
-        secret_image: UploadFile = File(..., description="The image to hide inside carrier")
-):
-    try:
-        # Read carrier image
-        carrier_bytes = await carrier_image.read()
-        carrier_array = np.frombuffer(carrier_bytes, np.uint8)
-        carrier_img = cv2.imdecode(carrier_array, cv2.IMREAD_COLOR)
+    with stage("decompress"):
+        hidden_data = unpack(hidden_data)
 
-        if carrier_img is None:
-            raise HTTPException(status_code=400, detail="Invalid carrier image format")
+    # Try to decode as image
+    hidden_array = np.frombuffer(hidden_data, np.uint8)
+    with stage("secret_imdecode"):
+        hidden_img = cv2.imdecode(hidden_array, cv2.IMREAD_COLOR)
+    if hidden_img is not None:
+        track(hidden_img.nbytes)
+
+    if hidden_img is None:
+        raise JobError(
+            400,
+            "Hidden data found but could not be decoded as an image. "
+            "The hidden data might not be an image or may be corrupted."
+        )
 
-        # Read secret image
-        secret_bytes = await secret_image.read()
-        secret_array = np.frombuffer(secret_bytes, np.uint8)
-        secret_img = cv2.imdecode(secret_array, cv2.IMREAD_COLOR)
+    # Re-encode in requested format
+    with stage("imencode"):
+        success, output_img = cv2.imencode(EXT_MAP[output_format], hidden_img)
+    if not success:
+        raise JobError(500, "Failed to encode extracted image")
+    track(2 * len(output_img))
 
-        if secret_img is None:
-            raise HTTPException(status_code=400, detail="Invalid secret image format")
+    return output_img.reshape(-1), hidden_img.shape
 
-        # Encode secret image to PNG (lossless) to get bytes
-        success, encoded_secret = cv2.imencode('.png', secret_img)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to encode secret image")
 
-        secret_data = encoded_secret.tobytes()
+EXT_MAP = {"png": ".png", "jpg": ".jpg", "jpeg": ".jpg", "bmp": ".bmp"}
+MIME_MAP = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "bmp": "image/bmp"}
 
-        # Calculate capacity
-        height, width, channels = carrier_img.shape
-        max_bytes = (width * height * channels // 8) - 8  # 64 bits for length
 
-        if len(secret_data) > max_bytes:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Secret image too large. Carrier can hold max {max_bytes} bytes ({round(max_bytes / 1024, 2)} KB), "
-                f"but secret image is {len(secret_data)} bytes ({round(len(secret_data) / 1024, 2)} KB). "
-                f"Try using a larger carrier image or compress the secret image."
+@ImageRouter.post("/check-capacity")
+async def check_capacity(
+        carrier_image: UploadFile = File(..., description="The carrier image"),
+        secret_image: UploadFile = File(..., description="The image to hide"),
+        embedding: Optional[str] = Form(None, description="Capacity for pixels (default) or dct embedding")
+):
+    try:
+        embedding = resolve_embedding(embedding)
+        carrier_bytes = await read_upload(carrier_image)
+        secret_bytes = await read_upload(secret_image)
+
+        if embedding == "dct" and not is_jpeg(carrier_bytes):
+            raise HTTPException(status_code=400, detail="embedding=dct needs a JPEG carrier")
+
+        key = secret_key(secret_bytes)
+        secret_info = cached_secret_info(key)
+        if secret_info is None:
+            secret_info = await get_pool("decode").run(secret_info_job, secret_bytes)
+            remember_secret_info(key, secret_info)
+
+        if embedding == "dct":
+            carrier_info, carrier_capacity, can_encode, estimated = await get_pool("decode").run(
+                dct_carrier_info_job, carrier_bytes, secret_info[3]
             )
+            record_pixels(carrier_info[0], carrier_info[1])
+            report = capacity_report(*carrier_info, *secret_info, carrier_capacity, embedding, can_encode)
+            report["carrier_info"]["capacity_estimated"] = estimated
+            return JSONResponse(report)
 
-        # Encode
-        steg = LSBSteg(carrier_img)
-        result_img = steg.encode_binary(secret_data)
+        # Carrier capacity comes from the header alone when possible
+        header = read_header(carrier_bytes)
+        if header is not None:
+            carrier_info = (header.width, header.height, header.channels)
+        else:
+            carrier_info = await get_pool("decode").run(carrier_info_job, carrier_bytes)
+        record_pixels(carrier_info[0], carrier_info[1])
+
+        return JSONResponse(capacity_report(*carrier_info, *secret_info))
+
+    except SteganographyException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
-        # Encode to PNG (lossless format required for steganography)
-        success, encoded_img = cv2.imencode('.png', result_img)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to encode result image")
 
-        # Get dimensions for metadata
-        secret_h, secret_w, _ = secret_img.shape
+@ImageRouter.post("/encode-image")
+async def encode_image(
+        carrier_image: Optional[UploadFile] = File(None, description="The carrier image to hide data in"),
+        secret_image: UploadFile = File(..., description="The image to hide inside carrier"),
+        output_format: Optional[str] = Form(None, description="Result format (png, webp, tiff, bmp), all lossless"),
+        png_compression: Optional[int] = Form(None, description="PNG compression level 0-9"),
+        png_strategy: Optional[str] = Form(None, description="PNG zlib strategy (default, filtered, huffman, rle, fixed)"),
+        png_filter: Optional[str] = Form(None, description="PNG row filter (none, sub, up, avg, paeth, fast, all)"),
+        carrier_id: Optional[str] = Form(None, description="ID of a carrier uploaded once to /carriers"),
+        compression: Optional[str] = Form(None, description="Payload compression (none, auto, zlib, lzma)"),
+        embedding: Optional[str] = Form(None, description="Where the secret goes: pixels (default) or dct, "
+                                                          "in a JPEG carrier's coefficients, returning a JPEG")
+):
+    try:
+        embedding = resolve_embedding(embedding, output_format)
+        options = resolve_output_options(output_format if embedding == "pixels" else None,
+                                         png_compression, png_strategy, png_filter)
+        compression = resolve_compression(compression)
+
+        carrier = await resolve_carrier(carrier_image, carrier_id)
+        secret_bytes = await read_upload(secret_image)
+
+        if embedding == "dct":
+            jpeg_carrier(carrier)
+            media_type, extension = JPEG_MEDIA_TYPE, JPEG_EXTENSION
+        else:
+            media_type, extension = output_media_type(options), output_extension(options)
+
+        if embedding == "pixels" and carrier.image is None and use_strips(carrier.data, options):
+            # Too big to hold decoded: written to a temp file strip by
+            # strip and sent from there, skipping the result cache
+            path, (secret_h, secret_w, secret_c), secret_size = await get_pool("encode").run(
+                strip_encode_job, carrier.data, secret_bytes, options, compression
+            )
+            if compression == "none":
+                remember_secret_info(secret_key(secret_bytes), (secret_w, secret_h, secret_c, secret_size))
+            return FileResponse(
+                path,
+                media_type=output_media_type(options),
+                headers={
+                    "Content-Disposition": f"attachment; filename=steg_{carrier.filename.rsplit('.', 1)[0]}{output_extension(options)}",
+                    "X-Secret-Dimensions": f"{secret_w}x{secret_h}",
+                    "X-Secret-Size": str(secret_size),
+                    "X-Original-Secret": secret_image.filename,
+                    "X-Cache": "MISS"
+                },
+                background=BackgroundTask(os.remove, path)
+            )
 
-        # Return as streaming response
-        return StreamingResponse(
-            io.BytesIO(encoded_img.tobytes()),
-            media_type="image/png",
+        cache_key = await result_cache.key("image/encode-image", LSBSteg.name, carrier.cache_part, secret_bytes,
+                                           tuple(options), compression, embedding)
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            encoded, meta = cached
+            (secret_h, secret_w, secret_c), secret_size = meta["secret_shape"], meta["secret_size"]
+        else:
+            if embedding == "dct":
+                encoded, (secret_h, secret_w, secret_c), secret_size = await get_pool("encode").run(
+                    dct_encode_job, carrier.data, secret_bytes, compression
+                )
+            else:
+                if carrier.image is not None:
+                    job, carrier_arg = embed_job, carrier.image
+                else:
+                    job, carrier_arg = encode_job, carrier.data
+                encoded, (secret_h, secret_w, secret_c), secret_size = await get_pool("encode").run(
+                    job, carrier_arg, secret_bytes, options, compression
+                )
+            if compression == "none":
+                # /check-capacity sizes secrets uncompressed
+                remember_secret_info(secret_key(secret_bytes), (secret_w, secret_h, secret_c, secret_size))
+            await result_cache.put(cache_key, encoded, {
+                "secret_shape": [secret_h, secret_w, secret_c],
+                "secret_size": secret_size
+            })
+
+        # Served straight from the encoder's buffer
+        return BufferResponse(
+            encoded,
+            media_type=media_type,
             headers={
-                "Content-Disposition": f"attachment; filename=steg_{carrier_image.filename.rsplit('.', 1)[0]}.png",
+                "Content-Disposition": f"attachment; filename=steg_{carrier.filename.rsplit('.', 1)[0]}{extension}",
                 "X-Secret-Dimensions": f"{secret_w}x{secret_h}",
-                "X-Secret-Size": str(len(secret_data)),
-                "X-Original-Secret": secret_image.filename
-            }
+                "X-Secret-Size": str(secret_size),
+                "X-Original-Secret": secret_image.filename,
+                "X-Cache": "HIT" if cached is not None else "MISS"
+            },
+            etag=cache_key
         )
 
     except SteganographyException as e:
@@ -235,59 +511,35 @@ async def decode_image(
 ):
     try:
         # Validate output format
-        valid_formats = ["png", "jpg", "jpeg", "bmp"]
         output_format = output_format.lower()
-        if output_format not in valid_formats:
+        if output_format not in EXT_MAP:
             output_format = "png"
 
-        # Read steganography image
-        img_bytes = await steg_image.read()
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+        img_bytes = await read_upload(steg_image)
 
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
+        cache_key = await result_cache.key("image/decode-image", LSBSteg.name, img_bytes, output_format)
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            output, meta = cached
+            height, width, channels = meta["shape"]
+        else:
+            output, (height, width, channels) = await get_pool("decode").run(decode_job, img_bytes, output_format)
+            await result_cache.put(cache_key, output, {"shape": [height, width, channels]})
 
-        # Decode hidden data
-        steg = LSBSteg(img)
-        hidden_data = steg.decode_binary()
-
-        if len(hidden_data) == 0:
-            raise HTTPException(status_code=404, detail="No hidden data found in image")
-
-        # Try to decode as image
-        hidden_array = np.frombuffer(hidden_data, np.uint8)
-        hidden_img = cv2.imdecode(hidden_array, cv2.IMREAD_COLOR)
-
-        if hidden_img is None:
-            raise HTTPException(
-                status_code=400,
-                detail="Hidden data found but could not be decoded as an image. "
-                "The hidden data might not be an image or may be corrupted."
-            )
+        extension = EXT_MAP[output_format]
+        mime_type = MIME_MAP[output_format]
 
-        # Re-encode in requested format
-        ext_map = {"png": ".png", "jpg": ".jpg", "jpeg": ".jpg", "bmp": ".bmp"}
-        mime_map = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "bmp": "image/bmp"}
-
-        extension = ext_map.get(output_format, ".png")
-        mime_type = mime_map.get(output_format, "image/png")
-
-        success, output_img = cv2.imencode(extension, hidden_img)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to encode extracted image")
-
-        height, width, channels = hidden_img.shape
-
-        return StreamingResponse(
-            io.BytesIO(output_img.tobytes()),
+        return BufferResponse(
+            output,
             media_type=mime_type,
             headers={
                 "Content-Disposition": f"attachment; filename=extracted_image{extension}",
                 "X-Image-Dimensions": f"{width}x{height}",
                 "X-Image-Channels": str(channels),
-                "X-Extracted-Size": str(len(output_img.tobytes()))
-            }
+                "X-Extracted-Size": str(len(output)),
+                "X-Cache": "HIT" if cached is not None else "MISS"
+            },
+            etag=cache_key
         )
 
     except SteganographyException as e:
@@ -295,4 +547,4 @@ async def decode_image(
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -0,0 +1,231 @@
+from typing import Optional
+
+from fastapi import Depends, UploadFile, File, HTTPException, Form
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.routing import APIRouter
+
+from Core.CarrierStore import resolve_carrier
+from Core.Compression import resolve_compression
+from Core.JobQueue import job_queue
+from Core.Metrics import body_parsed
+from Core.Output import output_extension, output_media_type, resolve_output_options
+from Core.Strips import use_strips
+from Core.Uploads import read_upload
+from Core.WorkerPool import JobError, get_pool
+from Routes import HandleImage, HandleText
+
+JobsRouter = APIRouter(dependencies=[Depends(body_parsed)])
+
+
+def accepted(job):
+    return JSONResponse(
+        status_code=202,
+        content={
+            **job.info(),
+            "status_url": f"/jobs/{job.job_id}",
+            "result_url": f"/jobs/{job.job_id}/result"
+        },
+        headers={"Location": f"/jobs/{job.job_id}"}
+    )
+
+
+def stem(filename):
+    return (filename or "carrier").rsplit('.', 1)[0]
+
+
+@JobsRouter.get("/")
+async def root():
+    return {
+        "message": "Background Job API",
+        "endpoints": {
+            "/text/encode": "POST - Queue a /text/encode request",
+            "/text/decode": "POST - Queue a /text/decode request",
+            "/image/encode-image": "POST - Queue an /image/encode-image request",
+            "/image/decode-image": "POST - Queue an /image/decode-image request",
+            "/{job_id}": "GET - Job status and progress, DELETE - Cancel or drop the job",
+            "/{job_id}/result": "GET - Download the result of a finished job"
+        },
+        "jobs": job_queue.list(),
+        "stats": job_queue.stats()
+    }
+
+
+@JobsRouter.post("/text/encode")
+async def queue_text_encode(
+        carrier_image: Optional[UploadFile] = File(None, description="The carrier image to hide data in"),
+        secret_file: UploadFile = File(..., description="The file to hide (text, image, zip, etc.)"),
+        output_format: Optional[str] = Form(None, description="Result format (png, webp, tiff, bmp), all lossless"),
+        png_compression: Optional[int] = Form(None, description="PNG compression level 0-9"),
+        png_strategy: Optional[str] = Form(None, description="PNG zlib strategy (default, filtered, huffman, rle, fixed)"),
+        png_filter: Optional[str] = Form(None, description="PNG row filter (none, sub, up, avg, paeth, fast, all)"),
+        carrier_id: Optional[str] = Form(None, description="ID of a carrier uploaded once to /carriers"),
+        compression: Optional[str] = Form(None, description="Payload compression (none, auto, zlib, lzma)")
+):
+    """
+    Same inputs as /text/encode. Returns 202 with a job ID straight away;
+    poll /jobs/{job_id} and download /jobs/{job_id}/result when done.
+    """
+    options = resolve_output_options(output_format, png_compression, png_strategy, png_filter)
+    compression = resolve_compression(compression)
+    carrier = await resolve_carrier(carrier_image, carrier_id)
+    secret_data = await read_upload(secret_file)
+
+    inputs = {"secret": secret_data}
+    if carrier.image is None:
+        inputs["carrier"] = carrier.data
+    secret_name = secret_file.filename
+
+    async def work(job, files):
+        if carrier.image is not None:
+            # Cached carrier from /carriers stays in memory, not on disk
+            encoded = await get_pool("encode").run_when_free(
+                HandleText.embed_job, carrier.image, files["secret"], options, compression
+            )
+        elif use_strips(files["carrier"], options):
+            # Too big to hold decoded: the strip path's file becomes the result
+            encoded = await get_pool("encode").run_when_free(
+                HandleText.strip_encode_job, files["carrier"], files["secret"], options, compression
+            )
+        else:
+            encoded = await get_pool("encode").run_when_free(
+                HandleText.encode_job, files["carrier"], files["secret"], options, compression
+            )
+        return encoded, f"encoded_{stem(carrier.filename)}{output_extension(options)}", output_media_type(options), {
+            "X-Original-Filename": secret_name,
+            "X-Hidden-Size": str(len(files["secret"]))
+        }
+
+    return accepted(await job_queue.submit("text/encode", inputs, work))
+
+
+@JobsRouter.post("/text/decode")
+async def queue_text_decode(
+        steg_image: UploadFile = File(..., description="The image with hidden data"),
+        output_filename: Optional[str] = Form(None, description="Name for the extracted file")
+):
+    """
+    Same inputs as /text/decode, run in the background.
+    """
+    img_bytes = await read_upload(steg_image)
+
+    async def work(job, files):
+        hidden_data = await get_pool("decode").run_when_free(HandleText.decode_job, files["image"])
+        if len(hidden_data) == 0:
+            raise JobError(404, "No hidden data found in image")
+        content_type, filename = HandleText.name_extracted_file(hidden_data, output_filename)
+        return hidden_data, filename, content_type, {"X-Extracted-Size": str(len(hidden_data))}
+
+    return accepted(await job_queue.submit("text/decode", {"image": img_bytes}, work))
+
+
+@JobsRouter.post("/image/encode-image")
+async def queue_image_encode(
+        carrier_image: Optional[UploadFile] = File(None, description="The carrier image to hide data in"),
+        secret_image: UploadFile = File(..., description="The image to hide inside carrier"),
+        output_format: Optional[str] = Form(None, description="Result format (png, webp, tiff, bmp), all lossless"),
+        png_compression: Optional[int] = Form(None, description="PNG compression level 0-9"),
+        png_strategy: Optional[str] = Form(None, description="PNG zlib strategy (default, filtered, huffman, rle, fixed)"),
+        png_filter: Optional[str] = Form(None, description="PNG row filter (none, sub, up, avg, paeth, fast, all)"),
+        carrier_id: Optional[str] = Form(None, description="ID of a carrier uploaded once to /carriers"),
+        compression: Optional[str] = Form(None, description="Payload compression (none, auto, zlib, lzma)")
+):
+    """
+    Same inputs as /image/encode-image, run in the background.
+    """
+    options = resolve_output_options(output_format, png_compression, png_strategy, png_filter)
+    compression = resolve_compression(compression)
+    carrier = await resolve_carrier(carrier_image, carrier_id)
+    secret_bytes = await read_upload(secret_image)
+
+    inputs = {"secret": secret_bytes}
+    if carrier.image is None:
+        inputs["carrier"] = carrier.data
+    secret_name = secret_image.filename
+
+    async def work(job, files):
+        if carrier.image is not None:
+            job_fn, carrier_arg = HandleImage.embed_job, carrier.image
+        elif use_strips(files["carrier"], options):
+            # Too big to hold decoded: the strip path's file becomes the result
+            job_fn, carrier_arg = HandleImage.strip_encode_job, files["carrier"]
+        else:
+            job_fn, carrier_arg = HandleImage.encode_job, files["carrier"]
+        encoded, (secret_h, secret_w, _), secret_size = await get_pool("encode").run_when_free(
+            job_fn, carrier_arg, files["secret"], options, compression
+        )
+        return encoded, f"steg_{stem(carrier.filename)}{output_extension(options)}", output_media_type(options), {
+            "X-Secret-Dimensions": f"{secret_w}x{secret_h}",
+            "X-Secret-Size": str(secret_size),
+            "X-Original-Secret": secret_name
+        }
+
+    return accepted(await job_queue.submit("image/encode-image", inputs, work))
+
+
+@JobsRouter.post("/image/decode-image")
+async def queue_image_decode(
+        steg_image: UploadFile = File(..., description="The image containing hidden image"),
+        output_format: Optional[str] = Form("png", description="Output format (png, jpg, bmp)")
+):
+    """
+    Same inputs as /image/decode-image, run in the background.
+    """
+    output_format = (output_format or "png").lower()
+    if output_format not in HandleImage.EXT_MAP:
+        output_format = "png"
+    img_bytes = await read_upload(steg_image)
+
+    async def work(job, files):
+        output, (height, width, channels) = await get_pool("decode").run_when_free(
+            HandleImage.decode_job, files["image"], output_format
+        )
+        return output, f"extracted_image{HandleImage.EXT_MAP[output_format]}", HandleImage.MIME_MAP[output_format], {
+            "X-Image-Dimensions": f"{width}x{height}",
+            "X-Image-Channels": str(channels),
+            "X-Extracted-Size": str(len(output))
+        }
+
+    return accepted(await job_queue.submit("image/decode-image", {"image": img_bytes}, work))
+
+
+def find_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job_id")
+    return job
+
+
+@JobsRouter.get("/{job_id}")
+async def job_status(job_id: str):
+    return find_job(job_id).info()
+
+
+@JobsRouter.get("/{job_id}/result")
+async def job_result(job_id: str):
+    """
+    Download a finished job's result. 409 while it is still running; a
+    failed job answers with its own error status and detail.
+    """
+    job = find_job(job_id)
+    if job.status == "failed":
+        status_code, detail = job.error
+        raise HTTPException(status_code=status_code, detail=detail)
+    if job.status != "done":
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is {job.status} ({job.phase}), try again later",
+            headers={"Retry-After": "2"}
+        )
+    return FileResponse(
+        job_queue.result_path(job),
+        media_type=job.media_type,
+        filename=job.result_name,
+        headers=job.headers
+    )
+
+
+@JobsRouter.delete("/{job_id}")
+async def delete_job(job_id: str):
+    if not job_queue.remove(job_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired job_id")
+    return {"deleted": job_id}
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import zipfile
+from typing import Optional
+
+from fastapi import Depends, UploadFile, File, HTTPException, Form
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRouter
+from starlette.concurrency import run_in_threadpool
+
+from Core.Metrics import body_parsed
+from Core.Scan import (SCAN_MAX_FILES, SCAN_ROOTS, ScanSummary, chunks, is_image_name, list_files, ndjson,
+                       scan_members, scan_paths, under_root)
+from Core.Uploads import MAX_UPLOAD_BYTES
+from Core.WorkerPool import get_pool
+
+ScanRouter = APIRouter(dependencies=[Depends(body_parsed)])
+
+
+def resolve_directory(directory):
+    if not SCAN_ROOTS:
+        raise HTTPException(status_code=403, detail="Directory scans are disabled, set STEG_SCAN_ROOTS")
+    if not under_root(directory, SCAN_ROOTS):
+        raise HTTPException(status_code=403, detail="directory is outside STEG_SCAN_ROOTS")
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail="directory not found")
+    return os.path.realpath(directory)
+
+
+def archive_members(archive, infos):
+    # Runs in a thread; oversized members are reported, not read
+    members, errors = [], []
+    for info in infos:
+        if info.file_size > MAX_UPLOAD_BYTES:
+            errors.append({"path": info.filename, "has_data": None,
+                           "error": f"Larger than the {MAX_UPLOAD_BYTES} byte upload limit"})
+        else:
+            members.append((info.filename, archive.read(info)))
+    return members, errors
+
+
+async def stream_scan(jobs, pool, with_data_only, cleanup=None):
+    """
+    Run the scan jobs (coroutines returning lists of records) with the
+    pool's capacity as the window and stream NDJSON as they finish. A
+    summary line closes the stream.
+    """
+    limiter = asyncio.Semaphore(pool.workers + pool.max_queue)
+    summary = ScanSummary()
+
+    async def run(job):
+        async with limiter:
+            return await job()
+
+    tasks = [asyncio.create_task(run(job)) for job in jobs]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            lines = []
+            for record in await next_done:
+                summary.add(record)
+                if record.get("has_data") or not with_data_only:
+                    lines.append(ndjson(record))
+            if lines:
+                yield "".join(lines)
+        yield ndjson(summary.record())
+    finally:
+        # Client went away or we finished: nothing left should keep running
+        for task in tasks:
+            task.cancel()
+        if cleanup is not None:
+            cleanup()
+
+
+@ScanRouter.get("/")
+async def root():
+    return {
+        "message": "Scan API",
+        "endpoints": {
+            "": "POST - Scan a server directory (under STEG_SCAN_ROOTS) or an uploaded zip, streaming NDJSON"
+        },
+        "roots": SCAN_ROOTS,
+        "max_files": SCAN_MAX_FILES
+    }
+
+
+@ScanRouter.post("")
+async def scan(
+        directory: Optional[str] = Form(None, description="Server-local directory under STEG_SCAN_ROOTS"),
+        archive: Optional[UploadFile] = File(None, description="Zip of images to scan"),
+        recursive: bool = Form(True, description="Descend into subdirectories"),
+        all_files: bool = Form(False, description="Scan every file, not just image extensions"),
+        full_decode: bool = Form(False, description="Fully decode formats without a row reader (JPEG, WebP, TIFF)"),
+        with_data_only: bool = Form(False, description="Only report files that hold a payload")
+):
+    """
+    Look for hidden data in many images at once. Only the rows holding
+    the length prefix and the start of the payload are decoded. One JSON
+    object per file is streamed as it completes, then a summary line.
+    """
+    if (directory is None) == (archive is None):
+        raise HTTPException(status_code=400, detail="Provide either directory or archive")
+
+    pool = get_pool("decode")
+
+    if directory is not None:
+        root = resolve_directory(directory)
+        try:
+            names = await run_in_threadpool(list_files, root, recursive, all_files, SCAN_ROOTS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        def job_for(chunk):
+            return lambda: pool.run_when_free(scan_paths, root, chunk, full_decode)
+
+        jobs = [job_for(chunk) for chunk in chunks(names)]
+        body = stream_scan(jobs, pool, with_data_only)
+        count = len(names)
+    else:
+        try:
+            opened = zipfile.ZipFile(archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="archive is not a valid zip file")
+        infos = [info for info in opened.infolist()
+                 if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+                 and (all_files or is_image_name(info.filename))]
+        if len(infos) > SCAN_MAX_FILES:
+            opened.close()
+            raise HTTPException(status_code=400, detail=f"More than {SCAN_MAX_FILES} files to scan")
+
+        def job_for(chunk):
+            async def job():
+                members, errors = await run_in_threadpool(archive_members, opened, chunk)
+                return errors + await pool.run_when_free(scan_members, members, full_decode)
+            return job
+
+        jobs = [job_for(chunk) for chunk in chunks(infos)]
+        body = stream_scan(jobs, pool, with_data_only, cleanup=opened.close)
+        count = len(infos)
+
+    return StreamingResponse(
+        body,
+        media_type="application/x-ndjson",
+        headers={"X-Scan-Files": str(count)}
+    )
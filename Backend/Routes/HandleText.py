@@ -1,110 +1,36 @@
-import io
+import os
 from typing import Optional
 
 import cv2
 import numpy as np
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import Depends, FastAPI, UploadFile, File, HTTPException, Form
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.routing import APIRouter
+from starlette.background import BackgroundTask
 
-TextRouter = APIRouter()
+from Core.Admission import admitted
+from Core.Compression import pack, resolve_compression, unpack
+from Core.CarrierStore import resolve_carrier
+from Core.Detect import DETECT_SLOTS, detect, detect_bytes
+from Core.Embed import embed_encoded, embed_image, embed_strips
+from Core.ImageHeader import read_header
+from Core.Memory import release, track, transient
+from Core.Metrics import body_parsed, record_pixels, stage
+from Core.Output import (JPEG_EXTENSION, JPEG_MEDIA_TYPE, BufferResponse, output_extension, output_media_type,
+                         resolve_embedding, resolve_output_options)
+from Core.ResultCache import result_cache
+from Core.RowReader import read_payload_rows
+from Core.Sniff import sniff
+from Core.Steg import (TEXT_BACKEND, DctSteg, SteganographyException, dct_extract, get_backend, is_jpeg,
+                       jpeg_carrier, scratch_bytes)
+from Core.Strips import read_stream, strip_layout, use_strips
+from Core.Uploads import read_upload
+from Core.WorkerPool import JobError, get_pool
 
+TextRouter = APIRouter(dependencies=[Depends(body_parsed), Depends(admitted)])
 
-class SteganographyException(Exception):
-    pass
 
-
-class LSBSteg:
-    def __init__(self, im):
-        self.image = im
-        self.height, self.width, self.nbchannels = im.shape
-        self.size = self.width * self.height
-
-        self.maskONEValues = [1, 2, 4, 8, 16, 32, 64, 128]
-        self.maskONE = self.maskONEValues.pop(0)
-
-        self.maskZEROValues = [254, 253, 251, 247, 239, 223, 191, 127]
-        self.maskZERO = self.maskZEROValues.pop(0)
-
-        self.curwidth = 0
-        self.curheight = 0
-        self.curchan = 0
-
-    def put_binary_value(self, bits):
-        for c in bits:
-            val = list(self.image[self.curheight, self.curwidth])
-            if int(c) == 1:
-                val[self.curchan] = int(val[self.curchan]) | self.maskONE
-            else:
-                val[self.curchan] = int(val[self.curchan]) & self.maskZERO
-
-            self.image[self.curheight, self.curwidth] = tuple(val)
-            self.next_slot()
-
-    def next_slot(self):
-        if self.curchan == self.nbchannels - 1:
-            self.curchan = 0
-            if self.curwidth == self.width - 1:
-                self.curwidth = 0
-                if self.curheight == self.height - 1:
-                    self.curheight = 0
-                    if self.maskONE == 128:
-                        raise SteganographyException("No available slot remaining (image filled)")
-                    else:
-                        self.maskONE = self.maskONEValues.pop(0)
-                        self.maskZERO = self.maskZEROValues.pop(0)
-                else:
-                    self.curheight += 1
-            else:
-                self.curwidth += 1
-        else:
-            self.curchan += 1
-
-    def read_bit(self):
-        val = self.image[self.curheight, self.curwidth][self.curchan]
-        val = int(val) & self.maskONE
-        self.next_slot()
-        if val > 0:
-            return "1"
-        else:
-            return "0"
-
-    def read_byte(self):
-        return self.read_bits(8)
-
-    def read_bits(self, nb):
-        bits = ""
-        for i in range(nb):
-            bits += self.read_bit()
-        return bits
-
-    def byteValue(self, val):
-        return self.binary_value(val, 8)
-
-    def binary_value(self, val, bitsize):
-        binval = bin(val)[2:]
-        if len(binval) > bitsize:
-            raise SteganographyException("binary value larger than the expected size")
-        while len(binval) < bitsize:
-            binval = "0" + binval
-        return binval
-
-    def encode_binary(self, data):
-        l = len(data)
-        if self.width * self.height * self.nbchannels < l + 64:
-            raise SteganographyException("Carrier image not big enough to hold all the data")
-        self.put_binary_value(self.binary_value(l, 64))
-        for byte in data:
-            byte = byte if isinstance(byte, int) else ord(byte)
-            self.put_binary_value(self.byteValue(byte))
-        return self.image
-
-    def decode_binary(self):
-        l = int(self.read_bits(64), 2)
-        output = b""
-        for i in range(l):
-            output += bytearray([int(self.read_byte(), 2)])
-        return output
+LSBSteg = get_backend(TEXT_BACKEND)
 
 
 @TextRouter.get("/")
@@ -119,59 +45,306 @@ async def root():
     }
 
 
+def encode_job(carrier_bytes, secret_data, options, compression="none"):
+    with stage("compress"):
+        secret_data, _ = pack(secret_data, compression)
+    return embed_encoded(LSBSteg, carrier_bytes, secret_data, options)
+
+
+def embed_job(carrier_img, secret_data, options, compression="none"):
+    with stage("compress"):
+        secret_data, _ = pack(secret_data, compression)
+    return embed_image(LSBSteg, carrier_img, secret_data, options)
+
+
+def strip_encode_job(carrier_bytes, secret_data, options, compression="none"):
+    """
+    encode_job for carriers over the strip threshold: the carrier is read,
+    embedded and written out a strip at a time. Returns the output path.
+    """
+    with stage("compress"):
+        secret_data, _ = pack(secret_data, compression)
+    return embed_strips(LSBSteg, carrier_bytes, secret_data, options)
+
+
+def dct_encode_job(carrier_bytes, secret_data, compression="none"):
+    """
+    encode_job for embedding=dct: the payload goes into the carrier's DCT
+    coefficients and the result is the carrier's JPEG, never decoded or
+    re-encoded.
+    """
+    with stage("compress"):
+        secret_data, _ = pack(secret_data, compression)
+
+    steg = DctSteg(carrier_bytes)
+    record_pixels(steg.width, steg.height)
+
+    with stage("embed"):
+        encoded = steg.encode_binary(secret_data)
+    track(len(encoded))
+    # The payload bits, alongside the result while it was built
+    transient((len(secret_data) + 8) * 8)
+    return encoded
+
+
+def strip_decode(img_bytes, width, height):
+    # Same results and errors as LSBSteg.decode_binary, a strip at a time
+    hidden_data = LSBSteg.extract(lambda start, count: read_stream(img_bytes, start, count), width * height * 3)
+    track(len(hidden_data))
+    # The bits, gathered in one array before packing
+    transient(len(hidden_data) * 8)
+    return hidden_data
+
+
+def decode_job(img_bytes):
+    hidden_data = extract_job(img_bytes)
+    # Compressed payloads carry a header; raw ones come back as they are
+    with stage("decompress"):
+        return unpack(hidden_data)
+
+
+def extract_job(img_bytes):
+    # JPEGs whose DCT prefix validates hold an embedding=dct payload; any
+    # other image goes the pixel way
+    hidden_data = dct_extract(img_bytes)
+    if hidden_data is not None:
+        return hidden_data
+
+    layout = strip_layout(img_bytes)
+    if layout is not None:
+        record_pixels(*layout)
+        with stage("strips"):
+            return strip_decode(img_bytes, *layout)
+
+    # Only the rows holding the payload when the format allows it
+    with stage("read_rows"):
+        img = read_payload_rows(img_bytes)
+    if img is not None:
+        header = read_header(img_bytes)
+        record_pixels(header.width, header.height)
+    else:
+        # Read steganography image
+        img_array = np.frombuffer(img_bytes, np.uint8)
+        with stage("imdecode"):
+            img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+
+        if img is None:
+            raise JobError(400, "Invalid image format")
+        record_pixels(img.shape[1], img.shape[0])
+    track(img.nbytes)
+
+    # Decode (bits a chunk at a time, then packed bytes)
+    with stage("extract"):
+        steg = LSBSteg(img)
+        hidden_data = steg.decode_binary()
+    track(len(hidden_data))
+    # The chunk buffers and the pooled packed copy, next to the image
+    transient(scratch_bytes(len(hidden_data)) + len(hidden_data))
+    release(img.nbytes)
+    return hidden_data
+
+
+def text_capacity(width, height, channels):
+    return LSBSteg.capacity(width, height, channels)
+
+
+def check_report(width, height, channels, detection, embedding="pixels", max_capacity=None):
+    if max_capacity is None:
+        max_capacity = text_capacity(width, height, channels)
+    has_data = detection is not None and detection.has_data
+
+    return {
+        "has_hidden_data": has_data,
+        "hidden_data_size": detection.length if has_data else 0,
+        "content_type": detection.file_type.content_type if has_data else None,
+        "file_type": detection.file_type.name if has_data else None,
+        "compression": detection.compression if has_data else None,
+        "confidence": detection.confidence if has_data else 0.0,
+        "image_dimensions": {
+            "width": width,
+            "height": height,
+            "channels": channels
+        },
+        "embedding": embedding,
+        "max_capacity_bytes": max_capacity
+    }
+
+
+def quick_check(img_bytes):
+    """
+    Answer /check from the header and the first rows only: the length
+    prefix and the head of the payload.
+    Returns None when the image needs a full decode.
+    """
+    with stage("detect"):
+        found = detect_bytes(img_bytes, text_capacity)
+    if found is None:
+        return None
+
+    header, detection = found
+    record_pixels(header.width, header.height)
+    return check_report(header.width, header.height, header.channels, detection)
+
+
+def dct_check(img_bytes):
+    """
+    check_job for JPEGs holding an embedding=dct payload. Walks only the
+    coefficients detect() reads; the capacity is estimated from them.
+    None when no DCT payload is found, or for JPEGs embedding=dct can't
+    use (progressive, arithmetic coded): those get the pixel report.
+    """
+    try:
+        steg = DctSteg(img_bytes)
+        with stage("detect"):
+            bits = steg.bits(DETECT_SLOTS)
+            if len(bits) < 64:
+                return None
+            detection = detect(bits, (steg.coefficient_bound() - 64) // 8)
+            if not detection.has_data:
+                return None
+            capacity = steg.estimated_capacity()
+    except SteganographyException:
+        return None
+    record_pixels(steg.width, steg.height)
+
+    report = check_report(steg.width, steg.height, steg.nbchannels, detection, "dct",
+                          max(capacity, detection.length))
+    report["capacity_estimated"] = not steg.capacity_known()
+    return report
+
+
+def check_job(img_bytes):
+    # The header and first rows answer most checks
+    report = quick_check(img_bytes)
+    if report is not None:
+        return report
+
+    if is_jpeg(img_bytes):
+        report = dct_check(img_bytes)
+        if report is not None:
+            return report
+
+    # Read image
+    img_array = np.frombuffer(img_bytes, np.uint8)
+    with stage("imdecode"):
+        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+
+    if img is None:
+        raise JobError(400, "Invalid image format")
+    track(img.nbytes)
+
+    height, width, channels = img.shape
+    record_pixels(width, height)
+
+    if img.size < 64:
+        # Too small to hold even the length prefix in bit plane 0
+        return check_report(width, height, channels, None)
+
+    with stage("detect"):
+        detection = detect(img.reshape(-1), text_capacity(width, height, channels))
+    return check_report(width, height, channels, detection)
+
+
+def name_extracted_file(hidden_data, output_filename=None):
+    """
+    Guess the content type of extracted data and give the output
+    filename a matching extension. Returns (content_type, filename).
+    """
+    # Determine filename
+    if not output_filename:
+        output_filename = "extracted_file.bin"
+
+    # Detect the file type from its first bytes
+    file_type = sniff(hidden_data)
+    if file_type.confidence > 0 and not output_filename.lower().endswith(file_type.extensions):
+        output_filename += file_type.extensions[0]
+
+    return file_type.content_type, output_filename
+
+
 @TextRouter.post("/encode")
 async def encode(
-        carrier_image: UploadFile = File(..., description="The carrier image to hide data in"),
-        secret_file: UploadFile = File(..., description="The file to hide (text, image, zip, etc.)")
+        carrier_image: Optional[UploadFile] = File(None, description="The carrier image to hide data in"),
+        secret_file: UploadFile = File(..., description="The file to hide (text, image, zip, etc.)"),
+        output_format: Optional[str] = Form(None, description="Result format (png, webp, tiff, bmp), all lossless"),
+        png_compression: Optional[int] = Form(None, description="PNG compression level 0-9"),
+        png_strategy: Optional[str] = Form(None, description="PNG zlib strategy (default, filtered, huffman, rle, fixed)"),
+        png_filter: Optional[str] = Form(None, description="PNG row filter (none, sub, up, avg, paeth, fast, all)"),
+        carrier_id: Optional[str] = Form(None, description="ID of a carrier uploaded once to /carriers"),
+        compression: Optional[str] = Form(None, description="Payload compression (none, auto, zlib, lzma)"),
+        embedding: Optional[str] = Form(None, description="Where the data goes: pixels (default) or dct, "
+                                                          "in a JPEG carrier's coefficients, returning a JPEG")
 ):
     """
     Encode/hide a file inside a carrier image.
-    Returns the modified PNG image with hidden data.
+    The carrier is either uploaded here or referenced by carrier_id.
+    Returns the modified image (PNG unless another lossless format is requested) with hidden data;
+    with embedding=dct, the JPEG carrier itself with the data in its DCT coefficients.
     """
     try:
-        # Read carrier image
-        carrier_bytes = await carrier_image.read()
-        carrier_array = np.frombuffer(carrier_bytes, np.uint8)
-        carrier_img = cv2.imdecode(carrier_array, cv2.IMREAD_COLOR)
+        embedding = resolve_embedding(embedding, output_format)
+        options = resolve_output_options(output_format if embedding == "pixels" else None,
+                                         png_compression, png_strategy, png_filter)
+        compression = resolve_compression(compression)
 
-        if carrier_img is None:
-            raise HTTPException(status_code=400, detail="Invalid carrier image format")
+        carrier = await resolve_carrier(carrier_image, carrier_id)
+        secret_data = await read_upload(secret_file)
 
-        # Read secret file
-        secret_data = await secret_file.read()
-
-        # Calculate capacity
-        height, width, channels = carrier_img.shape
-        max_bytes = (width * height * channels) - 64  # 64 bits for length
-
-        if len(secret_data) > max_bytes:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File too large. Carrier can hold max {max_bytes} bytes, but file is {len(secret_data)} bytes"
+        if embedding == "dct":
+            jpeg_carrier(carrier)
+            media_type, extension = JPEG_MEDIA_TYPE, JPEG_EXTENSION
+        else:
+            media_type, extension = output_media_type(options), output_extension(options)
+
+        if embedding == "pixels" and carrier.image is None and use_strips(carrier.data, options):
+            # Too big to hold decoded: written to a temp file strip by
+            # strip and sent from there, skipping the result cache
+            path = await get_pool("encode").run(strip_encode_job, carrier.data, secret_data, options, compression)
+            return FileResponse(
+                path,
+                media_type=output_media_type(options),
+                headers={
+                    "Content-Disposition": f"attachment; filename=encoded_{carrier.filename.rsplit('.', 1)[0]}{output_extension(options)}",
+                    "X-Original-Filename": secret_file.filename,
+                    "X-Hidden-Size": str(len(secret_data)),
+                    "X-Cache": "MISS"
+                },
+                background=BackgroundTask(os.remove, path)
             )
 
-        # Encode
-        steg = LSBSteg(carrier_img)
-        result_img = steg.encode_binary(secret_data)
-
-        # Encode to PNG (lossless format required)
-        success, encoded_img = cv2.imencode('.png', result_img)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to encode image")
-
-        # Return as streaming response
-        return StreamingResponse(
-            io.BytesIO(encoded_img.tobytes()),
-            media_type="image/png",
+        cache_key = await result_cache.key("text/encode", LSBSteg.name, carrier.cache_part, secret_data, tuple(options),
+                                           compression, embedding)
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            encoded = cached[0]
+        else:
+            if embedding == "dct":
+                encoded = await get_pool("encode").run(dct_encode_job, carrier.data, secret_data, compression)
+            else:
+                if carrier.image is not None:
+                    job, carrier_arg = embed_job, carrier.image
+                else:
+                    job, carrier_arg = encode_job, carrier.data
+                encoded = await get_pool("encode").run(job, carrier_arg, secret_data, options, compression)
+            await result_cache.put(cache_key, encoded)
+
+        # Served straight from the encoder's buffer
+        return BufferResponse(
+            encoded,
+            media_type=media_type,
             headers={
-                "Content-Disposition": f"attachment; filename=encoded_{carrier_image.filename.rsplit('.', 1)[0]}.png",
+                "Content-Disposition": f"attachment; filename=encoded_{carrier.filename.rsplit('.', 1)[0]}{extension}",
                 "X-Original-Filename": secret_file.filename,
-                "X-Hidden-Size": str(len(secret_data))
-            }
+                "X-Hidden-Size": str(len(secret_data)),
+                "X-Cache": "HIT" if cached is not None else "MISS"
+            },
+            etag=cache_key
         )
 
     except SteganographyException as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -183,58 +356,41 @@ async def decode(
 ):
     """
     Decode/extract hidden data from a steganography image.
+    JPEGs are read from their DCT coefficients (embedding=dct).
     Returns the hidden file.
     """
     try:
-        # Read steganography image
-        img_bytes = await steg_image.read()
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
+        img_bytes = await read_upload(steg_image)
 
-        # Decode
-        steg = LSBSteg(img)
-        hidden_data = steg.decode_binary()
+        cache_key = await result_cache.key("text/decode", LSBSteg.name, img_bytes)
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            hidden_data = cached[0]
+        else:
+            hidden_data = await get_pool("decode").run(decode_job, img_bytes)
+            if hidden_data:
+                await result_cache.put(cache_key, hidden_data)
 
         if len(hidden_data) == 0:
             raise HTTPException(status_code=404, detail="No hidden data found in image")
 
-        # Determine filename
-        if not output_filename:
-            output_filename = "extracted_file.bin"
-
-        # Try to detect file type
-        content_type = "application/octet-stream"
-        if hidden_data.startswith(b'\x89PNG'):
-            content_type = "image/png"
-            if not output_filename.endswith('.png'):
-                output_filename += '.png'
-        elif hidden_data.startswith(b'\xff\xd8\xff'):
-            content_type = "image/jpeg"
-            if not output_filename.endswith(('.jpg', '.jpeg')):
-                output_filename += '.jpg'
-        elif hidden_data.startswith(b'PK'):
-            content_type = "application/zip"
-            if not output_filename.endswith('.zip'):
-                output_filename += '.zip'
-        elif all(32 <= byte < 127 or byte in (9, 10, 13) for byte in hidden_data[:100]):
-            content_type = "text/plain"
-            if not output_filename.endswith('.txt'):
-                output_filename += '.txt'
-
-        return StreamingResponse(
-            io.BytesIO(hidden_data),
+        content_type, output_filename = name_extracted_file(hidden_data, output_filename)
+
+        return BufferResponse(
+            hidden_data,
             media_type=content_type,
             headers={
                 "Content-Disposition": f"attachment; filename={output_filename}",
-                "X-Extracted-Size": str(len(hidden_data))
-            }
+                "X-Extracted-Size": str(len(hidden_data)),
+                "X-Cache": "HIT" if cached is not None else "MISS"
+            },
+            etag=cache_key
         )
 
     except SteganographyException as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -247,48 +403,12 @@ async def check_image(
     Check if an image contains hidden data and return metadata.
     """
     try:
-        # Read image
-        img_bytes = await image.read()
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-
-        height, width, channels = img.shape
-        max_capacity = (width * height * channels) - 64
-
-        try:
-            # Try to read hidden data length
-            steg = LSBSteg(img)
-            length = int(steg.read_bits(64), 2)
+        img_bytes = await read_upload(image)
 
-            has_data = 0 < length <= max_capacity
-
-            return JSONResponse({
-                "has_hidden_data": has_data,
-                "hidden_data_size": length if has_data else 0,
-                "image_dimensions": {
-                    "width": width,
-                    "height": height,
-                    "channels": channels
-                },
-                "max_capacity_bytes": max_capacity
-            })
-
-        except Exception:
-            return JSONResponse({
-                "has_hidden_data": False,
-                "hidden_data_size": 0,
-                "image_dimensions": {
-                    "width": width,
-                    "height": height,
-                    "channels": channels
-                },
-                "max_capacity_bytes": max_capacity
-            })
+        result = await get_pool("decode").run(check_job, img_bytes)
+        return JSONResponse(result)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
-
-
@@ -1,9 +1,71 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from Routes import HandleImage, HandleText
 from Routes.HandleText import TextRouter
 from Routes.HandleImage import ImageRouter
+from Routes.HandleCarriers import CarrierRouter
+from Routes.HandleBatch import BatchRouter
+from Routes.HandleJobs import JobsRouter
+from Routes.HandleScan import ScanRouter
+from Routes.HandleContainer import ContainerRouter
+from Core.Admission import admission_stats
+from Core.BufferPool import buffer_pool
+from Core.JobQueue import job_queue
+from Core.Lifecycle import LifecycleMiddleware, configure_threads, lifecycle, warmup_carrier, warmup_secret_image
+from Core.Metrics import MetricsMiddleware, render_metrics, render_stats
+from Core.Output import EMBEDDINGS, resolve_output_options
+from Core.ResultCache import result_cache
+from Core.Steg import backend_info, parallel_stats, selected_backends
+from Core.Uploads import UploadLimitMiddleware, upload_stats
+from Core.WorkerPool import get_pool, pool_stats, shutdown_pools
+
+
+def warmup_round_trip():
+    # Runs on a pool worker: both routers' encode, decode and check paths
+    # on a synthetic carrier, so imports, OpenCV's codecs and numpy's
+    # kernels are loaded before real traffic arrives
+    carrier, secret_img = warmup_carrier(), warmup_secret_image()
+    options = resolve_output_options()
+    encoded = bytes(HandleText.encode_job(carrier, b"warmup" * 64, options))
+    HandleText.decode_job(encoded)
+    HandleText.quick_check(encoded)
+    encoded = bytes(HandleImage.encode_job(carrier, secret_img, options)[0])
+    HandleImage.decode_job(encoded, "png")
+
+
+def warm_pool(name):
+    async def step():
+        # One job per worker, so every thread or process is warmed
+        pool = get_pool(name)
+        await asyncio.gather(*(pool.run(warmup_round_trip) for _ in range(pool.workers)))
+    step.__name__ = f"warm_{name}_pool"
+    return step
+
+
+@asynccontextmanager
+async def lifespan(app):
+    configure_threads()
+    await lifecycle.warm([warm_pool("encode"), warm_pool("decode")])
+    yield
+    await lifecycle.drain(job_queue.tasks.values())
+    job_queue.shutdown()
+    shutdown_pools()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Added before CORS so 413 rejections still carry CORS headers
+app.add_middleware(UploadLimitMiddleware)
+
+# Outermost of the two, so 413 rejections are timed too
+app.add_middleware(MetricsMiddleware)
+
+# Wraps the two above, so requests they reject are counted too
+app.add_middleware(LifecycleMiddleware, lifecycle=lifecycle)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,12 +78,85 @@ app.add_middleware(
 
 app.include_router(TextRouter, prefix="/text")
 app.include_router(ImageRouter, prefix="/image")
+app.include_router(CarrierRouter, prefix="/carriers")
+app.include_router(BatchRouter, prefix="/batch")
+app.include_router(JobsRouter, prefix="/jobs")
+app.include_router(ScanRouter, prefix="/scan")
+app.include_router(ContainerRouter, prefix="/container")
+
+
+@app.api_route("/health/live", methods=["GET", "HEAD"])
+async def live():
+    # Answers as long as the event loop does; restart the process if not
+    return lifecycle.liveness()
+
+
+@app.api_route("/health/ready", methods=["GET", "HEAD"])
+async def ready():
+    # 503 until warmup is done and again once draining starts
+    return lifecycle.readiness()
 
 
 @app.head("/")
 async def monitor():
-    return {"status": "ok"}
+    # Uptime monitors probe HEAD /; it answers like /health/live
+    return lifecycle.liveness()
+
 
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
+
+
+@app.get("/pools")
+async def pools():
+    # Queue depth and wait-time metrics for the worker pools
+    return pool_stats()
+
+
+@app.get("/uploads")
+async def uploads():
+    # Upload limit rejections and per-request peak memory figures
+    return upload_stats
+
+
+@app.get("/cache")
+async def cache():
+    # Result cache hit/miss/eviction counters
+    return result_cache.stats()
+
+
+@app.get("/admission")
+async def admission():
+    # Pixel budget in flight, waiting requests and rejections
+    return admission_stats()
+
+
+@app.get("/buffers")
+async def buffers():
+    # Pooled scratch buffers: bytes idle and lent out, reuse and the cap
+    return buffer_pool.stats()
+
+
+@app.get("/backends")
+async def backends():
+    # Registered embedding backends, the one each router uses, the
+    # embedding modes encode requests may pick, and how often large
+    # payloads took the multi-threaded path
+    return {"selected": selected_backends(), "backends": backend_info(), "embeddings": list(EMBEDDINGS),
+            "parallel": parallel_stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text format: stage/request histograms plus the stats above
+    families = [
+        render_stats("steg_pool", "Worker pool counters", pool_stats(), label="pool"),
+        render_stats("steg_uploads", "Upload limit counters", upload_stats),
+        render_stats("steg_cache", "Result cache counters", result_cache.stats()),
+        render_stats("steg_jobs", "Background job counters", job_queue.stats()),
+        render_stats("steg_admission", "Admission control pixel budget", admission_stats()),
+        render_stats("steg_buffers", "Reusable buffer pool", buffer_pool.stats()),
+        render_stats("steg_lifecycle", "Server readiness and in-flight requests", lifecycle.stats()),
+    ]
+    return PlainTextResponse(render_metrics(families), media_type="text/plain; version=0.0.4")
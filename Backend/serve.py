@@ -0,0 +1,83 @@
+"""
+Production entry point: server processes on one port, each with its
+thread pools sized to its share of the cores, warmed up before it reports
+ready, and drained on SIGTERM/SIGINT.
+
+Run from anywhere:
+    python Backend/serve.py --port 8000
+
+One process by default: /carriers ids and /jobs status live in the process
+that created them, so with --workers above 1 the proxy in front must route
+a client's requests to the same process (sticky sessions) or those lookups
+404 on the other processes.
+
+Probe /health/live for liveness and /health/ready for readiness.
+"""
+import argparse
+import os
+import sys
+
+# Libraries that size their thread pools from the core count at import
+THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+              "VECLIB_MAXIMUM_THREADS", "STEG_CV_THREADS")
+
+
+def parse_args(argv=None):
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("STEG_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("STEG_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("STEG_SERVER_WORKERS", "1")),
+                        help="Server processes (default: 1; more need sticky routing for /carriers and /jobs)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("STEG_SERVER_THREADS", "0")) or None,
+                        help="Threads each process may use for OpenCV, BLAS and its job pools "
+                             "(default: cores / workers)")
+    parser.add_argument("--drain-seconds", type=float, default=float(os.environ.get("STEG_DRAIN_SECONDS", "30")),
+                        help="How long shutdown waits for requests and background jobs")
+    parser.add_argument("--no-warmup", action="store_true", help="Take traffic without the synthetic round trip")
+    parser.add_argument("--log-level", default=os.environ.get("STEG_LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.threads is None:
+        args.threads = max(1, cores // args.workers)
+    return args
+
+
+def configure_environment(args):
+    """
+    Settings the server processes inherit. Must run before numpy or cv2
+    are imported. Values already in the environment win.
+    """
+    for name in THREAD_ENV:
+        os.environ.setdefault(name, str(args.threads))
+    # The job pools and the intra-image threads default to every core
+    os.environ.setdefault("STEG_POOL_WORKERS", str(args.threads))
+    os.environ.setdefault("STEG_PARALLEL_WORKERS", str(args.threads))
+    os.environ["STEG_DRAIN_SECONDS"] = str(args.drain_seconds)
+    if args.no_warmup:
+        os.environ["STEG_WARMUP"] = "0"
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        # Stop accepting, then give open requests this long before the
+        # app's own drain of background jobs
+        timeout_graceful_shutdown=args.drain_seconds,
+        log_level=args.log_level,
+        lifespan="on",
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
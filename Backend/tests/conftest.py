@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+# The app imports its packages from Backend/, as when run from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STEG_CACHE_ENABLED", "0")
+os.environ.setdefault("STEG_JOBS_DIR", tempfile.mkdtemp(prefix="steg-jobs-test-"))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
@@ -0,0 +1,30 @@
+import cv2
+import numpy as np
+from fastapi.testclient import TestClient
+
+from Core.WorkerPool import get_pool
+from Routes import HandleText
+
+from legacy import LegacyTextSteg
+
+
+def test_check_runs_on_the_decode_pool(monkeypatch, rng):
+    pool = get_pool("decode")
+    ran = []
+    run = pool.run
+
+    async def recording(fn, *args):
+        ran.append(fn)
+        return await run(fn, *args)
+
+    monkeypatch.setattr(pool, "run", recording)
+    secret = b"%PDF-1.4 hidden" + bytes(200)
+    image = LegacyTextSteg(rng.integers(0, 256, (30, 30, 3), dtype=np.uint8)).encode_binary(secret)
+
+    from main import app
+    with TestClient(app) as client:
+        report = client.post("/text/check", files={"image": ("x.png", cv2.imencode(".png", image)[1].tobytes())})
+    # After the startup warmup
+    assert ran[-1] is HandleText.check_job
+    assert report.json()["has_hidden_data"] is True
+    assert report.json()["hidden_data_size"] == len(secret)
@@ -0,0 +1,157 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from Core import Strips
+from Core.Container import HEADER, MAGIC, LEGACY_NAME, PayloadReader, build, list_entries, read_entry
+from Core.Output import resolve_output_options
+from Core.Steg import MultiPlaneBackend
+from Core.WorkerPool import JobError
+from Routes import HandleContainer
+
+from legacy import LegacyTextSteg
+
+WIDTH, HEIGHT = 40, 30
+CAPACITY = MultiPlaneBackend.capacity(WIDTH, HEIGHT, 3)
+
+
+@pytest.fixture
+def carrier(rng):
+    return rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def files(rng):
+    return [
+        ("notes.txt", "text/plain", b"hello container\n" * 50),
+        ("noise.bin", None, rng.integers(0, 256, 700, dtype=np.uint8).tobytes()),
+        ("empty", "application/x-empty", b""),
+        ("naïve.txt", "text/plain", "ünïcödé".encode("utf-8")),
+    ]
+
+
+def encoded(image):
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+def decoded(data):
+    return cv2.imdecode(np.frombuffer(bytes(data), np.uint8), cv2.IMREAD_COLOR)
+
+
+def container_image(carrier, files, compression="none"):
+    result = HandleContainer.container_encode_job(encoded(carrier), files, resolve_output_options(), compression)
+    return bytes(result)
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib", "auto"])
+def test_entries_round_trip(carrier, files, compression):
+    image = container_image(carrier, files, compression)
+
+    listing = HandleContainer.list_job(image)
+    assert listing["container"] is True
+    assert [entry["name"] for entry in listing["entries"]] == [name for name, _, _ in files]
+    assert [entry["size"] for entry in listing["entries"]] == [len(data) for _, _, data in files]
+
+    for i, (name, _, data) in enumerate(files):
+        assert HandleContainer.extract_entry_job(image, name=name)[1] == data
+        assert HandleContainer.extract_entry_job(image, index=i)[1] == data
+
+
+def test_legacy_decoders_see_one_blob(carrier, files):
+    image = decoded(container_image(carrier, files))
+    assert LegacyTextSteg(image).decode_binary() == build(files)
+
+    # And a container a legacy encoder embedded reads as one
+    image = encoded(LegacyTextSteg(carrier.copy()).encode_binary(build(files)))
+    assert HandleContainer.list_job(image)["container"] is True
+    for name, _, data in files:
+        assert HandleContainer.extract_entry_job(image, name=name)[1] == data
+
+
+def test_legacy_blob_is_one_entry(carrier):
+    secret = encoded(np.zeros((4, 4, 3), np.uint8))
+    image = encoded(LegacyTextSteg(carrier.copy()).encode_binary(secret))
+
+    listing = HandleContainer.list_job(image)
+    assert listing["container"] is False
+    [entry] = listing["entries"]
+    assert entry["name"] == LEGACY_NAME + ".png"
+    assert entry["content_type"] == "image/png"
+    assert entry["size"] == len(secret)
+    assert HandleContainer.extract_entry_job(image)[1] == secret
+
+
+def test_empty_image_has_no_entries():
+    image = encoded(np.zeros((HEIGHT, WIDTH, 3), np.uint8))
+    assert HandleContainer.list_job(image)["entries"] == []
+    with pytest.raises(JobError) as e:
+        HandleContainer.extract_entry_job(image)
+    assert e.value.status_code == 404
+
+
+def test_capacity_boundary(rng, carrier):
+    overhead = len(build([("a", "text/plain", b""), ("b", "text/plain", b"")]))
+    last = rng.integers(0, 256, CAPACITY - overhead - 1, dtype=np.uint8).tobytes()
+    files = [("a", "text/plain", b"x"), ("b", "text/plain", last)]
+    assert len(build(files)) == CAPACITY
+
+    # The last entry reads through the end of the top bit plane in use
+    image = container_image(carrier, files)
+    assert HandleContainer.extract_entry_job(image, name="b")[1] == last
+
+    with pytest.raises(JobError) as e:
+        container_image(carrier, files + [("c", None, b"")])
+    assert e.value.status_code == 400
+
+
+def test_strip_path_reads_the_same_entries(monkeypatch, carrier, files):
+    monkeypatch.setattr(Strips, "STRIP_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(Strips, "STRIP_ROWS", 7)
+
+    path = HandleContainer.container_encode_job(encoded(carrier), files, resolve_output_options("png"), strips=True)
+    try:
+        with open(path, "rb") as f:
+            image = f.read()
+    finally:
+        os.remove(path)
+
+    assert LegacyTextSteg(decoded(image)).decode_binary() == build(files)
+    for name, _, data in files:
+        assert HandleContainer.extract_entry_job(image, name=name)[1] == data
+
+
+def test_build_errors():
+    for files in ([], [("a", None, b"1"), ("a", None, b"2")], [("", None, b"1")]):
+        with pytest.raises(JobError) as e:
+            build(files)
+        assert e.value.status_code == 400
+
+
+def test_corrupt_index_is_rejected(files):
+    payload = bytearray(build(files))
+    # An index claiming more bytes than the payload holds
+    payload[HEADER.size - 4:HEADER.size] = (len(payload)).to_bytes(4, "big")
+    bits = np.unpackbits(np.frombuffer(bytes(payload), np.uint8))
+    reader = PayloadReader(lambda start, count: bits[start - 64:start - 64 + count], len(bits))
+    with pytest.raises(JobError) as e:
+        list_entries(reader)
+    assert e.value.status_code == 400
+
+
+def test_payload_reader_reads_only_what_it_is_asked(files):
+    payload = build(files)
+    bits = np.unpackbits(np.frombuffer(payload, np.uint8))
+    asked = []
+
+    def read_bits(start, count):
+        asked.append((start, count))
+        return bits[start - 64:start - 64 + count]
+
+    reader = PayloadReader(read_bits, len(bits))
+    is_container, entries = list_entries(reader)
+    assert is_container and payload.startswith(MAGIC)
+    asked.clear()
+    assert read_entry(reader, entries[1]) == files[1][2]
+    assert asked == [(64 + 8 * entries[1].offset, 8 * entries[1].length)]
@@ -0,0 +1,131 @@
+import cv2
+import numpy as np
+import pytest
+
+from Core.Steg import MultiPlaneBackend, SteganographyException, dct_extract
+from Core.Steg.Dct import DctSteg
+from Routes import HandleImage, HandleText
+
+
+def photo(rng, height, width):
+    # Smooth shapes plus noise, so plenty of AC coefficients reach 2
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.sin(x / 13) * 60 + np.cos(y / 7) * 50 + 128
+    planes = [base + rng.normal(0, 20, (height, width)) for _ in range(3)]
+    return np.clip(np.stack(planes, -1), 0, 255).astype(np.uint8)
+
+
+def jpeg(image, *params):
+    return cv2.imencode(".jpg", image, list(params))[1].tobytes()
+
+
+KINDS = {
+    "444": lambda im: jpeg(im, cv2.IMWRITE_JPEG_QUALITY, 90,
+                           cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444),
+    "420": lambda im: jpeg(im, cv2.IMWRITE_JPEG_QUALITY, 75),
+    "restart": lambda im: jpeg(im, cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_RST_INTERVAL, 3),
+    "gray": lambda im: jpeg(im[:, :, 0], cv2.IMWRITE_JPEG_QUALITY, 80),
+}
+
+
+@pytest.fixture(params=list(KINDS))
+def carrier(request, rng):
+    return KINDS[request.param](photo(rng, 101, 77))
+
+
+def decoded(data):
+    return cv2.imdecode(np.frombuffer(bytes(data), np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def test_round_trip(rng, carrier):
+    capacity = DctSteg(carrier).capacity()
+    assert capacity > 100
+    for size in (1, 17, capacity // 2, capacity):
+        data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        result = DctSteg(carrier).encode_binary(data)
+
+        assert DctSteg(result).decode_binary() == data
+        assert dct_extract(result) == data
+        assert HandleText.extract_job(result) == data
+        # Still a JPEG any decoder reads, a few levels off the carrier
+        original, stego = decoded(carrier), decoded(result)
+        assert stego.shape == original.shape
+        assert np.abs(stego.astype(int) - original).max() < 32
+
+
+def test_capacity_boundary(carrier):
+    capacity = DctSteg(carrier).capacity()
+    DctSteg(carrier).encode_binary(bytes(capacity))
+    with pytest.raises(SteganographyException):
+        DctSteg(carrier).encode_binary(bytes(capacity + 1))
+
+    assert DctSteg(carrier).fits(capacity)
+    assert not DctSteg(carrier).fits(capacity + 1)
+
+
+def test_estimated_capacity(rng):
+    # Small carriers are walked to the end: the estimate is exact
+    small = KINDS["420"](photo(rng, 101, 77))
+    steg = DctSteg(small)
+    assert steg.estimated_capacity() == DctSteg(small).capacity()
+    assert steg.capacity_known()
+
+    big = KINDS["420"](photo(rng, 480, 640))
+    steg = DctSteg(big)
+    estimate = steg.estimated_capacity()
+    assert not steg.capacity_known()
+    assert abs(estimate - DctSteg(big).capacity()) <= 0.1 * estimate
+
+
+def test_nothing_hidden(carrier):
+    assert DctSteg(carrier).extract() is None
+    assert DctSteg(carrier).decode_binary() == b""
+    assert DctSteg(DctSteg(carrier).encode_binary(b"")).extract() is None
+
+
+def test_clean_jpeg_takes_the_pixel_path(rng):
+    carrier = KINDS["444"](photo(rng, 101, 77))
+    assert dct_extract(carrier) is None
+
+    pixels = cv2.imdecode(np.frombuffer(carrier, np.uint8), cv2.IMREAD_COLOR)
+    try:
+        expected = MultiPlaneBackend(pixels).decode_binary()
+    except SteganographyException:
+        with pytest.raises(SteganographyException):
+            HandleText.extract_job(carrier)
+    else:
+        assert HandleText.extract_job(carrier) == expected
+
+
+def test_unsupported_carriers(rng):
+    image = photo(rng, 40, 40)
+    progressive = jpeg(image, cv2.IMWRITE_JPEG_PROGRESSIVE, 1)
+    with pytest.raises(SteganographyException):
+        DctSteg(progressive)
+    assert dct_extract(progressive) is None
+    assert dct_extract(cv2.imencode(".png", image)[1].tobytes()) is None
+
+
+def test_pixel_payloads_still_decode(rng):
+    carrier = rng.integers(0, 256, (30, 30, 3), dtype=np.uint8)
+    data = b"pixels, not coefficients"
+    image = cv2.imencode(".png", MultiPlaneBackend(carrier).encode_binary(data))[1].tobytes()
+    assert dct_extract(image) is None
+    assert HandleText.extract_job(image) == data
+
+
+def test_image_route_round_trip(rng):
+    carrier = KINDS["444"](photo(rng, 160, 160))
+    secret = rng.integers(0, 256, (6, 5, 3), dtype=np.uint8)
+    secret_png = cv2.imencode(".png", secret)[1].tobytes()
+
+    encoded, shape, size = HandleImage.dct_encode_job(carrier, secret_png)
+    assert shape == secret.shape
+    output, hidden_shape = HandleImage.decode_job(encoded, "png")
+    assert hidden_shape == secret.shape
+    assert np.array_equal(cv2.imdecode(output, cv2.IMREAD_COLOR), secret)
+
+    (_, _, _), capacity, fits, estimated = HandleImage.dct_carrier_info_job(carrier, size)
+    assert fits
+    exact = DctSteg(carrier).capacity()
+    assert capacity == exact if not estimated else abs(capacity - exact) <= 0.1 * exact
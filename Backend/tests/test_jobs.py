@@ -0,0 +1,78 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from Core import Strips
+from Routes import HandleImage, HandleText
+
+from legacy import LegacyImageSteg, LegacyTextSteg
+
+
+@pytest.fixture
+def client():
+    from main import app
+    with TestClient(app) as client:
+        yield client
+
+
+def finished(client, response):
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    for _ in range(500):
+        info = client.get(f"/jobs/{job_id}").json()
+        if info["status"] in ("done", "failed", "cancelled"):
+            assert info["status"] == "done", info
+            return client.get(f"/jobs/{job_id}/result")
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def decoded(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+@pytest.mark.parametrize("strips", [False, True])
+def test_text_encode_job(monkeypatch, client, rng, strips):
+    if strips:
+        monkeypatch.setattr(Strips, "STRIP_THRESHOLD_BYTES", 0)
+        monkeypatch.setattr(Strips, "STRIP_ROWS", 8)
+    calls = []
+    for name in ("encode_job", "strip_encode_job"):
+        job = getattr(HandleText, name)
+        monkeypatch.setattr(HandleText, name, lambda *args, job=job, name=name: calls.append(name) or job(*args))
+
+    carrier = rng.integers(0, 256, (40, 50, 3), dtype=np.uint8)
+    secret = rng.integers(0, 256, 3000, dtype=np.uint8).tobytes()
+    result = finished(client, client.post("/jobs/text/encode", files={
+        "carrier_image": ("c.png", cv2.imencode(".png", carrier)[1].tobytes()),
+        "secret_file": ("s.bin", secret),
+    }))
+
+    assert calls == ["strip_encode_job" if strips else "encode_job"]
+    assert int(result.headers["content-length"]) == len(result.content)
+    assert np.array_equal(decoded(result.content), LegacyTextSteg(carrier.copy()).encode_binary(secret))
+
+
+@pytest.mark.parametrize("strips", [False, True])
+def test_image_encode_job(monkeypatch, client, rng, strips):
+    if strips:
+        monkeypatch.setattr(Strips, "STRIP_THRESHOLD_BYTES", 0)
+        monkeypatch.setattr(Strips, "STRIP_ROWS", 8)
+    calls = []
+    for name in ("encode_job", "strip_encode_job"):
+        job = getattr(HandleImage, name)
+        monkeypatch.setattr(HandleImage, name, lambda *args, job=job, name=name: calls.append(name) or job(*args))
+
+    carrier = rng.integers(0, 256, (60, 60, 3), dtype=np.uint8)
+    secret = rng.integers(0, 256, (5, 4, 3), dtype=np.uint8)
+    result = finished(client, client.post("/jobs/image/encode-image", files={
+        "carrier_image": ("c.png", cv2.imencode(".png", carrier)[1].tobytes()),
+        "secret_image": ("s.png", cv2.imencode(".png", secret)[1].tobytes()),
+    }))
+
+    assert calls == ["strip_encode_job" if strips else "encode_job"]
+    assert result.headers["x-secret-dimensions"] == "4x5"
+    assert np.array_equal(decoded(LegacyImageSteg(decoded(result.content)).decode_binary()), secret)
@@ -0,0 +1,99 @@
+import cv2
+import numpy as np
+import pytest
+
+from Core.Output import resolve_output_options
+from Core.Steg import MultiPlaneBackend, PlaneZeroBackend, SteganographyException
+from Routes import HandleText
+
+from legacy import LegacyImageSteg, LegacyTextSteg, SteganographyException as LegacyException
+
+SHAPES = [(6, 5, 3), (10, 10, 3), (3, 30, 3), (7, 9, 3)]
+
+
+def payload_sizes(shape):
+    capacity = MultiPlaneBackend.capacity(shape[1], shape[0], shape[2])
+    # Empty, a few bytes, bit plane 0 full, spilling into the upper planes, full
+    return sorted({0, 1, 5, capacity // 8, capacity // 3, capacity - 1, capacity})
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_writes_the_legacy_image(rng, shape):
+    carrier = rng.integers(0, 256, shape, dtype=np.uint8)
+    for size in payload_sizes(shape):
+        data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        legacy = LegacyTextSteg(carrier.copy()).encode_binary(data)
+        new = MultiPlaneBackend(carrier.copy()).encode_binary(data)
+        assert np.array_equal(legacy, new), size
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_reads_across_implementations(rng, shape):
+    carrier = rng.integers(0, 256, shape, dtype=np.uint8)
+    for size in payload_sizes(shape):
+        data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        legacy = LegacyTextSteg(carrier.copy()).encode_binary(data)
+        assert MultiPlaneBackend(legacy).decode_binary() == data
+        new = MultiPlaneBackend(carrier.copy()).encode_binary(data)
+        assert LegacyTextSteg(new).decode_binary() == data
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_capacity_boundary(rng, shape):
+    carrier = rng.integers(0, 256, shape, dtype=np.uint8)
+    capacity = MultiPlaneBackend.capacity(shape[1], shape[0], shape[2])
+    MultiPlaneBackend(carrier.copy()).encode_binary(bytes(capacity))
+
+    too_big = bytes(capacity + 1)
+    with pytest.raises(SteganographyException):
+        MultiPlaneBackend(carrier.copy()).encode_binary(too_big)
+    with pytest.raises(LegacyException):
+        LegacyTextSteg(carrier.copy()).encode_binary(too_big)
+
+
+def test_garbage_lengths_fail_like_legacy(rng):
+    # Length prefixes around the last slot: both read the payload or both
+    # run out of slots
+    height, width = 10, 10
+    slots = height * width * 3
+    for length in range(slots - 12, slots - 4):
+        image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        bits = np.unpackbits(np.frombuffer(length.to_bytes(8, "big"), dtype=np.uint8))
+        image.reshape(-1)[:64] = (image.reshape(-1)[:64] & 0xFE) | bits
+
+        try:
+            expected = LegacyTextSteg(image.copy()).decode_binary()
+        except LegacyException:
+            with pytest.raises(SteganographyException):
+                MultiPlaneBackend(image.copy()).decode_binary()
+        else:
+            assert MultiPlaneBackend(image.copy()).decode_binary() == expected
+
+
+def test_encode_job_output_decodes_with_legacy(rng):
+    carrier = rng.integers(0, 256, (40, 50, 3), dtype=np.uint8)
+    data = rng.integers(0, 256, 4000, dtype=np.uint8).tobytes()
+    carrier_png = cv2.imencode(".png", carrier)[1].tobytes()
+
+    encoded = HandleText.encode_job(carrier_png, data, resolve_output_options())
+    image = cv2.imdecode(np.frombuffer(bytes(encoded), np.uint8), cv2.IMREAD_COLOR)
+    assert LegacyTextSteg(image).decode_binary() == data
+    assert HandleText.decode_job(bytes(encoded)) == data
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_plane_zero_matches_the_image_route(rng, shape):
+    carrier = rng.integers(0, 256, shape, dtype=np.uint8)
+    capacity = PlaneZeroBackend.capacity(shape[1], shape[0], shape[2])
+    for size in {1, capacity // 2, capacity}:
+        data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        legacy = LegacyImageSteg(carrier.copy()).encode_binary(data)
+        new = PlaneZeroBackend(carrier.copy()).encode_binary(data)
+        assert np.array_equal(legacy, new), size
+        assert PlaneZeroBackend(legacy).decode_binary() == data
+        assert LegacyImageSteg(new).decode_binary() == data
+
+    with pytest.raises(SteganographyException):
+        PlaneZeroBackend(carrier.copy()).encode_binary(bytes(capacity + 1))
+    with pytest.raises(LegacyException):
+        LegacyImageSteg(carrier.copy()).encode_binary(bytes(capacity + 1))
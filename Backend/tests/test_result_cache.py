@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+from fastapi.testclient import TestClient
+
+from Core.ResultCache import MB, ResultCache
+from Core.Steg import PlaneZeroBackend
+from Routes import HandleText
+
+
+def test_disk_tier_needs_a_folder(monkeypatch, tmp_path):
+    monkeypatch.setenv("STEG_CACHE_ENABLED", "1")
+    monkeypatch.delenv("STEG_CACHE_DIR", raising=False)
+    assert ResultCache.from_env().disk_bytes == 0
+
+    folder = tmp_path / "cache"
+    monkeypatch.setenv("STEG_CACHE_DIR", str(folder))
+    cache = ResultCache.from_env()
+    assert cache.disk_bytes > 0
+    assert folder.stat().st_mode & 0o077 == 0
+
+
+def test_disk_entries_round_trip(tmp_path):
+    cache = ResultCache(0, str(tmp_path), MB)
+    key = cache.make_key("text/decode", "multiplane", b"image")
+    cache.store(key, b"secret", {"a": 1})
+    assert bytes(ResultCache(0, str(tmp_path), MB)._disk_get(key)[0]) == b"secret"
+
+
+def test_backend_is_part_of_the_key(monkeypatch, rng):
+    monkeypatch.setattr(HandleText, "result_cache", ResultCache(MB))
+    carrier = cv2.imencode(".png", rng.integers(0, 256, (20, 20, 3), dtype=np.uint8))[1].tobytes()
+    files = {"carrier_image": ("c.png", carrier), "secret_file": ("s.txt", b"hello")}
+
+    from main import app
+    with TestClient(app) as client:
+        assert client.post("/text/encode", files=files).headers["x-cache"] == "MISS"
+        assert client.post("/text/encode", files=files).headers["x-cache"] == "HIT"
+        monkeypatch.setattr(HandleText, "LSBSteg", PlaneZeroBackend)
+        assert client.post("/text/encode", files=files).headers["x-cache"] == "MISS"
@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+import pytest
+
+from Core.RowReader import read_payload_rows, read_rows
+from Core.Steg import PlaneZeroBackend
+
+from legacy import LegacyImageSteg
+
+WIDTH, HEIGHT = 20, 16
+ROW_SLOTS = WIDTH * 3
+
+ENCODINGS = [
+    (".png", [cv2.IMWRITE_PNG_COMPRESSION, 0]),
+    (".png", [cv2.IMWRITE_PNG_COMPRESSION, 9]),
+    (".bmp", []),
+]
+
+
+def encoded(image, ext, params):
+    return cv2.imencode(ext, image, params)[1].tobytes()
+
+
+def full_decode(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def rows_for(size):
+    return -(-(64 + 8 * size) // ROW_SLOTS)
+
+
+@pytest.fixture
+def carrier(rng):
+    return rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("ext, params", ENCODINGS)
+@pytest.mark.parametrize("count", [1, 5, HEIGHT, HEIGHT + 3])
+def test_read_rows_matches_full_decode(carrier, ext, params, count):
+    data = encoded(carrier, ext, params)
+    rows = read_rows(data, count)
+    assert np.array_equal(rows, full_decode(data)[:count])
+
+
+def test_read_rows_expands_like_imread_color(rng):
+    gray = rng.integers(0, 256, (HEIGHT, WIDTH), dtype=np.uint8)
+    rgba = rng.integers(0, 256, (HEIGHT, WIDTH, 4), dtype=np.uint8)
+    for image in (gray, rgba):
+        data = encoded(image, ".png", [])
+        assert np.array_equal(read_rows(data, 4), full_decode(data)[:4])
+
+
+@pytest.mark.parametrize("ext, params", ENCODINGS)
+def test_reads_legacy_payloads(rng, carrier, ext, params):
+    # Payloads ending in the first row, mid image, and in the row before last
+    for size in (1, 40, (ROW_SLOTS * (HEIGHT - 1) - 64) // 8):
+        secret = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        data = encoded(LegacyImageSteg(carrier.copy()).encode_binary(secret), ext, params)
+
+        rows = read_payload_rows(data)
+        assert rows is not None and len(rows) == rows_for(size)
+        assert np.array_equal(rows, full_decode(data)[:len(rows)])
+        assert LegacyImageSteg(rows).decode_binary() == secret
+        assert PlaneZeroBackend(rows).decode_binary() == secret
+
+
+@pytest.mark.parametrize("ext, params", ENCODINGS)
+def test_payload_reaching_the_last_row_needs_the_full_decode(rng, carrier, ext, params):
+    size = (ROW_SLOTS * (HEIGHT - 1) - 64) // 8 + 1
+    secret = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+    data = encoded(PlaneZeroBackend(carrier.copy()).encode_binary(secret), ext, params)
+
+    assert read_payload_rows(data) is None
+    assert LegacyImageSteg(full_decode(data)).decode_binary() == secret
+
+
+@pytest.mark.parametrize("ext, params", ENCODINGS)
+def test_garbage_length_needs_the_full_decode(carrier, ext, params):
+    image = carrier.copy()
+    length = HEIGHT * ROW_SLOTS // 8
+    bits = np.unpackbits(np.frombuffer(length.to_bytes(8, "big"), dtype=np.uint8))
+    image.reshape(-1)[:64] = (image.reshape(-1)[:64] & 0xFE) | bits
+
+    assert read_payload_rows(encoded(image, ext, params)) is None
+
+
+def test_other_formats_need_the_full_decode(carrier):
+    assert read_rows(encoded(carrier, ".tiff", []), 2) is None
+    assert read_payload_rows(encoded(carrier, ".jpg", [])) is None
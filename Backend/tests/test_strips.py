@@ -0,0 +1,108 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from Core import Strips
+from Core.Output import resolve_output_options
+from Core.Steg import MultiPlaneBackend, SteganographyException
+from Core.WorkerPool import JobError
+from Routes import HandleImage, HandleText
+
+from legacy import LegacyImageSteg, LegacyTextSteg
+
+WIDTH, HEIGHT = 13, 11
+SLOTS = WIDTH * HEIGHT * 3
+CAPACITY = MultiPlaneBackend.capacity(WIDTH, HEIGHT, 3)
+
+
+@pytest.fixture(autouse=True)
+def small_strips(monkeypatch):
+    # Every carrier takes the strip path, a few rows at a time
+    monkeypatch.setattr(Strips, "STRIP_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(Strips, "STRIP_ROWS", 4)
+
+
+@pytest.fixture
+def carrier(rng):
+    return rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+
+def encoded(image, ext=".png"):
+    return cv2.imencode(ext, image)[1].tobytes()
+
+
+def decoded(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def strip_encode(carrier_bytes, data, output_format):
+    path = HandleText.strip_encode_job(carrier_bytes, data, resolve_output_options(output_format))
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def sizes():
+    return [0, 1, SLOTS // 8 - 8, SLOTS // 8, CAPACITY // 2, CAPACITY]
+
+
+@pytest.mark.parametrize("carrier_ext", [".png", ".bmp"])
+@pytest.mark.parametrize("output_format", ["png", "bmp"])
+def test_strip_encode_writes_the_legacy_image(rng, carrier, carrier_ext, output_format):
+    carrier_bytes = encoded(carrier, carrier_ext)
+    for size in sizes():
+        data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        result = decoded(strip_encode(carrier_bytes, data, output_format))
+        assert np.array_equal(result, LegacyTextSteg(carrier.copy()).encode_binary(data)), size
+        assert LegacyTextSteg(result).decode_binary() == data
+
+
+@pytest.mark.parametrize("ext", [".png", ".bmp"])
+def test_strip_decode_reads_legacy_images(rng, carrier, ext):
+    for size in sizes():
+        data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+        image = LegacyTextSteg(carrier.copy()).encode_binary(data)
+        assert HandleText.extract_job(encoded(image, ext)) == data, size
+
+
+def test_strip_extract_reads_the_image_route_layout(rng, carrier):
+    data = rng.integers(0, 256, SLOTS // 8 - 8, dtype=np.uint8).tobytes()
+    image = encoded(LegacyImageSteg(carrier.copy()).encode_binary(data))
+    assert HandleImage.strip_extract(image, WIDTH, HEIGHT) == data
+
+
+def test_read_stream_matches_the_bit_planes(carrier):
+    image = encoded(carrier)
+    flat = carrier.reshape(-1)
+    positions = np.arange(8 * SLOTS)
+    stream = (flat[positions % SLOTS] >> (positions // SLOTS)) & 1
+
+    for start, count in [(0, 64), (5, 1), (0, SLOTS), (SLOTS - 3, 10), (2 * SLOTS + 7, SLOTS), (0, 8 * SLOTS)]:
+        assert np.array_equal(Strips.read_stream(image, start, count), stream[start:start + count]), (start, count)
+
+
+def test_strip_encode_capacity_boundary(carrier):
+    carrier_bytes = encoded(carrier)
+    strip_encode(carrier_bytes, bytes(CAPACITY), "png")
+    with pytest.raises(JobError) as e:
+        HandleText.strip_encode_job(carrier_bytes, bytes(CAPACITY + 1), resolve_output_options("png"))
+    assert e.value.status_code == 400
+
+
+def test_strip_decode_fails_like_the_full_decode(rng):
+    for length in range(SLOTS - 12, SLOTS - 4):
+        image = rng.integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+        bits = np.unpackbits(np.frombuffer(length.to_bytes(8, "big"), dtype=np.uint8))
+        image.reshape(-1)[:64] = (image.reshape(-1)[:64] & 0xFE) | bits
+
+        try:
+            expected = MultiPlaneBackend(image.copy()).decode_binary()
+        except SteganographyException:
+            with pytest.raises(SteganographyException):
+                HandleText.extract_job(encoded(image))
+        else:
+            assert HandleText.extract_job(encoded(image)) == expected
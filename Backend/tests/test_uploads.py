@@ -0,0 +1,60 @@
+import mmap
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from Core import Uploads
+
+from legacy import LegacyTextSteg
+
+
+@pytest.fixture
+def mappings(monkeypatch):
+    made = []
+
+    def recording(*args, **kwargs):
+        mapping = mmap.mmap(*args, **kwargs)
+        made.append(mapping)
+        return mapping
+
+    monkeypatch.setattr(Uploads, "mmap", SimpleNamespace(mmap=recording, ACCESS_READ=mmap.ACCESS_READ))
+    return made
+
+
+def test_spooled_uploads_are_mapped_and_closed(mappings, rng):
+    # Over the multipart parser's 1 MB spool: on disk, so mapped
+    carrier = rng.integers(0, 256, (700, 700, 3), dtype=np.uint8)
+    carrier_png = cv2.imencode(".png", carrier)[1].tobytes()
+    assert len(carrier_png) > 1024 * 1024
+
+    from main import app
+    with TestClient(app) as client:
+        response = client.post("/text/encode", files={
+            "carrier_image": ("c.png", carrier_png),
+            "secret_file": ("s.txt", b"hello"),
+        })
+        assert response.status_code == 200
+        small = client.post("/text/decode", files={"steg_image": ("x.png", response.content)})
+        assert small.status_code == 200
+
+    image = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+    assert LegacyTextSteg(image).decode_binary() == b"hello"
+    assert small.content == b"hello"
+    # The carrier, and the encoded image posted back; both closed
+    assert len(mappings) == 2
+    assert all(mapping.closed for mapping in mappings)
+
+
+def test_in_memory_parts_are_copied(mappings):
+    from main import app
+    with TestClient(app) as client:
+        carrier = cv2.imencode(".png", np.zeros((20, 20, 3), np.uint8))[1].tobytes()
+        response = client.post("/text/encode", files={
+            "carrier_image": ("c.png", carrier),
+            "secret_file": ("s.txt", b"hi"),
+        })
+    assert response.status_code == 200
+    assert mappings == []